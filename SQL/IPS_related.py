@@ -0,0 +1,75 @@
+import logging
+from datetime import datetime
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+from typing import TypedDict
+
+class IPAllocation(TypedDict):
+    ip: str
+    vm_id: str
+    mac: str
+    created_at: str
+
+def reserve_ip(vm_id: str, mac: str, candidates: list[str], exclude: set[str]) -> str:
+    """
+    Allocate the first free address of `candidates` to a VM.
+
+    Runs in one write transaction, so concurrent creates never get the same
+    address. A VM that already holds an address gets it back.
+
+    Args:
+        vm_id: VM the address is for
+        mac: The VM's MAC address
+        candidates: Addresses in allocation order
+        exclude: Addresses that must not be handed out (e.g. leased to other MACs)
+
+    Raises:
+        RuntimeError: If every candidate is taken
+    """
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        row = conn.execute(
+            "SELECT ip FROM ip_allocations WHERE vm_id = ?", (vm_id,)
+        ).fetchone()
+        if row:
+            conn.rollback()
+            return row[0]
+        
+        taken = {r[0] for r in conn.execute("SELECT ip FROM ip_allocations")}
+        for ip in candidates:
+            if ip in taken or ip in exclude:
+                continue
+            conn.execute(
+                """INSERT INTO ip_allocations (ip, vm_id, mac, created_at)
+                   VALUES (?, ?, ?, ?)""",
+                (ip, vm_id, mac, datetime.utcnow().isoformat())
+            )
+            conn.commit()
+            logger.info(f"Reserved {ip} for VM {vm_id} ({mac})")
+            return ip
+        
+        conn.rollback()
+        raise RuntimeError("No free IP addresses left in the VM network")
+
+def release_ip(vm_id: str) -> IPAllocation | None:
+    """Free a VM's address; returns the released allocation, if any."""
+    with get_conn() as conn:
+        row = conn.execute(
+            "DELETE FROM ip_allocations WHERE vm_id = ? RETURNING *", (vm_id,)
+        ).fetchone()
+        conn.commit()
+        return dict(row) if row else None
+
+def get_ip_allocation(vm_id: str) -> IPAllocation | None:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM ip_allocations WHERE vm_id = ?", (vm_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+def list_ip_allocations() -> list[IPAllocation]:
+    with get_conn() as conn:
+        rows = conn.execute("SELECT * FROM ip_allocations ORDER BY created_at").fetchall()
+        return [dict(row) for row in rows]
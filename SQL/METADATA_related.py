@@ -0,0 +1,40 @@
+import logging
+from datetime import datetime
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+from typing import TypedDict
+
+class InstanceMetadata(TypedDict):
+    vm_id: str
+    user_data: str
+    meta_data: str
+    created_at: str
+
+def set_instance_metadata(vm_id: str, user_data: str, meta_data: str) -> None:
+    """Store (or replace) the cloud-init documents served to a VM in nocloud-net mode."""
+    with get_conn() as conn:
+        conn.execute(
+            """INSERT OR REPLACE INTO instance_metadata (vm_id, user_data, meta_data, created_at)
+               VALUES (?, ?, ?, ?)""",
+            (vm_id, user_data, meta_data, datetime.utcnow().isoformat())
+        )
+        conn.commit()
+
+def get_instance_metadata(vm_id: str) -> InstanceMetadata | None:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM instance_metadata WHERE vm_id = ?", (vm_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+def delete_instance_metadata(vm_id: str) -> bool:
+    with get_conn() as conn:
+        cursor = conn.execute("DELETE FROM instance_metadata WHERE vm_id = ?", (vm_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+def list_instance_metadata_ids() -> list[str]:
+    with get_conn() as conn:
+        return [row[0] for row in conn.execute("SELECT vm_id FROM instance_metadata")]
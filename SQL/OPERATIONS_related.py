@@ -0,0 +1,128 @@
+import json
+import logging
+from datetime import datetime
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+from typing import TypedDict, NotRequired
+
+class OperationRecord(TypedDict):
+    id: str
+    vm_id: str
+    owner_id: str
+    kind: str
+    status: str
+    stage: NotRequired[str | None]
+    error: NotRequired[str | None]
+    result: NotRequired[dict | None]
+    timings: NotRequired[dict | None]
+    created_at: str
+    updated_at: str
+
+# Lifecycle of an operation: pending -> running -> succeeded | failed
+OPERATION_STATUSES = ("pending", "running", "succeeded", "failed")
+
+def _row_to_operation(row) -> OperationRecord:
+    op = dict(row)
+    op["result"] = json.loads(op["result"]) if op["result"] else None
+    op["timings"] = json.loads(op["timings"]) if op["timings"] else None
+    return op
+
+def _operation_params(op: OperationRecord) -> dict:
+    return {
+        "stage": None,
+        "error": None,
+        **op,
+        "result": json.dumps(op["result"]) if op.get("result") else None,
+        "timings": json.dumps(op["timings"]) if op.get("timings") else None,
+    }
+
+_INSERT_OPERATION = """INSERT INTO operations (id, vm_id, owner_id, kind, status, stage,
+                                          error, result, timings, created_at, updated_at)
+                       VALUES (:id, :vm_id, :owner_id, :kind, :status, :stage,
+                               :error, :result, :timings, :created_at, :updated_at)"""
+
+def add_operation(op: OperationRecord) -> None:
+    with get_conn() as conn:
+        conn.execute(_INSERT_OPERATION, _operation_params(op))
+        conn.commit()
+        logger.info(f"Operation {op['id']} ({op['kind']}) queued for VM {op['vm_id']}")
+
+def add_operations(ops: list[OperationRecord]) -> None:
+    """Insert several operations in a single transaction."""
+    with get_conn() as conn:
+        conn.executemany(_INSERT_OPERATION, [_operation_params(op) for op in ops])
+        conn.commit()
+        logger.info(f"{len(ops)} operations queued")
+
+def get_operation(op_id: str, owner_id: str) -> OperationRecord | None:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM operations WHERE id = ? AND owner_id = ?",
+            (op_id, owner_id)
+        ).fetchone()
+        return _row_to_operation(row) if row else None
+
+def get_latest_operation_for_vm(vm_id: str) -> OperationRecord | None:
+    with get_conn() as conn:
+        row = conn.execute(
+            """SELECT * FROM operations WHERE vm_id = ?
+               ORDER BY created_at DESC, rowid DESC LIMIT 1""",
+            (vm_id,)
+        ).fetchone()
+        return _row_to_operation(row) if row else None
+
+def update_operation(
+    op_id: str,
+    status: str | None = None,
+    stage: str | None = None,
+    error: str | None = None,
+    result: dict | None = None,
+    timings: dict | None = None
+) -> bool:
+    """Update the given fields of an operation; fields left as None are unchanged."""
+    fields = {"updated_at": datetime.utcnow().isoformat()}
+    if status is not None:
+        fields["status"] = status
+    if stage is not None:
+        fields["stage"] = stage
+    if error is not None:
+        fields["error"] = error
+    if result is not None:
+        fields["result"] = json.dumps(result)
+    if timings is not None:
+        fields["timings"] = json.dumps(timings)
+
+    assignments = ", ".join(f"{name} = :{name}" for name in fields)
+    with get_conn() as conn:
+        cursor = conn.execute(
+            f"UPDATE operations SET {assignments} WHERE id = :id",
+            {**fields, "id": op_id}
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+def fail_vm_operations(failures: list[tuple[str, str]]) -> int:
+    """
+    Mark the unfinished operations of VMs in status 'error' as failed.
+
+    For operations no pipeline will finish any more (e.g. after a
+    restart), so clients polling them see the outcome.
+
+    Args:
+        failures: (vm_id, error message) pairs
+
+    Returns:
+        Number of operations marked failed
+    """
+    now = datetime.utcnow().isoformat()
+    with get_conn() as conn:
+        cursor = conn.executemany(
+            """UPDATE operations SET status = 'failed', error = ?, updated_at = ?
+               WHERE vm_id = ? AND status IN ('pending', 'running')
+               AND EXISTS (SELECT 1 FROM vms WHERE vms.id = operations.vm_id AND vms.status = 'error')""",
+            [(error, now, vm_id) for vm_id, error in failures]
+        )
+        conn.commit()
+        return cursor.rowcount
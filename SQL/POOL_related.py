@@ -0,0 +1,75 @@
+import logging
+from datetime import datetime
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+from typing import TypedDict
+
+class PoolVMRecord(TypedDict):
+    vm_id: str
+    image_type: str
+    status: str  # 'booting' until the guest is reachable, then 'ready'
+    ip: str | None
+    created_at: str
+
+def add_pool_vm(vm_id: str, image_type: str) -> None:
+    with get_conn() as conn:
+        conn.execute(
+            """INSERT INTO warm_pool (vm_id, image_type, status, ip, created_at)
+               VALUES (?, ?, 'booting', NULL, ?)""",
+            (vm_id, image_type, datetime.utcnow().isoformat())
+        )
+        conn.commit()
+
+def mark_pool_vm_ready(vm_id: str, ip: str) -> bool:
+    with get_conn() as conn:
+        cursor = conn.execute(
+            "UPDATE warm_pool SET status = 'ready', ip = ? WHERE vm_id = ?",
+            (ip, vm_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+def claim_pool_vm(image_type: str) -> PoolVMRecord | None:
+    """Atomically take the oldest ready VM of an image out of the pool."""
+    with get_conn() as conn:
+        row = conn.execute(
+            """DELETE FROM warm_pool WHERE vm_id = (
+                   SELECT vm_id FROM warm_pool
+                   WHERE image_type = ? AND status = 'ready'
+                   ORDER BY created_at LIMIT 1
+               ) RETURNING *""",
+            (image_type,)
+        ).fetchone()
+        conn.commit()
+        return dict(row) if row else None
+
+def remove_pool_vm(vm_id: str) -> bool:
+    with get_conn() as conn:
+        cursor = conn.execute("DELETE FROM warm_pool WHERE vm_id = ?", (vm_id,))
+        conn.commit()
+        return cursor.rowcount > 0
+
+def list_pool_vms(status: str | None = None) -> list[PoolVMRecord]:
+    with get_conn() as conn:
+        if status is None:
+            rows = conn.execute("SELECT * FROM warm_pool ORDER BY created_at").fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT * FROM warm_pool WHERE status = ? ORDER BY created_at",
+                (status,)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+def count_pool_vms() -> dict[str, dict[str, int]]:
+    """Pool VMs per image type and status, e.g. {'alpine': {'ready': 2}}."""
+    with get_conn() as conn:
+        rows = conn.execute(
+            """SELECT image_type, status, COUNT(*) FROM warm_pool
+               GROUP BY image_type, status"""
+        ).fetchall()
+    counts: dict[str, dict[str, int]] = {}
+    for image_type, status, n in rows:
+        counts.setdefault(image_type, {})[status] = n
+    return counts
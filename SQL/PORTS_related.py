@@ -0,0 +1,59 @@
+import logging
+from datetime import datetime
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+# Host ports for SSH forwards. `free_ports` is the free list (seeded with
+# START_PORT..END_PORT by init_db); taking its lowest entry is an index
+# lookup however large the range. A taken port sits in `port_reservations`
+# until the VM record using it is inserted, when the vms triggers drop the
+# reservation; deleting the record puts the port back on the free list.
+
+def reserve_ports(count: int) -> list[int]:
+    """
+    Take the `count` lowest free ports in one write transaction.
+
+    Concurrent callers never get the same port; the ports stay reserved
+    until a VM record with that host_port is added or release_ports().
+
+    Raises:
+        RuntimeError: If fewer than `count` ports are free (nothing is taken)
+    """
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        ports = [
+            row[0] for row in conn.execute(
+                "SELECT port FROM free_ports ORDER BY port LIMIT ?", (count,)
+            )
+        ]
+        if len(ports) < count:
+            conn.rollback()
+            raise RuntimeError(f"Only {len(ports)} free ports left, {count} needed")
+
+        now = datetime.utcnow().isoformat()
+        conn.executemany("DELETE FROM free_ports WHERE port = ?", [(p,) for p in ports])
+        conn.executemany(
+            "INSERT INTO port_reservations (port, reserved_at) VALUES (?, ?)",
+            [(p, now) for p in ports]
+        )
+        conn.commit()
+        return ports
+
+def release_ports(ports: list[int]) -> None:
+    """Return reserved ports that never got a VM record to the free list."""
+    with get_conn() as conn:
+        conn.executemany(
+            "DELETE FROM port_reservations WHERE port = ?", [(p,) for p in ports]
+        )
+        conn.executemany(
+            """INSERT OR IGNORE INTO free_ports (port)
+               SELECT ? WHERE NOT EXISTS (SELECT 1 FROM vms WHERE host_port = ?)""",
+            [(p, p) for p in ports]
+        )
+        conn.commit()
+        logger.info(f"Released ports {ports}")
+
+def count_free_ports() -> int:
+    with get_conn() as conn:
+        return conn.execute("SELECT COUNT(*) FROM free_ports").fetchone()[0]
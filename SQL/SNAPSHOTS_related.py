@@ -0,0 +1,78 @@
+import sqlite3
+import logging
+from SQL.database import get_conn
+
+logger = logging.getLogger(__name__)
+
+from typing import TypedDict
+
+class SnapshotRecord(TypedDict):
+    id: str
+    vm_id: str
+    owner_id: str
+    name: str
+    disk_path: str
+    quiesced: bool
+    created_at: str
+
+def _row_to_snapshot(row) -> SnapshotRecord:
+    snapshot = dict(row)
+    snapshot["quiesced"] = bool(snapshot["quiesced"])
+    return snapshot
+
+def add_snapshot(snapshot: SnapshotRecord) -> None:
+    """
+    Store a snapshot.
+
+    Raises:
+        ValueError: If the VM already has a snapshot with this name
+    """
+    with get_conn() as conn:
+        try:
+            conn.execute(
+                """INSERT INTO snapshots (id, vm_id, owner_id, name, disk_path, quiesced, created_at)
+                   VALUES (:id, :vm_id, :owner_id, :name, :disk_path, :quiesced, :created_at)""",
+                snapshot
+            )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Snapshot {snapshot['name']} already exists")
+        conn.commit()
+        logger.info(f"Snapshot {snapshot['name']} added for VM {snapshot['vm_id']}")
+
+def get_snapshot(snapshot_id: str, vm_id: str) -> SnapshotRecord | None:
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT * FROM snapshots WHERE id = ? AND vm_id = ?", (snapshot_id, vm_id)
+        ).fetchone()
+        return _row_to_snapshot(row) if row else None
+
+def list_snapshots(vm_id: str) -> list[SnapshotRecord]:
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT * FROM snapshots WHERE vm_id = ? ORDER BY created_at", (vm_id,)
+        ).fetchall()
+        return [_row_to_snapshot(row) for row in rows]
+
+def is_snapshot_disk(disk_path: str) -> bool:
+    """Whether an image is the frozen disk of some snapshot (and must be kept)."""
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT 1 FROM snapshots WHERE disk_path = ? LIMIT 1", (disk_path,)
+        ).fetchone()
+        return row is not None
+
+def count_clones(vm_id: str) -> int:
+    """Number of VMs whose disk is a linked clone of one of this VM's snapshots."""
+    with get_conn() as conn:
+        return conn.execute(
+            """SELECT COUNT(*) FROM vms
+               JOIN snapshots ON vms.source_snapshot_id = snapshots.id
+               WHERE snapshots.vm_id = ?""",
+            (vm_id,)
+        ).fetchone()[0]
+
+def delete_snapshots(vm_id: str) -> int:
+    with get_conn() as conn:
+        cursor = conn.execute("DELETE FROM snapshots WHERE vm_id = ?", (vm_id,))
+        conn.commit()
+        return cursor.rowcount
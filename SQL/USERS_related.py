@@ -51,6 +51,25 @@ def get_user_by_api_key(plaintext_api_key: str) -> dict | None:
         ).fetchone()
         return dict(row) if row else None
 
+def get_user_by_name(name: str) -> dict | None:
+    """Lookup user by name, with the password hash (for login)."""
+    with get_conn() as conn:
+        row = conn.execute(
+            "SELECT id, name, hashed_password, api_key_hash FROM users WHERE name = ?",
+            (name,)
+        ).fetchone()
+        return dict(row) if row else None
+
+def update_api_key(user_id: str, plaintext_api_key: str) -> bool:
+    """Replace a user's API key (only its hash is stored)."""
+    with get_conn() as conn:
+        cursor = conn.execute(
+            "UPDATE users SET api_key_hash = ? WHERE id = ?",
+            (hash_api_key(plaintext_api_key), user_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
 def get_user_by_api_key_hash(plaintext_api_key: str) -> dict | None:
     """Lookup user by plaintext API key (hashed for comparison)."""
     api_key_hash = hash_api_key(plaintext_api_key)
@@ -1,3 +1,5 @@
+import json
+import base64
 import sqlite3
 import logging
 from SQL.database import get_conn
@@ -16,19 +18,52 @@ class VMRecord(TypedDict):
     disk_path: str
     iso_path: str
     created_at: str
+    image_type: NotRequired[str]
+    memory_mb: NotRequired[int]
+    vcpus: NotRequired[int]
+    disk_iops: NotRequired[int]
+    disk_bytes_per_sec: NotRequired[int]
+    source_snapshot_id: NotRequired[str]
+
+# Values used for the optional VMRecord columns when a caller omits them
+_VM_DEFAULTS = {
+    "ip": None, "image_type": None, "memory_mb": None, "vcpus": None,
+    "disk_iops": None, "disk_bytes_per_sec": None, "source_snapshot_id": None
+}
 
 def add_vm_record(vm: VMRecord) -> None:
     with get_conn() as conn:
         conn.execute(
             """INSERT INTO vms (id, name, owner_id, status, host_port, 
-                              disk_path, iso_path, created_at, ip)
+                              disk_path, iso_path, created_at, ip,
+                              image_type, memory_mb, vcpus,
+                              disk_iops, disk_bytes_per_sec, source_snapshot_id)
                VALUES (:id, :name, :owner_id, :status, :host_port,
-                       :disk_path, :iso_path, :created_at, :ip)""",
-            vm
+                       :disk_path, :iso_path, :created_at, :ip,
+                       :image_type, :memory_mb, :vcpus,
+                       :disk_iops, :disk_bytes_per_sec, :source_snapshot_id)""",
+            {**_VM_DEFAULTS, **vm}
         )
         conn.commit()
         logger.info(f"VM {vm['name']} added for owner {vm['owner_id']}")
 
+def add_vm_records(vms: list[VMRecord]) -> None:
+    """Insert several VM records in a single transaction (all or nothing)."""
+    with get_conn() as conn:
+        conn.executemany(
+            """INSERT INTO vms (id, name, owner_id, status, host_port, 
+                              disk_path, iso_path, created_at, ip,
+                              image_type, memory_mb, vcpus,
+                              disk_iops, disk_bytes_per_sec, source_snapshot_id)
+               VALUES (:id, :name, :owner_id, :status, :host_port,
+                       :disk_path, :iso_path, :created_at, :ip,
+                       :image_type, :memory_mb, :vcpus,
+                       :disk_iops, :disk_bytes_per_sec, :source_snapshot_id)""",
+            [{**_VM_DEFAULTS, **vm} for vm in vms]
+        )
+        conn.commit()
+        logger.info(f"{len(vms)} VMs added")
+
 def get_vm_by_id(vm_id: str, owner_id: str) -> VMRecord | None:
     with get_conn() as conn:
         row = conn.execute(
@@ -100,3 +135,165 @@ def get_vm_by_id_for_update(vm_id: str, owner_id: str) -> VMRecord | None:
         ).fetchone()
         return dict(row) if row else None
 
+def update_vm_disk_limits(vm_id: str, owner_id: str, disk_iops: int, disk_bytes_per_sec: int) -> bool:
+    with get_conn() as conn:
+        cursor = conn.execute(
+            """UPDATE vms SET disk_iops = ?, disk_bytes_per_sec = ?
+               WHERE id = ? AND owner_id = ?""",
+            (disk_iops, disk_bytes_per_sec, vm_id, owner_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+def update_vm_disk_path(vm_id: str, disk_path: str) -> bool:
+    """Record the image a VM's disk now points at (after a snapshot or revert)."""
+    with get_conn() as conn:
+        cursor = conn.execute(
+            "UPDATE vms SET disk_path = ? WHERE id = ?", (disk_path, vm_id)
+        )
+        conn.commit()
+        return cursor.rowcount > 0
+
+def _encode_cursor(vm: VMRecord) -> str:
+    key = json.dumps([vm["created_at"], vm["id"]]).encode()
+    return base64.urlsafe_b64encode(key).decode().rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple[str, str]:
+    try:
+        created_at, vm_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError) as e:
+        raise ValueError("Invalid cursor") from e
+    if not (isinstance(created_at, str) and isinstance(vm_id, str)):
+        raise ValueError("Invalid cursor")
+    return created_at, vm_id
+
+def list_vms_page(owner_id: str, limit: int, cursor: str | None = None) -> tuple[list[VMRecord], str | None]:
+    """
+    One page of an owner's VMs, newest first.
+
+    Keyset pagination on (created_at, id): each page is a range scan of
+    the vms_owner_created index starting after the previous page's last
+    VM, so deep pages cost the same as the first and VMs created or
+    deleted meanwhile don't shift later pages.
+
+    Args:
+        owner_id: Owner whose VMs to list
+        limit: Page size
+        cursor: next_cursor of the previous page (None: first page)
+
+    Returns:
+        (VMs, cursor of the next page or None on the last page)
+
+    Raises:
+        ValueError: If the cursor wasn't issued by this function
+    """
+    query = "SELECT * FROM vms WHERE owner_id = ?"
+    params: list = [owner_id]
+    if cursor is not None:
+        query += " AND (created_at, id) < (?, ?)"
+        params.extend(_decode_cursor(cursor))
+    query += " ORDER BY created_at DESC, id DESC LIMIT ?"
+    params.append(limit + 1)
+
+    with get_conn() as conn:
+        vms = [dict(row) for row in conn.execute(query, params)]
+    if len(vms) > limit:
+        return vms[:limit], _encode_cursor(vms[limit - 1])
+    return vms, None
+
+def list_vm_states() -> list[dict]:
+    """id, owner_id, status, host_port and ip of every VM (for the reconciler)."""
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT id, owner_id, status, host_port, ip FROM vms"
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+def mark_vms_error(vm_ids: list[str], from_statuses: tuple[str, ...]) -> int:
+    """Set status 'error' on the VMs still in one of `from_statuses`, in one transaction."""
+    placeholders = ", ".join("?" for _ in from_statuses)
+    with get_conn() as conn:
+        cursor = conn.executemany(
+            f"UPDATE vms SET status = 'error' WHERE id = ? AND status IN ({placeholders})",
+            [(vm_id, *from_statuses) for vm_id in vm_ids]
+        )
+        conn.commit()
+        return cursor.rowcount
+
+def mark_vms_deleting(
+    owner_id: str,
+    vm_ids: list[str] | None = None,
+    name_prefix: str | None = None
+) -> tuple[list[VMRecord], list[dict]]:
+    """
+    Claim an owner's VMs for teardown by setting status 'deleting'.
+
+    Selects the VMs matching every given filter and, in one write
+    transaction, flips the ones that can go. VMs still provisioning,
+    already being deleted, or with linked clones of their snapshots are
+    left as they are.
+
+    Returns:
+        (claimed VM records, as they were before the change;
+         skipped VMs as {"id", "name", "reason"})
+    """
+    conditions = ["owner_id = ?"]
+    params: list = [owner_id]
+    if vm_ids is not None:
+        conditions.append(f"id IN ({', '.join('?' for _ in vm_ids)})")
+        params.extend(vm_ids)
+    if name_prefix is not None:
+        conditions.append("substr(name, 1, ?) = ?")
+        params.extend([len(name_prefix), name_prefix])
+
+    with get_conn() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute(
+            f"""SELECT vms.*, EXISTS (
+                    SELECT 1 FROM vms AS clones
+                    JOIN snapshots ON clones.source_snapshot_id = snapshots.id
+                    WHERE snapshots.vm_id = vms.id
+                ) AS has_clones
+                FROM vms WHERE {' AND '.join(conditions)}
+                ORDER BY created_at""",
+            params
+        ).fetchall()
+
+        claimed, skipped = [], []
+        for row in rows:
+            vm = dict(row)
+            has_clones = vm.pop("has_clones")
+            reason = (
+                "still being provisioned" if vm["status"] == "provisioning"
+                else "already being deleted" if vm["status"] == "deleting"
+                else "has linked clones; delete them first" if has_clones
+                else None
+            )
+            if reason:
+                skipped.append({"id": vm["id"], "name": vm["name"], "reason": reason})
+            else:
+                claimed.append(vm)
+
+        conn.executemany(
+            "UPDATE vms SET status = 'deleting' WHERE id = ?",
+            [(vm["id"],) for vm in claimed]
+        )
+        conn.commit()
+        logger.info(f"{len(claimed)} VMs of {owner_id} marked for deletion")
+        return claimed, skipped
+
+def list_vms_by_status(status: str) -> list[VMRecord]:
+    with get_conn() as conn:
+        rows = conn.execute(
+            "SELECT * FROM vms WHERE status = ? ORDER BY created_at", (status,)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+def list_port_forwards() -> dict[int, str]:
+    """host_port -> VM IP for every running VM (the SSH forwards that should exist)."""
+    with get_conn() as conn:
+        rows = conn.execute(
+            """SELECT host_port, ip FROM vms
+               WHERE status = 'running' AND ip IS NOT NULL AND host_port IS NOT NULL"""
+        ).fetchall()
+        return {row["host_port"]: row["ip"] for row in rows}
@@ -1,14 +1,47 @@
 import sqlite3
-from contextlib import contextmanager
+import threading
+import weakref
+from contextlib import closing, contextmanager
+from datetime import datetime, timedelta
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from config import START_PORT, END_PORT
 
 load_dotenv()
 DB_PATH = os.getenv("DB_PATH") or str(Path("/var/lib/vm-provisioner/vms.db"))
 
+# Connection tuning. In WAL mode readers don't block the writer (nor it
+# them); synchronous=NORMAL only syncs at checkpoints, so a power cut can
+# lose the last commits but never corrupts the database.
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))  # wait this long for the write lock
+DB_CACHE_SIZE_KB = int(os.getenv("DB_CACHE_SIZE_KB", "8192"))  # page cache per connection
+DB_STATEMENT_CACHE = 256  # prepared statements kept per connection
+
+# Port reservations older than this never got their VM record (the process
+# died in between); init_db returns them to the free list
+STALE_PORT_RESERVATION = timedelta(minutes=5)
+
+# Columns added after the first release; older databases get them on startup.
+VMS_EXTRA_COLUMNS = {
+    "image_type": "TEXT",
+    "memory_mb": "INTEGER",
+    "vcpus": "INTEGER",
+    "disk_iops": "INTEGER",
+    "disk_bytes_per_sec": "INTEGER",
+    "source_snapshot_id": "TEXT",
+}
+OPERATIONS_EXTRA_COLUMNS = {
+    "timings": "TEXT",
+}
+
 def init_db():
-    with sqlite3.connect(DB_PATH) as conn:
+    # Connections opened before (e.g. to a database deleted since) are stale
+    close_connections()
+
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        conn.execute("PRAGMA journal_mode = WAL")
         conn.executescript("""
             CREATE TABLE IF NOT EXISTS users (
                 id TEXT PRIMARY KEY,
@@ -26,16 +59,231 @@ def init_db():
                 disk_path TEXT NOT NULL,
                 iso_path TEXT NOT NULL,
                 created_at TEXT NOT NULL,
+                image_type TEXT,
+                memory_mb INTEGER,
+                vcpus INTEGER,
+                disk_iops INTEGER,
+                disk_bytes_per_sec INTEGER,
+                source_snapshot_id TEXT,
                 FOREIGN KEY (owner_id) REFERENCES users(id) ON DELETE CASCADE
             );
+            CREATE TABLE IF NOT EXISTS operations (
+                id TEXT PRIMARY KEY,
+                vm_id TEXT NOT NULL,
+                owner_id TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                stage TEXT,
+                error TEXT,
+                result TEXT,
+                timings TEXT,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS ip_allocations (
+                ip TEXT PRIMARY KEY,
+                vm_id TEXT UNIQUE NOT NULL,
+                mac TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS instance_metadata (
+                vm_id TEXT PRIMARY KEY,
+                user_data TEXT NOT NULL,
+                meta_data TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS snapshots (
+                id TEXT PRIMARY KEY,
+                vm_id TEXT NOT NULL,
+                owner_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                disk_path TEXT NOT NULL,
+                quiesced INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                UNIQUE (vm_id, name)
+            );
+            CREATE TABLE IF NOT EXISTS free_ports (
+                port INTEGER PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS port_reservations (
+                port INTEGER PRIMARY KEY,
+                reserved_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS warm_pool (
+                vm_id TEXT PRIMARY KEY,
+                image_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                ip TEXT,
+                created_at TEXT NOT NULL
+            );
+        """)
+        add_missing_columns(conn, "vms", VMS_EXTRA_COLUMNS)
+        add_missing_columns(conn, "operations", OPERATIONS_EXTRA_COLUMNS)
+        # After the migrations: some indexed columns are newer than the tables
+        conn.executescript("""
+            CREATE INDEX IF NOT EXISTS vms_owner_created ON vms (owner_id, created_at DESC, id DESC);
+            CREATE INDEX IF NOT EXISTS vms_status ON vms (status);
+            CREATE INDEX IF NOT EXISTS vms_source_snapshot ON vms (source_snapshot_id);
+            CREATE INDEX IF NOT EXISTS operations_vm_created ON operations (vm_id, created_at);
+            CREATE INDEX IF NOT EXISTS snapshots_disk_path ON snapshots (disk_path);
+            CREATE INDEX IF NOT EXISTS users_name ON users (name);
+            CREATE INDEX IF NOT EXISTS warm_pool_image_status ON warm_pool (image_type, status, created_at);
         """)
+        seed_free_ports(conn, START_PORT, END_PORT)
         conn.commit()
 
+def seed_free_ports(conn: sqlite3.Connection, start: int, end: int) -> None:
+    """
+    Rebuild the port free list for the range start..end and (re)create the
+    triggers that keep it in step with the vms table.
+
+    Ports used by a VM record or freshly reserved stay off the list; ports
+    outside the range (after it was changed) are dropped from it.
+    """
+    cutoff = (datetime.utcnow() - STALE_PORT_RESERVATION).isoformat()
+    conn.execute("DELETE FROM port_reservations WHERE reserved_at < ?", (cutoff,))
+    conn.execute("DELETE FROM free_ports WHERE port NOT BETWEEN ? AND ?", (start, end))
+    conn.execute(
+        """WITH RECURSIVE port_range(port) AS (
+               SELECT ? UNION ALL SELECT port + 1 FROM port_range WHERE port < ?
+           )
+           INSERT OR IGNORE INTO free_ports (port)
+           SELECT port FROM port_range
+           WHERE port NOT IN (SELECT host_port FROM vms)
+             AND port NOT IN (SELECT port FROM port_reservations)""",
+        (start, end)
+    )
+    conn.executescript(f"""
+        DROP TRIGGER IF EXISTS vms_port_taken;
+        CREATE TRIGGER vms_port_taken AFTER INSERT ON vms BEGIN
+            DELETE FROM free_ports WHERE port = NEW.host_port;
+            DELETE FROM port_reservations WHERE port = NEW.host_port;
+        END;
+        DROP TRIGGER IF EXISTS vms_port_freed;
+        CREATE TRIGGER vms_port_freed AFTER DELETE ON vms
+        WHEN OLD.host_port BETWEEN {int(start)} AND {int(end)} BEGIN
+            INSERT OR IGNORE INTO free_ports (port) VALUES (OLD.host_port);
+        END;
+    """)
+
+def add_missing_columns(conn: sqlite3.Connection, table: str, columns: dict[str, str]) -> None:
+    """ALTER an existing table so it has every column in `columns` (name -> type)."""
+    existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+    for name, col_type in columns.items():
+        if name not in existing:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {col_type}")
+
+class Connection(sqlite3.Connection):
+    """
+    A thread's persistent connection.
+
+    Inside transaction() (`shared`), the BEGIN, commit() and rollback()
+    calls of the SQL functions are no-ops: their statements join the open
+    transaction, which commits or rolls back as a whole.
+    """
+
+    shared = False
+
+    def execute(self, sql, parameters=(), /):
+        if self.shared and sql.lstrip()[:5].upper() == "BEGIN":
+            return self.cursor()
+        return super().execute(sql, parameters)
+
+    def commit(self):
+        if not self.shared:
+            super().commit()
+
+    def rollback(self):
+        if not self.shared:
+            super().rollback()
+
+
+_local = threading.local()
+_connections: weakref.WeakSet = weakref.WeakSet()
+_connections_lock = threading.Lock()
+_generation = 0
+
+
+def _connect() -> Connection:
+    # Only ever used by the thread that opened it; check_same_thread is
+    # off so close_connections() can close it from another thread
+    conn = sqlite3.connect(
+        DB_PATH,
+        timeout=DB_BUSY_TIMEOUT_MS / 1000,
+        factory=Connection,
+        cached_statements=DB_STATEMENT_CACHE,
+        check_same_thread=False
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA synchronous = {DB_SYNCHRONOUS}")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    return conn
+
+
+def _thread_conn() -> Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.generation != _generation:
+        conn = _connect()
+        _local.conn, _local.generation = conn, _generation
+        with _connections_lock:
+            _connections.add(conn)
+    return conn
+
+
+def close_connections() -> None:
+    """
+    Close every thread's connection; each thread reconnects on its next query.
+
+    Only safe while no query runs (startup, tests).
+    """
+    global _generation
+    with _connections_lock:
+        _generation += 1
+        connections = list(_connections)
+        _connections.clear()
+    for conn in connections:
+        conn.close()
+
+
 @contextmanager
 def get_conn():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    """
+    This thread's database connection.
+
+    Opened on the thread's first query and reused after that, so its
+    prepared statements and page cache survive between calls. A
+    transaction the caller left open is rolled back on exit (unless
+    inside transaction()).
+    """
+    conn = _thread_conn()
     try:
         yield conn
     finally:
-        conn.close()
\ No newline at end of file
+        if not conn.shared and conn.in_transaction:
+            conn.rollback()
+
+
+@contextmanager
+def transaction():
+    """
+    Run several SQL functions in one write transaction (on this thread).
+
+    Commits when the block exits normally and rolls everything back when
+    it raises. Nested use joins the outer transaction.
+    """
+    conn = _thread_conn()
+    if conn.shared:
+        yield conn
+        return
+
+    conn.execute("BEGIN IMMEDIATE")
+    conn.shared = True
+    try:
+        yield conn
+    except BaseException:
+        conn.shared = False
+        conn.rollback()
+        raise
+    conn.shared = False
+    conn.commit()
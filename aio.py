@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import HOST_IO_WORKERS
+import libvirt_client
+import storage
+
+logger = logging.getLogger(__name__)
+
+# Async facade over the blocking host APIs used by request handlers.
+# libvirt calls and iptables subprocesses run on this dedicated, bounded
+# executor, so endpoints can be `async def` without blocking the event
+# loop, and a burst of slow host calls can't starve health checks or auth.
+_executor = ThreadPoolExecutor(
+    max_workers=HOST_IO_WORKERS,
+    thread_name_prefix="host-io"
+)
+
+
+async def run(func, *args):
+    """Run a blocking host call on the host I/O executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+# libvirt
+
+async def get_domain_states() -> dict[str, str]:
+    return await run(libvirt_client.get_domain_states)
+
+
+async def set_block_iotune(vm_uuid: str, iops: int, bytes_per_sec: int) -> None:
+    await run(libvirt_client.set_block_iotune, vm_uuid, iops, bytes_per_sec)
+
+
+# Disks
+
+async def get_disk_info(vm_id: str, image_type: str | None, disk_path: str | None = None) -> dict:
+    return await run(storage.get_disk_info, vm_id, image_type, disk_path)
+
+
+async def resize_vm_disk(
+    vm_id: str,
+    image_type: str | None,
+    size_gb: int,
+    disk_path: str | None = None
+) -> bool:
+    """
+    Grow a VM's disk, online when the domain runs.
+
+    Returns:
+        True if resized online, False if the (stopped) image was resized
+
+    Raises:
+        ValueError: If the disk is already larger than `size_gb`
+    """
+    if await run(libvirt_client.resize_block, vm_id, size_gb * 1024 ** 3):
+        return True
+    
+    info = await get_disk_info(vm_id, image_type, disk_path)
+    if size_gb * 1024 ** 3 < info["virtual-size"]:
+        raise ValueError(f"Disk can only grow (currently {info['virtual-size']} bytes)")
+    await run(storage.resize_disk, vm_id, size_gb, image_type, disk_path)
+    return False
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False)
@@ -1,8 +1,15 @@
+import secrets
 from fastapi import Header, HTTPException
+from config import ADMIN_API_KEY
 from SQL.USERS_related import get_user_by_api_key
 
 async def get_current_user(x_api_key: str = Header(..., alias="X-API-Key")):
     user = get_user_by_api_key(x_api_key)
     if not user:
         raise HTTPException(401, "Invalid API key")
-    return user
\ No newline at end of file
+    return user
+
+async def require_admin(x_api_key: str = Header(..., alias="X-API-Key")):
+    """Allow only the operator's ADMIN_API_KEY (endpoints acting on every tenant)."""
+    if not ADMIN_API_KEY or not secrets.compare_digest(x_api_key.encode(), ADMIN_API_KEY.encode()):
+        raise HTTPException(403, "Admin API key required")
@@ -0,0 +1,125 @@
+"""
+Compare libvirt RPCs and wall time for per-VM state lookups vs the bulk API.
+
+The per-VM path is what the list endpoints used to do
+(`lookupByUUIDString` + `dom.state()` for every VM); the bulk path is
+`libvirt_client.get_domain_states()`, one `getAllDomainStats` call.
+
+Defaults to libvirt's in-process test driver, which needs no hypervisor:
+
+    python benchmarks/bench_domain_states.py
+    python benchmarks/bench_domain_states.py --sizes 10 100 1000
+
+Against a remote URI (qemu+ssh://...) every counted call is a round trip.
+Domains are created transient and destroyed at the end.
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import libvirt
+
+import libvirt_client
+from libvirt_client import DOMAIN_STATES
+from libvirt_pool import ConnectionPool
+
+# Answered from the local virDomain object, never sent to the daemon
+LOCAL_METHODS = {"UUIDString", "name", "UUID", "connect", "isAlive"}
+
+TEST_DOMAIN_XML = """<domain type='test'>
+  <name>bench-{index}</name>
+  <uuid>{uuid}</uuid>
+  <memory unit='KiB'>65536</memory>
+  <os><type>hvm</type></os>
+</domain>"""
+
+
+class CountingProxy:
+    """Wrap a libvirt object and count calls that go to the daemon."""
+
+    def __init__(self, target, counter: dict):
+        self._target = target
+        self._counter = counter
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if name not in LOCAL_METHODS:
+                self._counter["rpcs"] += 1
+            return _wrap(attr(*args, **kwargs), self._counter)
+        return call
+
+
+def _wrap(value, counter):
+    if isinstance(value, libvirt.virDomain):
+        return CountingProxy(value, counter)
+    if isinstance(value, list):
+        return [_wrap(item, counter) for item in value]
+    if isinstance(value, tuple):
+        return tuple(_wrap(item, counter) for item in value)
+    return value
+
+
+class CountingPool(ConnectionPool):
+    """Single-connection pool handing out the benchmark's counted connection."""
+
+    def __init__(self, conn):
+        super().__init__(conn.getURI(), 1, keepalive_interval=0)
+        self.counter = {"rpcs": 0}
+        self._idle.append(CountingProxy(conn, self.counter))
+        self._open_count = 1
+
+
+def per_vm_states(vm_ids: list[str]) -> dict[str, str]:
+    """The old N+1 pattern: one lookup and one state() per VM."""
+    states = {}
+    for vm_id in vm_ids:
+        with libvirt_client.connection() as conn:
+            state, _ = conn.lookupByUUIDString(vm_id).state()
+        states[vm_id] = DOMAIN_STATES.get(state, 'unknown')
+    return states
+
+
+def measure(func, *args) -> tuple[int, float, dict]:
+    libvirt_client.pool.counter["rpcs"] = 0
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    return libvirt_client.pool.counter["rpcs"], elapsed, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--uri", default="test:///default")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 100, 500])
+    args = parser.parse_args()
+
+    raw_conn = libvirt.open(args.uri)
+    libvirt_client.pool = CountingPool(raw_conn)
+    domains = []
+
+    print(f"{'fleet':>6} {'per-VM RPCs':>12} {'per-VM ms':>10} {'bulk RPCs':>10} {'bulk ms':>8}")
+    try:
+        for size in sorted(args.sizes):
+            while len(domains) < size:
+                xml = TEST_DOMAIN_XML.format(index=len(domains), uuid=uuid.uuid4())
+                domains.append(raw_conn.createXML(xml, 0))
+            vm_ids = [dom.UUIDString() for dom in domains]
+
+            old_rpcs, old_time, old_states = measure(per_vm_states, vm_ids)
+            new_rpcs, new_time, new_states = measure(libvirt_client.get_domain_states)
+            assert all(new_states[vm_id] == old_states[vm_id] for vm_id in vm_ids)
+
+            print(f"{size:>6} {old_rpcs:>12} {old_time * 1000:>10.1f} "
+                  f"{new_rpcs:>10} {new_time * 1000:>8.1f}")
+    finally:
+        for dom in domains:
+            dom.destroy()
+        raw_conn.close()
@@ -0,0 +1,128 @@
+"""
+Compare create-to-SSH time: cold boot vs restore from a golden memory state.
+
+Each round creates one VM both ways, the way the create pipeline does,
+and times from the first step until the VM's SSH server sends its banner:
+
+- cold boot: template overlay + cloud-init config, define and boot;
+- golden: overlay on the golden disk, restore the saved memory state,
+  then reseed (MAC, lease, host keys) and set hostname/SSH key through
+  the guest agent.
+
+Run on the provisioner host (needs libvirt, the image template and
+STATIC_DHCP so the address is known up front):
+
+    python benchmarks/bench_golden_restore.py --image debian-12
+    python benchmarks/bench_golden_restore.py --image alpine --rounds 5 --build
+
+--build saves a fresh golden state first; otherwise the image's current
+one (GOLDEN_IMAGES) is used. VMs are deleted after each round.
+"""
+import os
+import sys
+import time
+import uuid
+import socket
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import golden
+import libvirt_client
+from config import IMAGES, STATIC_DHCP
+from storage import clone_base_image, create_linked_clone, delete_disk_image, domain_disk_args
+from cloudinit import get_metadata_url, prepare_cloud_config, delete_cloud_config
+from network import generate_mac_address
+from ipam import reserve_vm_ip, release_vm_ip
+
+SSH_KEY = "ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIFakeBenchmarkKeyMaterial0123456789abcdef bench@host"
+
+
+def wait_for_ssh(ip: str, timeout: float = 300) -> None:
+    """Block until the SSH server at ip:22 sends its banner."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection((ip, 22), timeout=2) as sock:
+                sock.settimeout(2)
+                if sock.recv(4).startswith(b"SSH-"):
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise TimeoutError(f"No SSH banner from {ip} within {timeout}s")
+
+
+def cold_boot(vm_id: str, image_type: str) -> str:
+    name = f"bench-cold-{vm_id[:8]}"
+    ip = reserve_vm_ip(vm_id)
+    iso_path = prepare_cloud_config(vm_id, name, image_type, SSH_KEY)
+    disk_path = clone_base_image(vm_id, image_type)
+    libvirt_client.create_domain(libvirt_client.build_domain_xml(
+        vm_id=vm_id,
+        name=name,
+        disk_path=disk_path,
+        iso_path=iso_path,
+        memory_mb=golden.GOLDEN_MEMORY_MB,
+        vcpus=golden.GOLDEN_VCPUS,
+        metadata_url=get_metadata_url(vm_id),
+        **domain_disk_args(vm_id, image_type)
+    ))
+    return ip
+
+
+def golden_restore(vm_id: str, image_type: str, state: dict) -> str:
+    name = f"bench-golden-{vm_id[:8]}"
+    mac = generate_mac_address(vm_id)
+    ip = reserve_vm_ip(vm_id)
+    disk_path = create_linked_clone(vm_id, state["disk_path"])
+    libvirt_client.restore_domain(state["state_path"], vm_id, name, disk_path, mac)
+    libvirt_client.reseed_guest(vm_id, state["mac_address"], mac)
+    libvirt_client.set_guest_identity(vm_id, name, IMAGES[image_type]["username"], SSH_KEY)
+    return ip
+
+
+def measure(create, *args) -> float:
+    vm_id = str(uuid.uuid4())
+    start = time.perf_counter()
+    try:
+        ip = create(vm_id, *args)
+        wait_for_ssh(ip)
+        return time.perf_counter() - start
+    finally:
+        for cleanup in (
+            lambda: libvirt_client.destroy_domain(vm_id, undefine=True),
+            lambda: delete_disk_image(vm_id),
+            lambda: delete_cloud_config(vm_id),
+            lambda: release_vm_ip(vm_id),
+        ):
+            try:
+                cleanup()
+            except Exception as e:
+                print(f"cleanup of {vm_id}: {e}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--image", default="debian-12", choices=list(IMAGES))
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--build", action="store_true", help="save a new golden state first")
+    args = parser.parse_args()
+
+    if not STATIC_DHCP:
+        sys.exit("Needs STATIC_DHCP=true (the VM's address must be known up front)")
+
+    state = asyncio.run(golden.build(args.image)) if args.build else golden.current(args.image)
+    if state is None:
+        sys.exit(f"No golden state for {args.image} (use --build)")
+
+    results = {"cold boot": [], "golden": []}
+    for _ in range(args.rounds):
+        results["cold boot"].append(measure(cold_boot, args.image))
+        results["golden"].append(measure(golden_restore, args.image, state))
+
+    print(f"{'path':>10} {'rounds':>6} {'median s':>9} {'min s':>7} {'max s':>7}")
+    for path, times in results.items():
+        print(f"{path:>10} {len(times):>6} {statistics.median(times):>9.2f} {min(times):>7.2f} {max(times):>7.2f}")
@@ -0,0 +1,122 @@
+"""
+Compare SQLite queries/sec: a connection per query vs the persistent layer.
+
+The "per-query" path is what SQL.database.get_conn used to do: open a
+new rollback-journal connection for every call. The "persistent" path is
+the current get_conn (per-thread WAL connections with cached
+statements). Both run the same API-key lookup (every authenticated
+request) and VM record insert, from 1 and from several threads:
+
+    python benchmarks/bench_sqlite_access.py
+    python benchmarks/bench_sqlite_access.py --count 20000 --threads 8
+
+Uses a throwaway database in a temporary directory; no libvirt needed.
+"""
+import os
+import sys
+import time
+import uuid
+import shutil
+import sqlite3
+import argparse
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+
+BENCH_DIR = tempfile.mkdtemp(prefix="bench-sqlite-")
+os.environ["DB_PATH"] = os.path.join(BENCH_DIR, "vms.db")
+os.environ["START_PORT"] = "10000"
+os.environ["END_PORT"] = "60000"
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from SQL import database
+from SQL.database import DB_PATH, init_db
+
+
+@contextmanager
+def per_query_conn():
+    """The old get_conn: a fresh connection, closed after use."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def lookup_user(get_conn, api_key_hash: str) -> None:
+    with get_conn() as conn:
+        conn.execute(
+            "SELECT id, name FROM users WHERE api_key_hash = ?", (api_key_hash,)
+        ).fetchone()
+
+
+def insert_vm(get_conn, port: int) -> None:
+    vm_id = str(uuid.uuid4())
+    with get_conn() as conn:
+        conn.execute(
+            """INSERT INTO vms (id, name, owner_id, status, host_port, disk_path, iso_path, created_at)
+               VALUES (?, ?, 'bench', 'running', ?, '/d', '/i', '2024-01-01T00:00:00')""",
+            (vm_id, vm_id[:8], port)
+        )
+        conn.commit()
+
+
+def run(work, count: int, threads: int) -> float:
+    per_thread = count // threads
+    start_barrier = threading.Barrier(threads)
+
+    def worker(index: int):
+        start_barrier.wait()
+        for i in range(per_thread):
+            work(index * per_thread + i)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def setup(wal: bool) -> None:
+    database.close_connections()
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(DB_PATH + suffix):
+            os.unlink(DB_PATH + suffix)
+    init_db()
+    with closing(sqlite3.connect(DB_PATH)) as conn:
+        if not wal:
+            conn.execute("PRAGMA journal_mode = DELETE")
+        conn.executemany(
+            "INSERT INTO users (id, name, hashed_password, api_key_hash) VALUES (?, ?, 'x', ?)",
+            [(f"user-{i}", f"user-{i}", f"key-{i}") for i in range(1000)]
+        )
+        conn.commit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=10000, help="queries per measurement")
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"{'layer':>11} {'query':>7} {'threads':>7} {'queries/sec':>12}")
+    for name, get_conn, wal in (
+        ("per-query", per_query_conn, False),
+        ("persistent", database.get_conn, True),
+    ):
+        for threads in (1, args.threads):
+            setup(wal)
+            rate = run(lambda i: lookup_user(get_conn, f"key-{i % 1000}"), args.count, threads)
+            print(f"{name:>11} {'lookup':>7} {threads:>7} {rate:>12.0f}")
+
+            # Inserts are fewer: each one commits (and, per-query, fsyncs a journal)
+            inserts = max(args.count // 10, threads)
+            rate = run(lambda i: insert_vm(get_conn, 10000 + i), inserts, threads)
+            print(f"{name:>11} {'insert':>7} {threads:>7} {rate:>12.0f}")
+
+    database.close_connections()
+    shutil.rmtree(BENCH_DIR, ignore_errors=True)
@@ -0,0 +1,117 @@
+"""
+Compare guest-visible disk throughput of the storage backends with fio.
+
+For each backend, a disk is created from the image template the way a
+new VM's would be, hot-plugged as vdb into a running runner VM, and fio
+runs inside the guest (through the guest agent) against /dev/vdb with
+direct I/O. The disk is detached and deleted afterwards.
+
+The runner is any VM with the qemu guest agent and fio installed
+(`apt install fio` / `apk add fio`):
+
+    python benchmarks/bench_storage_fio.py --runner <vm uuid>
+    python benchmarks/bench_storage_fio.py --runner <vm uuid> --image alpine \\
+        --backends qcow2 reflink --runtime 60
+
+Needs libvirt access, the image template, and for libvirt-pool the
+STORAGE_POOL pool. Fresh clones measure first-touch cost; run with
+--prefill to write the whole disk once before measuring.
+"""
+import os
+import sys
+import json
+import uuid
+import base64
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import libvirt
+
+import libvirt_client
+from storage import backends
+
+JOBS = {
+    "randread-4k": ["--rw=randread", "--bs=4k", "--iodepth=32"],
+    "randwrite-4k": ["--rw=randwrite", "--bs=4k", "--iodepth=32"],
+    "read-1m": ["--rw=read", "--bs=1m", "--iodepth=8"],
+    "write-1m": ["--rw=write", "--bs=1m", "--iodepth=8"],
+}
+
+DISK_XML = """<disk type='{type}' device='disk'>
+  <driver name='qemu' type='{format}' cache='writeback' discard='unmap'/>
+  {source}
+  <target dev='vdb' bus='virtio'/>
+</disk>"""
+
+
+def disk_xml(backend, vm_id: str) -> str:
+    """The disk as build_domain_xml would attach it, but as vdb."""
+    disk = backend.domain_disk(vm_id)
+    if disk.get("disk_pool"):
+        source = f"<source pool='{disk['disk_pool']}' volume='{disk['disk_volume']}'/>"
+        disk_type = "volume"
+    else:
+        source = f"<source file='{backend.disk_path(vm_id)}'/>"
+        disk_type = "file"
+    return DISK_XML.format(type=disk_type, format=disk["disk_format"], source=source)
+
+
+def run_fio(runner: str, job: str, args: list[str], runtime: int) -> dict:
+    """Run one fio job in the guest against /dev/vdb and return its JSON result."""
+    status = libvirt_client.guest_exec(
+        runner,
+        "fio",
+        [
+            f"--name={job}", "--filename=/dev/vdb", "--direct=1",
+            "--ioengine=libaio", "--time_based", f"--runtime={runtime}",
+            "--output-format=json", *args,
+        ],
+        timeout=runtime + 60
+    )
+    return json.loads(base64.b64decode(status["out-data"]))["jobs"][0]
+
+
+def bench_backend(runner: str, backend, image_type: str, runtime: int, prefill: bool) -> dict:
+    vm_id = f"fio-{backend.name}-{uuid.uuid4()}"
+    backend.clone(vm_id, image_type)
+    xml = disk_xml(backend, vm_id)
+    flags = libvirt.VIR_DOMAIN_AFFECT_LIVE
+    try:
+        with libvirt_client.connection() as conn:
+            conn.lookupByUUIDString(runner).attachDeviceFlags(xml, flags)
+        try:
+            if prefill:
+                libvirt_client.guest_exec(
+                    runner, "fio",
+                    ["--name=prefill", "--filename=/dev/vdb", "--direct=1",
+                     "--rw=write", "--bs=1m", "--ioengine=libaio", "--iodepth=8"],
+                    timeout=3600
+                )
+            results = {}
+            for job, args in JOBS.items():
+                result = run_fio(runner, job, args, runtime)
+                side = result["read"] if "read" in job else result["write"]
+                results[job] = (side["iops"], side["bw"] / 1024)
+            return results
+        finally:
+            with libvirt_client.connection() as conn:
+                conn.lookupByUUIDString(runner).detachDeviceFlags(xml, flags)
+    finally:
+        backend.delete(vm_id)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runner", required=True, help="UUID of a running VM with fio and the guest agent")
+    parser.add_argument("--image", default="debian-12")
+    parser.add_argument("--backends", nargs="+", default=list(backends), choices=list(backends))
+    parser.add_argument("--runtime", type=int, default=30, help="seconds per fio job")
+    parser.add_argument("--prefill", action="store_true", help="write the whole disk before measuring")
+    args = parser.parse_args()
+
+    print(f"{'backend':>13} {'job':>13} {'IOPS':>9} {'MiB/s':>8}")
+    for name in args.backends:
+        results = bench_backend(args.runner, backends[name], args.image, args.runtime, args.prefill)
+        for job, (iops, mib) in results.items():
+            print(f"{name:>13} {job:>13} {iops:>9.0f} {mib:>8.1f}")
@@ -4,7 +4,16 @@ import jinja2
 from pathlib import Path
 import tempfile
 import os
-from config import CLOUD_INIT_DIR, CLOUD_INIT_ISO_LABEL, TEMPLATE_DIR, IMAGES
+from config import (
+    CLOUD_INIT_DIR,
+    CLOUD_INIT_ISO_LABEL,
+    CLOUD_INIT_MODE,
+    METADATA_HOST,
+    METADATA_PORT,
+    TEMPLATE_DIR,
+    IMAGES
+)
+from SQL.METADATA_related import set_instance_metadata, delete_instance_metadata
 
 env = jinja2.Environment(
     loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
@@ -17,23 +26,21 @@ def render_template(template_name: str, variables: dict) -> str:
     template = env.get_template(template_name)
     return template.render(**variables)
 
-def create_config_iso(vm_id: str, name: str, image_type: str, ssh_key: str) -> Path:
-    """
-    Generate cloud-init ISO for a VM.
-    
-    Args:
-        vm_id: UUID of the VM
-        name: Hostname for the VM
-        image_type: Key from IMAGES dict (debian-12, rocky-9, alpine)
-        ssh_key: SSH public key to inject
-    
-    Returns:
-        Path to generated ISO file
-    """
+def get_iso_path(vm_id: str) -> Path:
+    """Path of the cloud-init ISO that belongs to a VM."""
+    return CLOUD_INIT_DIR / f"{vm_id}.iso"
+
+def get_metadata_url(vm_id: str) -> str | None:
+    """NoCloud seed URL of a VM in nocloud-net mode (None in ISO mode)."""
+    if CLOUD_INIT_MODE != "nocloud-net":
+        return None
+    return f"http://{METADATA_HOST}:{METADATA_PORT}/{vm_id}/"
+
+def render_config(vm_id: str, name: str, image_type: str, ssh_key: str) -> tuple[str, str]:
+    """Render the (user-data, meta-data) documents for a VM."""
     # Get username from image config
     username = IMAGES[image_type]["username"]
     
-    # Render YAML files
     user_data = render_template("user-data.yaml.j2", {
         "name": name,
         "username": username,
@@ -45,47 +52,190 @@ def create_config_iso(vm_id: str, name: str, image_type: str, ssh_key: str) -> P
         "name": name
     })
     
-    # Ensure output directory exists
-    CLOUD_INIT_DIR.mkdir(parents=True, exist_ok=True)
-    iso_path = CLOUD_INIT_DIR / f"{vm_id}.iso"
+    return user_data, meta_data
+
+def prepare_cloud_config(vm_id: str, name: str, image_type: str, ssh_key: str) -> Path | None:
+    """
+    Make a VM's cloud-init config available in the configured CLOUD_INIT_MODE.
     
-    # Create ISO with pycdlib
+    Returns:
+        Path to the ISO to attach, or None in nocloud-net mode (the
+        documents are stored for the metadata server instead)
+    """
+    if CLOUD_INIT_MODE == "iso":
+        return create_config_iso(vm_id, name, image_type, ssh_key)
+    
+    user_data, meta_data = render_config(vm_id, name, image_type, ssh_key)
+    set_instance_metadata(vm_id, user_data, meta_data)
+    return None
+
+# Space reserved for each file in the template ISO; larger documents fall
+# back to building the image with pycdlib
+USER_DATA_CAPACITY = 64 * 1024
+META_DATA_CAPACITY = 4 * 1024
+
+SECTOR_SIZE = 2048
+
+class IsoTemplate:
+    """
+    Pre-laid-out cidata ISO with fixed-size extents for user-data and meta-data.
+
+    Built once with pycdlib using zero-filled placeholder files of the
+    reserved capacity. Rendering a VM's ISO then only copies the image,
+    writes each document into its extent and patches the file length in
+    every directory record (ISO9660/Rock Ridge and Joliet) that points
+    at it.
+    """
+
+    def __init__(self, label: str):
+        placeholders = {
+            "user-data": bytes(USER_DATA_CAPACITY),
+            "meta-data": bytes(META_DATA_CAPACITY),
+        }
+        buf = io.BytesIO()
+        build_iso_pycdlib(placeholders["user-data"], placeholders["meta-data"], buf, label)
+        self.image = buf.getvalue()
+
+        iso = pycdlib.PyCdlib()
+        iso.open_fp(io.BytesIO(self.image))
+        # name -> (data offset, capacity, offsets of the directory records' length fields)
+        self.files: dict[str, tuple[int, int, list[int]]] = {}
+        for name, iso_name in (("user-data", "/USER_DATA;1"), ("meta-data", "/META_DATA;1")):
+            extent = iso.get_record(iso_path=iso_name).extent_location()
+            self.files[name] = (
+                extent * SECTOR_SIZE,
+                len(placeholders[name]),
+                _find_dir_records(self.image, extent)
+            )
+        iso.close()
+
+    def render(self, user_data: bytes, meta_data: bytes) -> bytes | None:
+        """The ISO image for these documents, or None if one doesn't fit."""
+        image = bytearray(self.image)
+        for name, data in (("user-data", user_data), ("meta-data", meta_data)):
+            offset, capacity, records = self.files[name]
+            if len(data) > capacity:
+                return None
+            image[offset:offset + len(data)] = data
+            for record in records:
+                # Data length is stored both-endian: 4 bytes LE, then 4 bytes BE
+                image[record:record + 4] = len(data).to_bytes(4, "little")
+                image[record + 4:record + 8] = len(data).to_bytes(4, "big")
+        return bytes(image)
+
+def _find_dir_records(image: bytes, extent: int) -> list[int]:
+    """
+    Offsets of the data-length fields of root directory records pointing at `extent`.
+
+    Walks the root directory of every primary (ISO9660) and supplementary
+    (Joliet) volume descriptor.
+    """
+    offsets = []
+    sector = 16
+    while True:
+        descriptor = sector * SECTOR_SIZE
+        vd_type = image[descriptor]
+        if vd_type == 255:
+            break
+        if vd_type in (1, 2):
+            root = descriptor + 156
+            root_extent = int.from_bytes(image[root + 2:root + 6], "little")
+            root_size = int.from_bytes(image[root + 10:root + 14], "little")
+            pos = root_extent * SECTOR_SIZE
+            end = pos + root_size
+            while pos < end:
+                length = image[pos]
+                if length == 0:
+                    # Records never cross a sector boundary; skip the padding
+                    pos = (pos // SECTOR_SIZE + 1) * SECTOR_SIZE
+                    continue
+                if int.from_bytes(image[pos + 2:pos + 6], "little") == extent:
+                    offsets.append(pos + 10)
+                pos += length
+        sector += 1
+    return offsets
+
+_iso_template: IsoTemplate | None = None
+
+def get_iso_template() -> IsoTemplate:
+    global _iso_template
+    if _iso_template is None:
+        _iso_template = IsoTemplate(CLOUD_INIT_ISO_LABEL)
+    return _iso_template
+
+def build_iso_pycdlib(user_data: bytes, meta_data: bytes, fp, label: str = CLOUD_INIT_ISO_LABEL) -> None:
+    """Build a cidata ISO from scratch with pycdlib and write it to `fp`."""
     iso = pycdlib.PyCdlib()
     iso.new(
         interchange_level=3,
-        vol_ident=CLOUD_INIT_ISO_LABEL,
+        vol_ident=label,
         joliet=True,
         rock_ridge='1.09'
     )
     
     # Add user-data file
-    user_data_bytes = user_data.encode('utf-8')
     iso.add_fp(
-        io.BytesIO(user_data_bytes),
-        len(user_data_bytes),
+        io.BytesIO(user_data),
+        len(user_data),
         '/USER_DATA;1',
         joliet_path='/user-data',
         rr_name='user-data'
     )
     
     # Add meta-data file
-    meta_data_bytes = meta_data.encode('utf-8')
     iso.add_fp(
-        io.BytesIO(meta_data_bytes),
-        len(meta_data_bytes),
+        io.BytesIO(meta_data),
+        len(meta_data),
         '/META_DATA;1',
         joliet_path='/meta-data',
         rr_name='meta-data'
     )
     
-    # Write and close
-    iso.write(str(iso_path))
+    iso.write_fp(fp)
     iso.close()
+
+def create_config_iso(vm_id: str, name: str, image_type: str, ssh_key: str) -> Path:
+    """
+    Generate cloud-init ISO for a VM.
+    
+    The image is patched from the shared IsoTemplate and written with a
+    single call; documents too large for the template are built with
+    pycdlib instead.
+    
+    Args:
+        vm_id: UUID of the VM
+        name: Hostname for the VM
+        image_type: Key from IMAGES dict (debian-12, rocky-9, alpine)
+        ssh_key: SSH public key to inject
+    
+    Returns:
+        Path to generated ISO file
+    """
+    # Render YAML files
+    user_data, meta_data = render_config(vm_id, name, image_type, ssh_key)
+    user_data_bytes = user_data.encode('utf-8')
+    meta_data_bytes = meta_data.encode('utf-8')
+    
+    # Ensure output directory exists
+    CLOUD_INIT_DIR.mkdir(parents=True, exist_ok=True)
+    iso_path = get_iso_path(vm_id)
+    
+    image = get_iso_template().render(user_data_bytes, meta_data_bytes)
+    if image is not None:
+        iso_path.write_bytes(image)
+    else:
+        with open(iso_path, "wb") as fp:
+            build_iso_pycdlib(user_data_bytes, meta_data_bytes, fp)
     
     return iso_path
 
 def delete_config_iso(vm_id: str) -> None:
     """Remove cloud-init ISO after VM is created (optional cleanup)."""
-    iso_path = CLOUD_INIT_DIR / f"{vm_id}.iso"
+    iso_path = get_iso_path(vm_id)
     if iso_path.exists():
-        iso_path.unlink()
\ No newline at end of file
+        iso_path.unlink()
+
+def delete_cloud_config(vm_id: str) -> None:
+    """Remove a VM's cloud-init ISO and any stored nocloud-net documents."""
+    delete_config_iso(vm_id)
+    delete_instance_metadata(vm_id)
\ No newline at end of file
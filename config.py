@@ -19,6 +19,8 @@ DB_PATH = os.getenv("DB_PATH", str(DATA_DIR / "vms.db"))
 
 # Libvirt
 LIBVIRT_URI = os.getenv("LIBVIRT_URI", "qemu:///system")
+LIBVIRT_POOL_SIZE = int(os.getenv("LIBVIRT_POOL_SIZE", "8"))  # concurrent libvirt connections
+LIBVIRT_KEEPALIVE_INTERVAL = int(os.getenv("LIBVIRT_KEEPALIVE_INTERVAL", "5"))  # seconds, 0 disables
 
 # VM Defaults
 DEFAULT_MEMORY_MB = int(os.getenv("DEFAULT_MEMORY_MB", "512"))
@@ -30,33 +32,132 @@ MIN_MEMORY_MB = int(os.getenv("MIN_MEMORY_MB", "256"))
 MAX_MEMORY_MB = int(os.getenv("MAX_MEMORY_MB", "4096"))
 MIN_VCPUS = int(os.getenv("MIN_VCPUS", "1"))
 MAX_VCPUS = int(os.getenv("MAX_VCPUS", "4"))
+MAX_DISK_GB = int(os.getenv("MAX_DISK_GB", "100"))  # largest size a disk can be grown to
+
+# Block I/O limits on each VM's disk (0 = unlimited). Requested limits are
+# capped at the MAX_ values when those are set, so no tenant can opt out.
+DEFAULT_DISK_IOPS = int(os.getenv("DEFAULT_DISK_IOPS", "0"))
+DEFAULT_DISK_BYTES_PER_SEC = int(os.getenv("DEFAULT_DISK_BYTES_PER_SEC", "0"))
+MAX_DISK_IOPS = int(os.getenv("MAX_DISK_IOPS", "0"))
+MAX_DISK_BYTES_PER_SEC = int(os.getenv("MAX_DISK_BYTES_PER_SEC", "0"))
 
 # Network
 START_PORT = int(os.getenv("START_PORT", "2222"))
 END_PORT = int(os.getenv("END_PORT", "2322"))
 VM_NETWORK = os.getenv("VM_NETWORK", "default")  # libvirt network name
+# dnsmasq lease database of VM_NETWORK (the JSON <bridge>.status file also works)
+LEASES_FILE = Path(os.getenv("LEASES_FILE", f"/var/lib/libvirt/dnsmasq/{VM_NETWORK}.leases"))
+IP_WAIT_TIMEOUT = int(os.getenv("IP_WAIT_TIMEOUT", "60"))  # seconds to wait for a VM's DHCP lease
+# Pin each VM's IP with a DHCP host entry before boot instead of discovering it
+STATIC_DHCP = os.getenv("STATIC_DHCP", "true").lower() == "true"
+
+# SSH port forwards (host port -> VM:22)
+# "iptables": DNAT + FORWARD rule pair per VM
+# "nftables": one table with a port -> address map, updated in batched transactions
+FORWARD_BACKEND = os.getenv("FORWARD_BACKEND", "iptables").lower()
+if FORWARD_BACKEND not in ("iptables", "nftables"):
+    raise ValueError(f"Unknown FORWARD_BACKEND: {FORWARD_BACKEND}")
+NFT_TABLE = os.getenv("NFT_TABLE", "vm_provisioner")
+FORWARD_FLUSH_MS = int(os.getenv("FORWARD_FLUSH_MS", "20"))  # nftables: window changes are batched over
+# Record the commands/rulesets instead of running them (no root needed)
+FORWARD_DRY_RUN = os.getenv("FORWARD_DRY_RUN", "false").lower() == "true"
+
+# Provisioning
+PROVISION_WORKERS = int(os.getenv("PROVISION_WORKERS", "8"))  # threads for background create pipelines
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "200"))  # VMs per POST /vms:batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))  # pipelines running at once per batch
+TEARDOWN_CONCURRENCY = int(os.getenv("TEARDOWN_CONCURRENCY", "16"))  # VM teardowns running at once per DELETE
+VMS_PAGE_SIZE = int(os.getenv("VMS_PAGE_SIZE", "100"))  # GET /vms page size when no limit is given
+MAX_VMS_PAGE_SIZE = int(os.getenv("MAX_VMS_PAGE_SIZE", "1000"))
+HOST_IO_WORKERS = int(os.getenv("HOST_IO_WORKERS", "16"))  # threads for libvirt/iptables calls made by endpoints
+DB_WORKERS = int(os.getenv("DB_WORKERS", "8"))  # threads (each with its SQLite connection) for endpoint queries
 
 # Available images
 IMAGES = {
     "debian-12": {
         "name": "Debian 12 (Bookworm)",
         "template_path": IMAGE_DIR / "debian-12-template.qcow2",
-        "username": "debian"
+        "username": "debian",
+        "storage": "qcow2"
     },
     "rocky-9": {
         "name": "Rocky Linux 9",
         "template_path": IMAGE_DIR / "rocky-9-template.qcow2",
-        "username": "rocky"
+        "username": "rocky",
+        "storage": "qcow2"
     },
     "alpine": {
         "name": "Alpine Linux",
         "template_path": IMAGE_DIR / "alpine-template.qcow2",
-        "username": "alpine"
+        "username": "alpine",
+        "storage": "qcow2"
     }
 }
 
 # Cloud-init
 CLOUD_INIT_ISO_LABEL = "cidata"
+# "iso": per-VM NoCloud ISO attached as a cdrom
+# "nocloud-net": served over HTTP by the metadata server, URL passed in the SMBIOS serial
+CLOUD_INIT_MODE = os.getenv("CLOUD_INIT_MODE", "iso").lower()
+if CLOUD_INIT_MODE not in ("iso", "nocloud-net"):
+    raise ValueError(f"Unknown CLOUD_INIT_MODE: {CLOUD_INIT_MODE}")
+# Address on the VM network the metadata server listens on (the bridge IP)
+METADATA_HOST = os.getenv("METADATA_HOST", "192.168.122.1")
+METADATA_PORT = int(os.getenv("METADATA_PORT", "8775"))
+
+
+def parse_image_settings(value: str) -> dict[str, str]:
+    """Parse 'debian-12=reflink,alpine=qcow2' into {'debian-12': 'reflink', 'alpine': 'qcow2'}."""
+    settings = {}
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        image_type, _, setting = item.partition("=")
+        image_type = image_type.strip()
+        if image_type not in IMAGES:
+            raise ValueError(f"Unknown image type in per-image setting: {image_type}")
+        settings[image_type] = setting.strip()
+    return settings
+
+
+def parse_image_counts(value: str) -> dict[str, int]:
+    """Parse 'debian-12=2,alpine=1' into {'debian-12': 2, 'alpine': 1}."""
+    return {image_type: int(count) for image_type, count in parse_image_settings(value).items()}
+
+
+# Disk storage backends, chosen per image ("storage" in IMAGES):
+# "qcow2": copy-on-write overlay on the template in INSTANCE_DIR
+# "reflink": raw copy of the template, reflinked (FICLONE) where the filesystem allows
+# "libvirt-pool": volume cloned in the libvirt storage pool STORAGE_POOL
+STORAGE_BACKENDS = ("qcow2", "reflink", "libvirt-pool")
+STORAGE_POOL = os.getenv("STORAGE_POOL", "default")
+for _image_type, _backend in parse_image_settings(os.getenv("IMAGE_STORAGE", "")).items():
+    if _backend not in STORAGE_BACKENDS:
+        raise ValueError(f"Unknown storage backend for {_image_type}: {_backend}")
+    IMAGES[_image_type]["storage"] = _backend
+
+
+# Warm pool: pre-booted VMs kept per image type (empty = disabled)
+WARM_POOL_SIZES = parse_image_counts(os.getenv("WARM_POOL_SIZES", ""))
+WARM_POOL_AGENT_TIMEOUT = int(os.getenv("WARM_POOL_AGENT_TIMEOUT", "180"))  # seconds
+
+# Ready-made disk overlays kept per image type (0 = disabled)
+OVERLAY_POOL_SIZE = int(os.getenv("OVERLAY_POOL_SIZE", "4"))
+
+# Golden memory states: images booted once and saved, new VMs of the
+# default size restored from the save (comma-separated, empty = disabled)
+GOLDEN_IMAGES = list(parse_image_settings(os.getenv("GOLDEN_IMAGES", "")))
+GOLDEN_BOOT_TIMEOUT = int(os.getenv("GOLDEN_BOOT_TIMEOUT", "600"))  # seconds for the first boot and cloud-init
+GOLDEN_SETTLE_SECONDS = int(os.getenv("GOLDEN_SETTLE_SECONDS", "30"))  # idle time before the save
+
+# Reconciler: finds resources (domains, disks, ISOs, forwards, IPs) no VM
+# record owns and records whose resources are gone; runs at startup and
+# every RECONCILE_INTERVAL seconds (0 = startup only)
+RECONCILE_INTERVAL = int(os.getenv("RECONCILE_INTERVAL", "600"))
+RECONCILE_GRACE_SECONDS = int(os.getenv("RECONCILE_GRACE_SECONDS", "600"))  # files younger than this are left alone
+
+# Operator key for host-wide endpoints (GET/POST /reconcile); unset disables them
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "")
 
 def ensure_directories():
     """Create all required directories."""
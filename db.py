@@ -0,0 +1,77 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from config import DB_WORKERS
+from SQL import USERS_related, VM_related
+from SQL.VM_related import VMRecord
+
+logger = logging.getLogger(__name__)
+
+# Async facade over the SQL modules used by request handlers. Queries run
+# on this dedicated, bounded executor, so a slow or locked database stalls
+# only the requests waiting on it, never the event loop (health checks,
+# progress polling and everything else keep being served). Each worker
+# keeps its own persistent SQLite connection (see SQL.database.get_conn).
+_executor = ThreadPoolExecutor(
+    max_workers=DB_WORKERS,
+    thread_name_prefix="db"
+)
+
+
+async def run(func, *args):
+    """Run a blocking database call on the DB executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+# Users
+
+async def add_user(name: str, password: str, plaintext_api_key: str) -> dict | None:
+    return await run(USERS_related.add_user, name, password, plaintext_api_key)
+
+
+async def get_user_by_api_key(plaintext_api_key: str) -> dict | None:
+    return await run(USERS_related.get_user_by_api_key, plaintext_api_key)
+
+
+async def get_user_by_name(name: str) -> dict | None:
+    return await run(USERS_related.get_user_by_name, name)
+
+
+async def update_api_key(user_id: str, plaintext_api_key: str) -> bool:
+    return await run(USERS_related.update_api_key, user_id, plaintext_api_key)
+
+
+# VMs
+
+async def get_vm_by_id(vm_id: str, owner_id: str) -> VMRecord | None:
+    return await run(VM_related.get_vm_by_id, vm_id, owner_id)
+
+
+async def list_vms_page(owner_id: str, limit: int, cursor: str | None = None) -> tuple[list[VMRecord], str | None]:
+    return await run(VM_related.list_vms_page, owner_id, limit, cursor)
+
+
+async def list_vms_by_status(status: str) -> list[VMRecord]:
+    return await run(VM_related.list_vms_by_status, status)
+
+
+async def update_vm_disk_limits(vm_id: str, owner_id: str, disk_iops: int, disk_bytes_per_sec: int) -> bool:
+    return await run(VM_related.update_vm_disk_limits, vm_id, owner_id, disk_iops, disk_bytes_per_sec)
+
+
+async def mark_vms_deleting(
+    owner_id: str,
+    vm_ids: list[str] | None = None,
+    name_prefix: str | None = None
+) -> tuple[list[VMRecord], list[dict]]:
+    return await run(VM_related.mark_vms_deleting, owner_id, vm_ids, name_prefix)
+
+
+async def list_port_forwards() -> dict[int, str]:
+    return await run(VM_related.list_port_forwards)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False)
@@ -0,0 +1,167 @@
+import time
+import logging
+import threading
+from datetime import datetime, timezone
+
+import libvirt
+
+from config import LIBVIRT_URI
+from libvirt_client import DOMAIN_STATES
+from libvirt_pool import start_event_loop
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle event -> resulting state (UNDEFINED drops the entry)
+EVENT_STATES = {
+    libvirt.VIR_DOMAIN_EVENT_DEFINED: 'shutoff',
+    libvirt.VIR_DOMAIN_EVENT_STARTED: 'running',
+    libvirt.VIR_DOMAIN_EVENT_SUSPENDED: 'paused',
+    libvirt.VIR_DOMAIN_EVENT_RESUMED: 'running',
+    libvirt.VIR_DOMAIN_EVENT_STOPPED: 'shutoff',
+    libvirt.VIR_DOMAIN_EVENT_SHUTDOWN: 'shutdown',
+    libvirt.VIR_DOMAIN_EVENT_PMSUSPENDED: 'suspended',
+    libvirt.VIR_DOMAIN_EVENT_CRASHED: 'crashed',
+}
+
+def _isoformat(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+
+class DomainStateCache:
+    """
+    In-memory vm_id -> domain state map kept current by libvirt lifecycle events.
+
+    Events arrive on a dedicated read-only connection, dispatched by the
+    shared libvirt event loop (see libvirt_pool.start_event_loop); a
+    background thread reconnects it when it drops. Lifecycle events update
+    single entries; every (re)connect does a full resync first, because
+    events sent while disconnected are lost. While the connection is down
+    the cache keeps serving its last known states and reports itself as
+    stale.
+    """
+
+    def __init__(self, uri: str, reconnect_interval: float = 5.0):
+        self.uri = uri
+        self.reconnect_interval = reconnect_interval
+        self._states: dict[str, tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        self._conn: libvirt.virConnect | None = None
+        self._connected = False
+        self._synced_at: float | None = None
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    @property
+    def live(self) -> bool:
+        """True while connected and resynced, i.e. every event is being seen."""
+        return self._connected and self._synced_at is not None
+
+    def get(self, vm_id: str) -> tuple[str, float] | None:
+        """Cached (state, updated_at timestamp) of a domain, or None if unknown."""
+        with self._lock:
+            return self._states.get(vm_id)
+
+    def set(self, vm_id: str, state: str) -> None:
+        with self._lock:
+            self._states[vm_id] = (state, time.time())
+
+    def info(self) -> dict:
+        """Staleness metadata returned next to cached states."""
+        return {
+            "source": "libvirt_events",
+            "live": self.live,
+            "synced_at": _isoformat(self._synced_at),
+            "stale": not self.live,
+        }
+
+    def resync(self, conn: libvirt.virConnect) -> None:
+        """Replace the whole map with the current state of every domain."""
+        now = time.time()
+        states = {
+            dom.UUIDString(): (DOMAIN_STATES.get(record.get('state.state'), 'unknown'), now)
+            for dom, record in conn.getAllDomainStats(libvirt.VIR_DOMAIN_STATS_STATE)
+        }
+        with self._lock:
+            # Events that arrived while the snapshot was taken are newer
+            for vm_id, (state, updated_at) in self._states.items():
+                if updated_at > now:
+                    states[vm_id] = (state, updated_at)
+            self._states = states
+        self._synced_at = now
+        logger.info(f"Domain state cache resynced ({len(states)} domains)")
+
+    def _on_lifecycle(self, conn, dom, event, detail, opaque) -> None:
+        vm_id = dom.UUIDString()
+        if event == libvirt.VIR_DOMAIN_EVENT_UNDEFINED:
+            with self._lock:
+                self._states.pop(vm_id, None)
+            return
+        state = EVENT_STATES.get(event)
+        if state is None:
+            return
+        if event == libvirt.VIR_DOMAIN_EVENT_DEFINED and self.get(vm_id):
+            # Redefining a domain doesn't change whether it runs
+            return
+        self.set(vm_id, state)
+
+    def _on_close(self, conn, reason, opaque) -> None:
+        logger.warning(f"Lost libvirt event connection (reason {reason})")
+        self._connected = False
+
+    def _connect(self) -> None:
+        conn = libvirt.openReadOnly(self.uri)
+        # Keepalives make a dead daemon show up as a close event
+        conn.setKeepAlive(5, 3)
+        conn.registerCloseCallback(self._on_close, None)
+        conn.domainEventRegisterAny(
+            None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE, self._on_lifecycle, None
+        )
+        self._conn = conn
+        self._connected = True
+        # Registered before the resync: nothing between the two is missed
+        try:
+            self.resync(conn)
+        except libvirt.libvirtError:
+            # Not live without a resync; _run tries again
+            self._disconnect()
+            raise
+
+    def _disconnect(self) -> None:
+        self._connected = False
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except libvirt.libvirtError:
+                pass
+            self._conn = None
+
+    def start(self) -> None:
+        """Start the reconnect thread (idempotent)."""
+        if self._thread is not None:
+            return
+        start_event_loop()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="domain-cache", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._disconnect()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if not self._connected:
+                self._disconnect()
+                try:
+                    self._connect()
+                except libvirt.libvirtError as e:
+                    logger.warning(f"Domain state cache can't reach libvirt: {e}")
+            self._stop.wait(self.reconnect_interval)
+
+
+# Shared cache for the API's read endpoints
+cache = DomainStateCache(LIBVIRT_URI)
@@ -0,0 +1,313 @@
+import time
+import logging
+import threading
+import subprocess
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+
+from config import FORWARD_BACKEND, NFT_TABLE, FORWARD_FLUSH_MS, FORWARD_DRY_RUN, START_PORT, END_PORT
+
+logger = logging.getLogger(__name__)
+
+# SSH port forwards: host_port on the host -> vm_ip:22. Two interchangeable
+# backends; `backend` is the one FORWARD_BACKEND selects. With dry_run they
+# record what they would run instead of running it, so no root is needed.
+
+SSH_PORT = 22
+
+
+class ForwardingBackend(ABC):
+    """Installs and removes host port -> VM SSH forwards."""
+
+    name = ""
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        # Dry run: commands (iptables) or nft scripts (nftables), in order
+        self.applied: list = []
+
+    @abstractmethod
+    def add(self, host_port: int, vm_ip: str) -> None:
+        ...
+
+    @abstractmethod
+    def remove(self, host_port: int, vm_ip: str) -> None:
+        ...
+
+    @abstractmethod
+    def sync(self, forwards: dict[int, str]) -> None:
+        """Make the installed forwards exactly `forwards` (host_port -> VM IP)."""
+        ...
+
+    @abstractmethod
+    def list_forwards(self) -> list[tuple[int, str]]:
+        """Installed (host_port, VM IP) forwards in START_PORT..END_PORT, duplicates included."""
+        ...
+
+    def update(self, add: list[tuple[int, str]], remove: list[tuple[int, str]]) -> None:
+        """Apply many changes at once (removals first)."""
+        for host_port, vm_ip in remove:
+            self.remove(host_port, vm_ip)
+        for host_port, vm_ip in add:
+            self.add(host_port, vm_ip)
+
+
+class IptablesBackend(ForwardingBackend):
+    """
+    A PREROUTING DNAT rule and a FORWARD ACCEPT rule per VM.
+
+    Two iptables processes per change; the kernel walks the rules linearly.
+    """
+
+    name = "iptables"
+
+    def _run(self, cmd: list[str], check: bool = True) -> None:
+        if self.dry_run:
+            self.applied.append(cmd)
+            return
+        subprocess.run(cmd, check=check, capture_output=True, text=True)
+
+    def _rules(self, action: str, host_port: int, vm_ip: str) -> tuple[list[str], list[str]]:
+        # DNAT rewrites the destination to vm_ip:22, FORWARD lets the rewritten packet through
+        dnat_cmd = [
+            "iptables", "-t", "nat", action, "PREROUTING",
+            "-p", "tcp",
+            "--dport", str(host_port),
+            "-j", "DNAT",
+            "--to-destination", f"{vm_ip}:{SSH_PORT}"
+        ]
+        forward_cmd = [
+            "iptables", action, "FORWARD",
+            "-p", "tcp",
+            "-d", vm_ip,
+            "--dport", str(SSH_PORT),
+            "-j", "ACCEPT"
+        ]
+        return dnat_cmd, forward_cmd
+
+    def add(self, host_port: int, vm_ip: str) -> None:
+        dnat_cmd, forward_cmd = self._rules("-A", host_port, vm_ip)
+        self._run(dnat_cmd)
+        self._run(forward_cmd)
+        logger.info(f"Added port forward: host:{host_port} -> {vm_ip}:{SSH_PORT}")
+
+    def remove(self, host_port: int, vm_ip: str) -> None:
+        dnat_cmd, forward_cmd = self._rules("-D", host_port, vm_ip)
+        self._run(dnat_cmd)
+        self._run(forward_cmd, check=False)
+        logger.info(f"Removed port forward: host:{host_port} -> {vm_ip}:{SSH_PORT}")
+
+    def sync(self, forwards: dict[int, str]) -> None:
+        # The rules outlive the service; there is no state to load
+        pass
+
+    def list_forwards(self) -> list[tuple[int, str]]:
+        if self.dry_run:
+            return []
+        rules = subprocess.run(
+            ["iptables", "-t", "nat", "-S", "PREROUTING"],
+            check=True, capture_output=True, text=True
+        ).stdout
+        return parse_iptables_forwards(rules)
+
+
+class NftablesBackend(ForwardingBackend):
+    """
+    One nftables table: a dnat verdict map (port -> address . 22) and a
+    set of allowed destinations, so lookups are O(1) however many VMs run.
+
+    Changes are group-committed: the first caller in a flush window waits
+    `flush_window` seconds, then applies every change queued meanwhile as
+    one `nft -f` transaction (element adds/deletes only; the rules never
+    change). Each caller returns once its change is applied, or raises the
+    transaction's error. `forwards` mirrors what the kernel map holds;
+    `sync()` loads it at startup by replacing the whole table. Without a
+    sync, and after a failed transaction, the next batch does the same.
+    """
+
+    name = "nftables"
+
+    def __init__(self, table: str = NFT_TABLE, flush_window: float = FORWARD_FLUSH_MS / 1000,
+                 dry_run: bool = False):
+        super().__init__(dry_run)
+        self.table = table
+        self.flush_window = flush_window
+        self.forwards: dict[int, str] = {}
+        self.transactions = 0
+        self._loaded = False
+        self._pending: list[tuple[str, int, str, Future]] = []
+        self._collecting = False
+        self._lock = threading.Lock()
+        self._apply_lock = threading.Lock()
+
+    def ruleset(self, forwards: dict[int, str] | None = None) -> str:
+        """The complete table for `forwards` (default: the current ones), in nft syntax."""
+        forwards = self.forwards if forwards is None else forwards
+        map_elements = ", ".join(
+            f"{port} : {ip} . {SSH_PORT}" for port, ip in sorted(forwards.items())
+        )
+        set_elements = ", ".join(sorted(set(forwards.values())))
+        lines = [
+            f"table ip {self.table} {{",
+            "\tmap ssh_dnat {",
+            "\t\ttype inet_service : ipv4_addr . inet_service",
+        ]
+        if map_elements:
+            lines.append(f"\t\telements = {{ {map_elements} }}")
+        lines += [
+            "\t}",
+            "\tset ssh_targets {",
+            "\t\ttype ipv4_addr",
+        ]
+        if set_elements:
+            lines.append(f"\t\telements = {{ {set_elements} }}")
+        lines += [
+            "\t}",
+            "\tchain prerouting {",
+            "\t\ttype nat hook prerouting priority dstnat; policy accept;",
+            "\t\tdnat ip addr . port to tcp dport map @ssh_dnat",
+            "\t}",
+            "\tchain forward {",
+            "\t\ttype filter hook forward priority filter; policy accept;",
+            f"\t\tip daddr @ssh_targets tcp dport {SSH_PORT} accept",
+            "\t}",
+            "}",
+        ]
+        return "\n".join(lines) + "\n"
+
+    def _replace_script(self, forwards: dict[int, str]) -> str:
+        # "add" makes the delete safe when the table doesn't exist yet;
+        # all three run in one transaction, so there is no gap
+        return (
+            f"add table ip {self.table}\n"
+            f"delete table ip {self.table}\n"
+            + self.ruleset(forwards)
+        )
+
+    def _delta_script(self, old: dict[int, str], new: dict[int, str]) -> str:
+        removed = sorted(port for port, ip in old.items() if new.get(port) != ip)
+        added = sorted(port for port, ip in new.items() if old.get(port) != ip)
+        old_ips, new_ips = set(old.values()), set(new.values())
+        lines = []
+        if removed:
+            ports = ", ".join(str(port) for port in removed)
+            lines.append(f"delete element ip {self.table} ssh_dnat {{ {ports} }}")
+        if old_ips - new_ips:
+            lines.append(f"delete element ip {self.table} ssh_targets {{ {', '.join(sorted(old_ips - new_ips))} }}")
+        if new_ips - old_ips:
+            lines.append(f"add element ip {self.table} ssh_targets {{ {', '.join(sorted(new_ips - old_ips))} }}")
+        if added:
+            elements = ", ".join(f"{port} : {new[port]} . {SSH_PORT}" for port in added)
+            lines.append(f"add element ip {self.table} ssh_dnat {{ {elements} }}")
+        return "".join(line + "\n" for line in lines)
+
+    def _apply(self, script: str) -> None:
+        self.transactions += 1
+        if self.dry_run:
+            self.applied.append(script)
+            return
+        subprocess.run(["nft", "-f", "-"], input=script, check=True, capture_output=True, text=True)
+
+    def sync(self, forwards: dict[int, str]) -> None:
+        with self._apply_lock:
+            self._apply(self._replace_script(forwards))
+            self.forwards = dict(forwards)
+            self._loaded = True
+        logger.info(f"Loaded {len(forwards)} port forwards into nftables table {self.table}")
+
+    def _flush(self, batch: list[tuple[str, int, str, Future]]) -> None:
+        with self._apply_lock:
+            new = dict(self.forwards)
+            for action, host_port, vm_ip, _ in batch:
+                if action == "add":
+                    new[host_port] = vm_ip
+                elif new.get(host_port) == vm_ip:
+                    del new[host_port]
+
+            script = self._delta_script(self.forwards, new) if self._loaded else self._replace_script(new)
+            try:
+                if script:
+                    self._apply(script)
+            except Exception as e:
+                # The kernel may not match the mirror any more; rebuild next time
+                self._loaded = False
+                for *_, future in batch:
+                    future.set_exception(e)
+                return
+            self.forwards = new
+            self._loaded = True
+        for *_, future in batch:
+            future.set_result(None)
+
+    def list_forwards(self) -> list[tuple[int, str]]:
+        return sorted(
+            (host_port, vm_ip) for host_port, vm_ip in self.forwards.items()
+            if in_port_range(host_port)
+        )
+
+    def update(self, add: list[tuple[int, str]], remove: list[tuple[int, str]]) -> None:
+        # One transaction for everything, without waiting for a flush window
+        batch = [("remove", port, ip, Future()) for port, ip in remove]
+        batch += [("add", port, ip, Future()) for port, ip in add]
+        self._flush(batch)
+        for *_, future in batch:
+            future.result()
+
+    def _submit(self, action: str, host_port: int, vm_ip: str) -> None:
+        future: Future = Future()
+        with self._lock:
+            self._pending.append((action, host_port, vm_ip, future))
+            leader = not self._collecting
+            self._collecting = True
+
+        if leader:
+            time.sleep(self.flush_window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._collecting = False
+            self._flush(batch)
+
+        future.result()
+
+    def add(self, host_port: int, vm_ip: str) -> None:
+        self._submit("add", host_port, vm_ip)
+        logger.info(f"Added port forward: host:{host_port} -> {vm_ip}:{SSH_PORT}")
+
+    def remove(self, host_port: int, vm_ip: str) -> None:
+        self._submit("remove", host_port, vm_ip)
+        logger.info(f"Removed port forward: host:{host_port} -> {vm_ip}:{SSH_PORT}")
+
+
+def in_port_range(host_port: int) -> bool:
+    """Whether a host port is one this service hands out (START_PORT..END_PORT)."""
+    return START_PORT <= host_port <= END_PORT
+
+
+def parse_iptables_forwards(rules: str) -> list[tuple[int, str]]:
+    """
+    (host_port, VM IP) of the SSH DNAT rules in `iptables -t nat -S PREROUTING`
+    output. Rules on host ports outside START_PORT..END_PORT aren't ours
+    and are left out.
+    """
+    forwards = []
+    for line in rules.splitlines():
+        args = line.split()
+        if "DNAT" not in args or "--dport" not in args or "--to-destination" not in args:
+            continue
+        destination = args[args.index("--to-destination") + 1]
+        vm_ip, _, port = destination.partition(":")
+        host_port = int(args[args.index("--dport") + 1])
+        if port != str(SSH_PORT) or not in_port_range(host_port):
+            continue
+        forwards.append((host_port, vm_ip))
+    return forwards
+
+
+def create_backend(name: str = FORWARD_BACKEND, dry_run: bool = FORWARD_DRY_RUN) -> ForwardingBackend:
+    if name == "nftables":
+        return NftablesBackend(dry_run=dry_run)
+    return IptablesBackend(dry_run=dry_run)
+
+
+# Shared backend used by network.add_port_forward / remove_port_forward
+backend = create_backend()
@@ -0,0 +1,390 @@
+import json
+import uuid
+import shutil
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from collections import Counter
+from pathlib import Path
+from typing import TypedDict
+
+from config import (
+    IMAGES,
+    IMAGE_DIR,
+    INSTANCE_DIR,
+    GOLDEN_IMAGES,
+    GOLDEN_BOOT_TIMEOUT,
+    GOLDEN_SETTLE_SECONDS,
+    STATIC_DHCP,
+    DEFAULT_MEMORY_MB,
+    DEFAULT_VCPUS
+)
+from libvirt_client import (
+    create_domain,
+    build_domain_xml,
+    destroy_domain,
+    wait_for_guest_agent,
+    guest_exec,
+    guest_link_down,
+    save_domain
+)
+from storage import create_overlay, template_stamp
+from qcow2 import read_header, Qcow2Error
+from cloudinit import get_metadata_url, prepare_cloud_config, delete_cloud_config
+from network import generate_mac_address
+from ipam import reserve_vm_ip, release_vm_ip
+import provisioner
+import aio
+from provisioner import CONFIG_STAGE, run_blocking, run_stage_graph
+
+logger = logging.getLogger(__name__)
+
+# Each build lives in GOLDEN_DIR/<image_type>/<build_id>/ (disk.qcow2, an
+# overlay on the template, and memory.save); <image_type>/current.json
+# points at the build new VMs are restored from. prune() removes older
+# builds once no create request may still restore from them, keeping only
+# the disk.qcow2 of those the disks of restored VMs are overlays on.
+GOLDEN_DIR = IMAGE_DIR / "golden"
+
+# Golden states are saved with the default spec; only matching requests can use them
+GOLDEN_MEMORY_MB = DEFAULT_MEMORY_MB
+GOLDEN_VCPUS = DEFAULT_VCPUS
+
+_restores: Counter = Counter()
+_misses: Counter = Counter()
+_building: set[str] = set()
+_active_builds: set[str] = set()
+_errors: dict[str, str] = {}
+# Build id -> create requests (single or batch) that may still restore
+# from it; _lock keeps prune() from deleting a build as it is handed out
+_restoring: Counter = Counter()
+_lock = threading.Lock()
+
+
+class GoldenState(TypedDict):
+    image_type: str
+    build_id: str
+    template_stamp: str
+    memory_mb: int
+    vcpus: int
+    disk_path: str
+    state_path: str
+    mac_address: str
+    created_at: str
+
+
+def golden_domain_name(image_type: str, build_id: str) -> str:
+    """Libvirt domain name of the VM a golden state is saved from."""
+    return f"golden-{image_type}-{build_id[:8]}"
+
+
+def _current_file(image_type: str) -> Path:
+    return GOLDEN_DIR / image_type / "current.json"
+
+
+def current(image_type: str) -> GoldenState | None:
+    """
+    The image's golden state, if it was saved from the current template.
+
+    Returns None when there is none yet, its files are gone, or the
+    template has been replaced since (the saved guest would not match
+    the disk a restored VM gets).
+    """
+    try:
+        state: GoldenState = json.loads(_current_file(image_type).read_text())
+        stamp = template_stamp(IMAGES[image_type]["template_path"])
+    except (FileNotFoundError, ValueError):
+        return None
+    if state["template_stamp"] != stamp:
+        return None
+    if not (Path(state["disk_path"]).exists() and Path(state["state_path"]).exists()):
+        return None
+    return state
+
+
+def _acquire(image_type: str) -> GoldenState | None:
+    with _lock:
+        state = current(image_type)
+        if state:
+            _restoring[state["build_id"]] += 1
+        return state
+
+
+async def lookup(image_type: str, memory_mb: int, vcpus: int, count: int = 1) -> GoldenState | None:
+    """
+    Golden state to restore `count` new VMs from, if the image has one that fits.
+
+    Only qcow2-backed images of GOLDEN_IMAGES qualify (restored disks are
+    overlays on the golden disk). A missing or outdated state is rebuilt
+    in the background. A returned state's build is kept until the
+    pipelines using it are done: run them through restoring().
+    """
+    if image_type not in GOLDEN_IMAGES or IMAGES[image_type]["storage"] != "qcow2":
+        return None
+    if memory_mb != GOLDEN_MEMORY_MB or vcpus != GOLDEN_VCPUS:
+        return None
+
+    state = await aio.run(_acquire, image_type)
+    if state is None:
+        _misses[image_type] += count
+        schedule_build(image_type)
+        return None
+
+    _restores[image_type] += count
+    return state
+
+
+def release(state: GoldenState) -> None:
+    """Done restoring from a state's build (blocking); prunes it if it was superseded."""
+    with _lock:
+        _restoring[state["build_id"]] -= 1
+        if _restoring[state["build_id"]] <= 0:
+            del _restoring[state["build_id"]]
+    prune(state["image_type"])
+
+
+async def restoring(state: GoldenState | None, pipeline):
+    """Await a create pipeline (or batch) given `state` by lookup(), then release it."""
+    try:
+        return await pipeline
+    finally:
+        if state:
+            await run_blocking(release, state)
+
+
+def _backing_files() -> set[str]:
+    """Backing files of the qcow2 images in INSTANCE_DIR."""
+    backing = set()
+    for path in INSTANCE_DIR.glob("*.qcow2"):
+        try:
+            backing.add(read_header(path)["backing_file"])
+        except (OSError, Qcow2Error):
+            continue
+    return backing
+
+
+def prune(image_type: str) -> None:
+    """
+    Remove an image's superseded golden builds (blocking).
+
+    Builds other than the current one, not being built and not handed out
+    to a create request lose their memory.save; their directory goes too
+    unless a VM disk is still an overlay on their disk.qcow2.
+    """
+    image_dir = GOLDEN_DIR / image_type
+    try:
+        current_id = json.loads(_current_file(image_type).read_text())["build_id"]
+    except (FileNotFoundError, ValueError):
+        current_id = None
+
+    with _lock:
+        if not image_dir.is_dir():
+            return
+        backing = _backing_files()
+        for build_dir in image_dir.iterdir():
+            build_id = build_dir.name
+            if not build_dir.is_dir() or build_id == current_id:
+                continue
+            if build_id in _restoring or build_id in _active_builds:
+                continue
+            if str(build_dir / "disk.qcow2") in backing:
+                state_path = build_dir / "memory.save"
+                try:
+                    state_path.unlink()
+                except FileNotFoundError:
+                    continue
+                except OSError as e:
+                    logger.warning(f"Failed to prune {state_path}: {e}")
+                    continue
+                logger.info(f"Pruned memory state of golden build {build_id} ({image_type})")
+            else:
+                shutil.rmtree(build_dir, ignore_errors=True)
+                logger.info(f"Pruned golden build {build_id} ({image_type})")
+
+
+async def build(image_type: str) -> GoldenState | None:
+    """
+    Boot the image once, let it settle and save its memory state.
+
+    The VM is booted without an SSH key, like a warm pool VM. Once
+    cloud-init is done and the guest has been idle for
+    GOLDEN_SETTLE_SECONDS, its NIC is taken down (so restored VMs don't
+    all come back with its address) and the domain is saved and
+    undefined. The new build then becomes the image's current one.
+
+    Returns:
+        The new state, or None if the build failed (it is cleaned up)
+    """
+    build_id = str(uuid.uuid4())
+    name = golden_domain_name(image_type, build_id)
+    template_path = IMAGES[image_type]["template_path"]
+    build_dir = GOLDEN_DIR / image_type / build_id
+    disk_path = build_dir / "disk.qcow2"
+    state_path = build_dir / "memory.save"
+    mac_address = generate_mac_address(build_id)
+    stamp = await run_blocking(template_stamp, template_path)
+
+    state: dict[str, str | None] = {"iso_path": None, "libvirt_uuid": None}
+
+    async def build_iso():
+        iso_path = await run_blocking(prepare_cloud_config, build_id, name, image_type, "")
+        state["iso_path"] = str(iso_path) if iso_path else None
+
+    async def clone_disk():
+        await run_blocking(lambda: build_dir.mkdir(parents=True))
+        await run_blocking(create_overlay, disk_path, template_path)
+
+    async def start_domain():
+        xml = build_domain_xml(
+            vm_id=build_id,
+            name=name,
+            disk_path=disk_path,
+            iso_path=state["iso_path"],
+            memory_mb=GOLDEN_MEMORY_MB,
+            vcpus=GOLDEN_VCPUS,
+            metadata_url=get_metadata_url(build_id)
+        )
+        state["libvirt_uuid"] = await run_blocking(create_domain, xml)
+
+    async def reserve_ip():
+        await run_blocking(reserve_vm_ip, build_id)
+
+    async def wait_for_agent():
+        await run_blocking(wait_for_guest_agent, build_id, GOLDEN_BOOT_TIMEOUT)
+
+    async def settle():
+        # Any exit status will do: a failed module doesn't make the state unusable
+        await run_blocking(
+            guest_exec, build_id, "/bin/sh",
+            ["-c", "cloud-init status --wait >/dev/null 2>&1; sync"],
+            None, GOLDEN_BOOT_TIMEOUT
+        )
+        await asyncio.sleep(GOLDEN_SETTLE_SECONDS)
+
+    async def save_state():
+        await run_blocking(guest_link_down, build_id, mac_address)
+        await run_blocking(save_domain, build_id, state_path)
+        await run_blocking(destroy_domain, build_id, True)
+        state["libvirt_uuid"] = None
+
+    stages = {
+        CONFIG_STAGE: ((), build_iso),
+        "cloning_disk": ((), clone_disk),
+        "creating_domain": ((CONFIG_STAGE, "cloning_disk"), start_domain),
+        "waiting_for_agent": (("creating_domain",), wait_for_agent),
+        "settling": (("waiting_for_agent",), settle),
+        "saving_state": (("settling",), save_state),
+    }
+    if STATIC_DHCP:
+        stages = {"reserving_ip": ((), reserve_ip), **stages}
+        stages["creating_domain"] = (("reserving_ip", CONFIG_STAGE, "cloning_disk"), start_domain)
+
+    _active_builds.add(build_id)
+    try:
+        timings: dict[str, dict] = {}
+        await run_stage_graph(None, stages, timings)
+
+        golden: GoldenState = {
+            "image_type": image_type,
+            "build_id": build_id,
+            "template_stamp": stamp,
+            "memory_mb": GOLDEN_MEMORY_MB,
+            "vcpus": GOLDEN_VCPUS,
+            "disk_path": str(disk_path),
+            "state_path": str(state_path),
+            "mac_address": mac_address,
+            "created_at": datetime.utcnow().isoformat(),
+        }
+        await run_blocking(_set_current, golden)
+        _errors.pop(image_type, None)
+        await run_blocking(prune, image_type)
+        logger.info(f"Golden state {build_id} ({image_type}) saved in {timings['total']['duration']}s")
+        return golden
+    except BaseException as e:
+        logger.error(f"Golden state build for {image_type} failed: {e!r}")
+        _errors[image_type] = str(e)
+        await run_blocking(_cleanup_build, build_id, build_dir, state["libvirt_uuid"])
+        if not isinstance(e, Exception):
+            raise
+        return None
+    finally:
+        # Restored VMs switch to their own MAC, so the reservation isn't needed
+        if STATIC_DHCP:
+            await run_blocking(release_vm_ip, build_id)
+        _active_builds.discard(build_id)
+
+
+def known_ids() -> set[str]:
+    """Build ids with files on disk or a build in progress (their ISOs and domains aren't orphans)."""
+    ids = set(_active_builds)
+    if GOLDEN_DIR.exists():
+        for image_dir in GOLDEN_DIR.iterdir():
+            if image_dir.is_dir():
+                ids.update(entry.name for entry in image_dir.iterdir() if entry.is_dir())
+    return ids
+
+
+def _set_current(state: GoldenState) -> None:
+    """Point the image at a new build (atomically)."""
+    path = _current_file(state["image_type"])
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(json.dumps(state, indent=2))
+    tmp_path.rename(path)
+
+
+def _cleanup_build(build_id: str, build_dir: Path, libvirt_uuid: str | None) -> None:
+    """Best-effort removal of a failed build."""
+    if libvirt_uuid:
+        try:
+            destroy_domain(libvirt_uuid, undefine=True)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to destroy golden domain: {e}")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    try:
+        delete_cloud_config(build_id)
+    except Exception as e:
+        logger.warning(f"Cleanup: failed to delete cloud-init config: {e}")
+
+
+async def _build_once(image_type: str) -> None:
+    try:
+        await build(image_type)
+    finally:
+        _building.discard(image_type)
+
+
+def schedule_build(image_type: str) -> None:
+    """Build a new golden state for an image in the background (one at a time per image)."""
+    if image_type in _building:
+        return
+    _building.add(image_type)
+    provisioner.submit(_build_once(image_type))
+
+
+async def start() -> None:
+    """Prune old builds and build the golden state of every configured image that lacks a current one."""
+    for image_type in GOLDEN_IMAGES:
+        if IMAGES[image_type]["storage"] != "qcow2":
+            logger.warning(f"Golden state for {image_type} skipped: needs qcow2 storage")
+            continue
+        await run_blocking(prune, image_type)
+        if await run_blocking(current, image_type) is None:
+            schedule_build(image_type)
+
+
+def stats() -> dict:
+    """Per-image golden state, restore/miss counters and build status."""
+    result = {}
+    for image_type in GOLDEN_IMAGES:
+        state = current(image_type)
+        result[image_type] = {
+            "image": IMAGES[image_type]["name"],
+            "build_id": state["build_id"] if state else None,
+            "created_at": state["created_at"] if state else None,
+            "building": image_type in _building,
+            "last_error": _errors.get(image_type),
+            "restores": _restores[image_type],
+            "misses": _misses[image_type],
+        }
+    return result
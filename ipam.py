@@ -0,0 +1,106 @@
+import logging
+import ipaddress
+import xml.etree.ElementTree as ET
+
+import libvirt
+
+from config import VM_NETWORK
+from SQL.IPS_related import reserve_ip, release_ip
+from libvirt_client import connection
+from network import generate_mac_address
+from lease_watcher import watcher as lease_watcher
+
+logger = logging.getLogger(__name__)
+
+# DHCP range of VM_NETWORK, read once from the network XML
+_dhcp_range: tuple[str, str] | None = None
+
+_UPDATE_FLAGS = (
+    libvirt.VIR_NETWORK_UPDATE_AFFECT_LIVE | libvirt.VIR_NETWORK_UPDATE_AFFECT_CONFIG
+)
+
+
+def get_dhcp_range() -> tuple[str, str]:
+    """Return (start, end) of the VM network's IPv4 DHCP range."""
+    global _dhcp_range
+    if _dhcp_range is None:
+        with connection() as conn:
+            root = ET.fromstring(conn.networkLookupByName(VM_NETWORK).XMLDesc(0))
+        for ip in root.findall("ip"):
+            if ip.get("family", "ipv4") != "ipv4":
+                continue
+            dhcp_range = ip.find("dhcp/range")
+            if dhcp_range is not None:
+                _dhcp_range = (dhcp_range.get("start"), dhcp_range.get("end"))
+                break
+        else:
+            raise RuntimeError(f"Network {VM_NETWORK} has no IPv4 DHCP range")
+    return _dhcp_range
+
+
+def iter_range(start: str, end: str) -> list[str]:
+    """All addresses from start to end, inclusive."""
+    first = int(ipaddress.IPv4Address(start))
+    last = int(ipaddress.IPv4Address(end))
+    return [str(ipaddress.IPv4Address(n)) for n in range(first, last + 1)]
+
+
+def _host_xml(mac: str, ip: str) -> str:
+    return f"<host mac='{mac}' ip='{ip}'/>"
+
+
+def reserve_vm_ip(vm_id: str) -> str:
+    """
+    Pick an address for a VM and pin it to the VM's MAC in the libvirt network.
+
+    Must run before the domain boots: dnsmasq then answers the VM's first
+    DHCP request with this address, so no IP discovery is needed.
+
+    Returns:
+        The reserved IPv4 address
+    """
+    mac = generate_mac_address(vm_id)
+    ip = reserve_ip(
+        vm_id,
+        mac,
+        iter_range(*get_dhcp_range()),
+        exclude=lease_watcher.leased_ips()
+    )
+    
+    try:
+        with connection() as conn:
+            conn.networkLookupByName(VM_NETWORK).update(
+                libvirt.VIR_NETWORK_UPDATE_COMMAND_ADD_LAST,
+                libvirt.VIR_NETWORK_SECTION_IP_DHCP_HOST,
+                -1,
+                _host_xml(mac, ip),
+                _UPDATE_FLAGS
+            )
+    except libvirt.libvirtError:
+        release_ip(vm_id)
+        raise
+    
+    logger.info(f"Added DHCP reservation {mac} -> {ip} for VM {vm_id}")
+    return ip
+
+
+def release_vm_ip(vm_id: str) -> None:
+    """Drop a VM's DHCP reservation and free its address (no-op if it has none)."""
+    allocation = release_ip(vm_id)
+    if allocation is None:
+        return
+    
+    try:
+        with connection() as conn:
+            conn.networkLookupByName(VM_NETWORK).update(
+                libvirt.VIR_NETWORK_UPDATE_COMMAND_DELETE,
+                libvirt.VIR_NETWORK_SECTION_IP_DHCP_HOST,
+                -1,
+                _host_xml(allocation["mac"], allocation["ip"]),
+                _UPDATE_FLAGS
+            )
+    except libvirt.libvirtError as e:
+        # Already gone from the network definition; the address is free either way
+        logger.warning(f"Failed to remove DHCP reservation for VM {vm_id}: {e}")
+    
+    logger.info(f"Released {allocation['ip']} from VM {vm_id}")
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import ctypes
+import select
+import asyncio
+import logging
+import threading
+from pathlib import Path
+
+from config import LEASES_FILE
+
+logger = logging.getLogger(__name__)
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+
+def parse_leases(content: str, now: float | None = None) -> dict[str, str]:
+    """
+    Parse a dnsmasq lease database into {mac: ip}.
+
+    Accepts both the classic `<network>.leases` format
+    ("expiry mac ip hostname client-id" per line) and the JSON
+    `<bridge>.status` file written by libvirt's leases helper.
+    Expired leases are skipped (expiry 0 means infinite).
+    """
+    now = time.time() if now is None else now
+    leases = {}
+
+    if content.lstrip().startswith("["):
+        for entry in json.loads(content):
+            expiry = int(entry.get("expiry-time", 0))
+            if expiry and expiry < now:
+                continue
+            if entry.get("mac-address") and entry.get("ip-address"):
+                leases[entry["mac-address"].lower()] = entry["ip-address"]
+        return leases
+
+    for line in content.splitlines():
+        parts = line.split()
+        if len(parts) < 3 or parts[0] == "duid":
+            continue
+        expiry = int(parts[0]) if parts[0].isdigit() else 0
+        if expiry and expiry < now:
+            continue
+        leases[parts[1].lower()] = parts[2]
+    return leases
+
+
+class LeaseWatcher:
+    """
+    Shared MAC -> IP index over the libvirt network's dnsmasq lease file.
+
+    One background thread watches the lease directory with inotify (or
+    polls the file's stat when inotify is unavailable), re-indexes only
+    the lease lines that changed, and wakes coroutines waiting for a MAC
+    as soon as it shows up.
+    """
+
+    def __init__(self, leases_file: Path, poll_interval: float = 1.0):
+        self.leases_file = Path(leases_file)
+        self.poll_interval = poll_interval
+        self._index: dict[str, str] = {}
+        self._lines: set[str] = set()
+        self._stat_key = None
+        self._waiters: dict[str, list[asyncio.Future]] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._inotify_fd: int | None = None
+
+    @property
+    def available(self) -> bool:
+        """True if the lease directory exists (the file appears with the first lease)."""
+        return self.leases_file.parent.is_dir()
+
+    def lookup(self, mac_address: str) -> str | None:
+        with self._lock:
+            return self._index.get(mac_address.lower())
+
+    def leased_ips(self) -> set[str]:
+        """Addresses currently leased by dnsmasq (to any MAC)."""
+        with self._lock:
+            return set(self._index.values())
+
+    def refresh(self) -> None:
+        """Re-read the lease file if it changed and update the index."""
+        try:
+            st = self.leases_file.stat()
+        except FileNotFoundError:
+            return
+        stat_key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if stat_key == self._stat_key:
+            return
+        self._stat_key = stat_key
+
+        content = self.leases_file.read_text()
+        if content.lstrip().startswith("["):
+            # JSON status file: no stable lines to diff, re-index it whole
+            self._apply(parse_leases(content), replace=True)
+            return
+
+        lines = {line for line in content.splitlines() if line.strip()}
+        added = lines - self._lines
+        removed = self._lines - lines
+        self._lines = lines
+        if added or removed:
+            gone = parse_leases("\n".join(removed), now=0)
+            self._apply(parse_leases("\n".join(added)), gone=gone)
+
+    def _apply(self, leases: dict[str, str], gone: dict[str, str] | None = None,
+               replace: bool = False) -> None:
+        wakeups = []
+        with self._lock:
+            if replace:
+                self._index = dict(leases)
+            else:
+                for mac, ip in (gone or {}).items():
+                    if mac not in leases and self._index.get(mac) == ip:
+                        del self._index[mac]
+                self._index.update(leases)
+            for mac, ip in leases.items():
+                for future in self._waiters.pop(mac, []):
+                    wakeups.append((future, ip))
+
+        for future, ip in wakeups:
+            future.get_loop().call_soon_threadsafe(_resolve, future, ip)
+
+    async def wait_for_ip(self, mac_address: str, timeout: float = 60) -> str:
+        """
+        Wait until `mac_address` holds a lease and return its IP.
+
+        Raises:
+            TimeoutError: If no lease shows up within timeout
+        """
+        self.start()
+        mac = mac_address.lower()
+        future = asyncio.get_running_loop().create_future()
+        with self._lock:
+            ip = self._index.get(mac)
+            if ip:
+                return ip
+            self._waiters.setdefault(mac, []).append(future)
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"No DHCP lease for {mac} within {timeout}s")
+        finally:
+            with self._lock:
+                waiters = self._waiters.get(mac, [])
+                if future in waiters:
+                    waiters.remove(future)
+                if not waiters:
+                    self._waiters.pop(mac, None)
+
+    def start(self) -> None:
+        """Start the watcher thread (idempotent)."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._inotify_fd = self._open_inotify()
+        self.refresh()
+        self._thread = threading.Thread(target=self._run, name="lease-watcher", daemon=True)
+        self._thread.start()
+        mode = "inotify" if self._inotify_fd is not None else "polling"
+        logger.info(f"Watching {self.leases_file} for DHCP leases ({mode})")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _open_inotify(self) -> int | None:
+        if not self.available:
+            return None
+        try:
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+            # Watch the directory: dnsmasq/libvirt may replace the file
+            if libc.inotify_add_watch(fd, str(self.leases_file.parent).encode(), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            if self._inotify_fd is not None:
+                ready, _, _ = select.select([self._inotify_fd], [], [], self.poll_interval)
+                if ready:
+                    try:
+                        os.read(self._inotify_fd, 64 * 1024)  # drain; any event means re-check
+                    except BlockingIOError:
+                        pass
+            else:
+                self._stop.wait(self.poll_interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.warning(f"Failed to read leases from {self.leases_file}: {e}")
+
+
+def _resolve(future: asyncio.Future, ip: str) -> None:
+    if not future.done():
+        future.set_result(ip)
+
+
+# Shared watcher for the VM network
+watcher = LeaseWatcher(LEASES_FILE)
@@ -1,15 +1,33 @@
 import libvirt
+import libvirt_qemu
+import base64
+import json
+import time
 import logging
 import jinja2
+import xml.etree.ElementTree as ET
 from pathlib import Path
 
-from config import LIBVIRT_URI, TEMPLATE_DIR, VM_NETWORK, DEFAULT_MEMORY_MB, DEFAULT_VCPUS
+from config import (
+    LIBVIRT_URI,
+    LIBVIRT_POOL_SIZE,
+    LIBVIRT_KEEPALIVE_INTERVAL,
+    TEMPLATE_DIR,
+    VM_NETWORK,
+    DEFAULT_MEMORY_MB,
+    DEFAULT_VCPUS
+)
 from network import generate_mac_address
+from libvirt_pool import ConnectionPool
 
 logger = logging.getLogger(__name__)
 
-# Global connection cache
-_conn = None
+# Shared connection pool; use `with connection() as conn:`
+pool = ConnectionPool(
+    LIBVIRT_URI,
+    LIBVIRT_POOL_SIZE,
+    keepalive_interval=LIBVIRT_KEEPALIVE_INTERVAL
+)
 
 # Jinja2 for XML rendering
 env = jinja2.Environment(
@@ -19,22 +37,24 @@ env = jinja2.Environment(
 )
 
 
-def get_conn() -> libvirt.virConnect:
-    """Get or create libvirt connection."""
-    global _conn
-    if _conn is None or not _conn.isAlive():
-        _conn = libvirt.open(LIBVIRT_URI)
-        logger.info(f"Connected to libvirt at {LIBVIRT_URI}")
-    return _conn
+def connection(timeout: float | None = None):
+    """Check out a pooled libvirt connection (context manager)."""
+    return pool.connection(timeout)
 
 
 def build_domain_xml(
     vm_id: str,
     name: str,
     disk_path: Path,
-    iso_path: Path,
+    iso_path: Path | None,
     memory_mb: int = DEFAULT_MEMORY_MB,
-    vcpus: int = DEFAULT_VCPUS
+    vcpus: int = DEFAULT_VCPUS,
+    metadata_url: str | None = None,
+    disk_format: str = "qcow2",
+    disk_pool: str | None = None,
+    disk_volume: str | None = None,
+    disk_iops: int = 0,
+    disk_bytes_per_sec: int = 0
 ) -> str:
     """
     Render domain XML from template.
@@ -42,10 +62,16 @@ def build_domain_xml(
     Args:
         vm_id: UUID for the VM
         name: Hostname
-        disk_path: Path to qcow2 disk
-        iso_path: Path to cloud-init ISO
+        disk_path: Path to the disk file
+        iso_path: Path to cloud-init ISO (None: no cdrom)
         memory_mb: RAM in megabytes
         vcpus: Number of virtual CPUs
+        metadata_url: NoCloud seed URL passed in the SMBIOS serial
+        disk_format: Disk image format (qcow2, raw)
+        disk_pool: libvirt storage pool holding the disk (None: disk_path is a file)
+        disk_volume: Volume name in disk_pool
+        disk_iops: Disk IOPS limit (0: unlimited)
+        disk_bytes_per_sec: Disk throughput limit in bytes/sec (0: unlimited)
     
     Returns:
         Complete XML string for libvirt
@@ -64,9 +90,15 @@ def build_domain_xml(
         memory_kb=memory_kb,
         vcpus=vcpus,
         disk_path=str(disk_path),
-        iso_path=str(iso_path),
+        iso_path=str(iso_path) if iso_path else None,
         network=VM_NETWORK,
-        mac_address=mac_address
+        mac_address=mac_address,
+        metadata_url=metadata_url,
+        disk_format=disk_format,
+        disk_pool=disk_pool,
+        disk_volume=disk_volume,
+        disk_iops=disk_iops,
+        disk_bytes_per_sec=disk_bytes_per_sec
     )
     
     return xml
@@ -82,18 +114,17 @@ def create_domain(xml: str) -> str:
     Returns:
         Libvirt UUID string
     """
-    conn = get_conn()
-    
-    # Define (persistent) but don't start yet
-    dom = conn.defineXML(xml)
-    
-    if dom is None:
-        raise RuntimeError("Failed to define domain")
-    
-    # Start the VM
-    dom.create()
-    
-    uuid = dom.UUIDString()
+    with connection() as conn:
+        # Define (persistent) but don't start yet
+        dom = conn.defineXML(xml)
+        
+        if dom is None:
+            raise RuntimeError("Failed to define domain")
+        
+        # Start the VM
+        dom.create()
+        
+        uuid = dom.UUIDString()
     logger.info(f"Created and started VM {uuid}")
     
     return uuid
@@ -107,16 +138,231 @@ def destroy_domain(vm_uuid: str, undefine: bool = True) -> None:
         vm_uuid: Libvirt UUID
         undefine: If True, remove persistent definition
     """
-    conn = get_conn()
-    dom = conn.lookupByUUIDString(vm_uuid)
-    
-    if dom.isActive():
-        dom.destroy()
-        logger.info(f"Destroyed running VM {vm_uuid}")
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        
+        if dom.isActive():
+            dom.destroy()
+            logger.info(f"Destroyed running VM {vm_uuid}")
+        
+        if undefine:
+            dom.undefine()
+            logger.info(f"Undefined VM {vm_uuid}")
+
+
+# Target of the VM's disk in domain.xml.j2
+DISK_TARGET = "vda"
+
+
+def resize_block(vm_uuid: str, size_bytes: int) -> bool:
+    """
+    Grow a running VM's disk online (the guest sees the new size at once).
+
+    Growing the partition and filesystem is left to the guest (cloud-init's
+    growpart does it on the next boot).
+
+    Returns:
+        False if the domain isn't running; resize the image offline then
+
+    Raises:
+        ValueError: If `size_bytes` is smaller than the disk
+    """
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        if not dom.isActive():
+            return False
+        
+        capacity = dom.blockInfo(DISK_TARGET)[0]
+        if size_bytes < capacity:
+            raise ValueError(f"Disk can only grow (currently {capacity} bytes)")
+        dom.blockResize(DISK_TARGET, size_bytes, libvirt.VIR_DOMAIN_BLOCK_RESIZE_BYTES)
+    logger.info(f"Resized disk of VM {vm_uuid} to {size_bytes} bytes")
+    return True
+
+
+def set_block_iotune(vm_uuid: str, iops: int, bytes_per_sec: int) -> None:
+    """
+    Set a VM's disk IOPS and bytes/sec limits (0: unlimited).
+
+    Applied to the running domain, if any, and to its persistent definition.
+    """
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG
+        if dom.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        dom.setBlockIoTune(
+            DISK_TARGET,
+            {"total_iops_sec": iops, "total_bytes_sec": bytes_per_sec},
+            flags
+        )
+    logger.info(f"Set disk limits of VM {vm_uuid}: {iops} IOPS, {bytes_per_sec} bytes/sec")
+
+
+def get_block_iotune(vm_uuid: str) -> dict:
+    """Current disk I/O limits of a VM, as reported by libvirt."""
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        return dom.blockIoTune(DISK_TARGET, libvirt.VIR_DOMAIN_AFFECT_CURRENT)
+
+
+_SNAPSHOT_XML = """<domainsnapshot>
+  <name>{name}</name>
+  <disks>
+    <disk name='{target}' snapshot='external'>
+      <driver type='qcow2'/>
+      <source file='{overlay}'/>
+    </disk>
+  </disks>
+</domainsnapshot>"""
+
+
+def create_external_snapshot(vm_uuid: str, name: str, overlay_path: Path, quiesce: bool = True) -> bool:
+    """
+    Freeze a VM's disk with a disk-only external snapshot.
+
+    The current image becomes the (read-only) snapshot and the VM goes on
+    writing to a new qcow2 overlay at `overlay_path`. libvirt keeps no
+    snapshot metadata: the caller tracks snapshots, and the domain can
+    still be undefined as usual.
+
+    Args:
+        vm_uuid: Libvirt UUID
+        name: Snapshot name
+        overlay_path: New image the VM continues on
+        quiesce: Freeze guest filesystems through the guest agent while
+            the snapshot is taken (running VMs only); if the agent doesn't
+            answer, the snapshot is taken crash-consistent instead
+
+    Returns:
+        True if the guest was quiesced
+    """
+    xml = _SNAPSHOT_XML.format(name=name, target=DISK_TARGET, overlay=overlay_path)
+    flags = (
+        libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+        | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+        | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA
+    )
     
-    if undefine:
-        dom.undefine()
-        logger.info(f"Undefined VM {vm_uuid}")
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        if quiesce and dom.isActive():
+            try:
+                dom.snapshotCreateXML(xml, flags | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_QUIESCE)
+                logger.info(f"Created quiesced snapshot {name} of VM {vm_uuid}")
+                return True
+            except libvirt.libvirtError as e:
+                logger.warning(f"Quiesced snapshot of VM {vm_uuid} failed ({e}), taking it without")
+        dom.snapshotCreateXML(xml, flags)
+    logger.info(f"Created snapshot {name} of VM {vm_uuid}")
+    return False
+
+
+def switch_disk_source(vm_uuid: str, disk_path: Path) -> None:
+    """
+    Point a VM's disk at another qcow2 image, e.g. a new overlay on a snapshot.
+
+    A running VM is powered off for the switch and started again.
+    """
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        was_active = dom.isActive()
+        if was_active:
+            dom.destroy()
+        
+        root = ET.fromstring(dom.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        for disk in root.iter("disk"):
+            target = disk.find("target")
+            if target is None or target.get("dev") != DISK_TARGET:
+                continue
+            disk.set("type", "file")
+            disk.find("driver").set("type", "qcow2")
+            source = disk.find("source")
+            source.attrib.clear()
+            source.set("file", str(disk_path))
+            for backing in disk.findall("backingStore"):
+                disk.remove(backing)
+        conn.defineXML(ET.tostring(root, encoding="unicode"))
+        
+        if was_active:
+            dom.create()
+    logger.info(f"Switched disk of VM {vm_uuid} to {disk_path}")
+
+
+def save_domain(vm_uuid: str, state_path: Path) -> None:
+    """Save a running VM's memory state to a file (the domain stops)."""
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        dom.save(str(state_path))
+    logger.info(f"Saved memory state of VM {vm_uuid} to {state_path}")
+
+
+def _rewrite_restore_xml(xml: str, vm_id: str, name: str, disk_path: Path) -> str:
+    """
+    Domain XML of a save image, re-targeted at a new VM.
+
+    Only host-side details change (name, UUID, disk file, per-domain
+    paths and labels); the guest ABI, including the MAC address, must
+    stay as saved.
+    """
+    root = ET.fromstring(xml)
+    root.find("name").text = name
+    root.find("uuid").text = vm_id
+    for disk in root.iter("disk"):
+        target = disk.find("target")
+        if target is not None and target.get("dev") == DISK_TARGET:
+            disk.find("source").set("file", str(disk_path))
+            for backing in disk.findall("backingStore"):
+                disk.remove(backing)
+    # Paths libvirt generated for the saved domain; let it generate new ones
+    devices = root.find("devices")
+    for tag in ("channel", "serial", "console"):
+        for device in devices.findall(tag):
+            for source in device.findall("source"):
+                device.remove(source)
+    for seclabel in root.findall("seclabel"):
+        for child in seclabel.findall("label") + seclabel.findall("imagelabel"):
+            seclabel.remove(child)
+    return ET.tostring(root, encoding="unicode")
+
+
+def restore_domain(state_path: Path, vm_id: str, name: str, disk_path: Path, mac_address: str) -> str:
+    """
+    Start a new VM from a saved memory state, on its own disk.
+
+    The domain resumes with the saved MAC address (part of the guest
+    ABI); its persistent definition gets `mac_address`, which the guest
+    must switch to itself (see golden.reseed_guest).
+
+    Returns:
+        Libvirt UUID string
+    """
+    with connection() as conn:
+        xml = _rewrite_restore_xml(conn.saveImageGetXMLDesc(str(state_path), 0), vm_id, name, disk_path)
+        conn.restoreFlags(str(state_path), xml, libvirt.VIR_DOMAIN_SAVE_RUNNING)
+        dom = conn.lookupByUUIDString(vm_id)
+        
+        # Restored domains are transient; define them like create_domain does
+        root = ET.fromstring(dom.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+        for mac in root.iter("mac"):
+            mac.set("address", mac_address)
+        conn.defineXML(ET.tostring(root, encoding="unicode"))
+        uuid = dom.UUIDString()
+    logger.info(f"Restored VM {uuid} from {state_path}")
+    return uuid
+
+
+# virDomainState -> name reported by the API
+DOMAIN_STATES = {
+    libvirt.VIR_DOMAIN_NOSTATE: 'nostate',
+    libvirt.VIR_DOMAIN_RUNNING: 'running',
+    libvirt.VIR_DOMAIN_BLOCKED: 'blocked',
+    libvirt.VIR_DOMAIN_PAUSED: 'paused',
+    libvirt.VIR_DOMAIN_SHUTDOWN: 'shutdown',
+    libvirt.VIR_DOMAIN_SHUTOFF: 'shutoff',
+    libvirt.VIR_DOMAIN_CRASHED: 'crashed',
+    libvirt.VIR_DOMAIN_PMSUSPENDED: 'suspended'
+}
 
 
 def get_domain_state(vm_uuid: str) -> str:
@@ -125,33 +371,228 @@ def get_domain_state(vm_uuid: str) -> str:
     
     Returns: 'running', 'paused', 'shutoff', etc.
     """
-    conn = get_conn()
-    dom = conn.lookupByUUIDString(vm_uuid)
-    
-    state, _ = dom.state()
-    states = {
-        libvirt.VIR_DOMAIN_NOSTATE: 'nostate',
-        libvirt.VIR_DOMAIN_RUNNING: 'running',
-        libvirt.VIR_DOMAIN_BLOCKED: 'blocked',
-        libvirt.VIR_DOMAIN_PAUSED: 'paused',
-        libvirt.VIR_DOMAIN_SHUTDOWN: 'shutdown',
-        libvirt.VIR_DOMAIN_SHUTOFF: 'shutoff',
-        libvirt.VIR_DOMAIN_CRASHED: 'crashed',
-        libvirt.VIR_DOMAIN_PMSUSPENDED: 'suspended'
+    with connection() as conn:
+        state, _ = conn.lookupByUUIDString(vm_uuid).state()
+    return DOMAIN_STATES.get(state, 'unknown')
+
+
+def get_domain_states() -> dict[str, str]:
+    """
+    Get the state of every domain in a single libvirt call.
+    
+    Returns: {uuid: 'running' | 'paused' | 'shutoff' | ...}
+    """
+    with connection() as conn:
+        # One RPC for the whole host; UUIDString() on the returned domains is local
+        stats = conn.getAllDomainStats(libvirt.VIR_DOMAIN_STATS_STATE)
+    return {
+        dom.UUIDString(): DOMAIN_STATES.get(record.get('state.state'), 'unknown')
+        for dom, record in stats
     }
-    return states.get(state, 'unknown')
 
 
 def list_all_domains() -> list[dict]:
     """List all domains (for admin/debug)."""
-    conn = get_conn()
-    domains = []
+    with connection() as conn:
+        stats = conn.getAllDomainStats(libvirt.VIR_DOMAIN_STATS_STATE)
     
-    for dom in conn.listAllDomains():
-        domains.append({
+    return [
+        {
             'uuid': dom.UUIDString(),
             'name': dom.name(),
-            'state': get_domain_state(dom.UUIDString())
-        })
+            'state': DOMAIN_STATES.get(record.get('state.state'), 'unknown')
+        }
+        for dom, record in stats
+    ]
+
+
+def list_domain_disks() -> dict[str, dict]:
+    """
+    Every domain with its disk sources (for the reconciler).
+
+    Returns:
+        {uuid: {"name": ..., "active": bool, "files": [paths],
+                "volumes": [(pool, volume)]}}
+    """
+    with connection() as conn:
+        domains = {}
+        for dom in conn.listAllDomains(0):
+            files, volumes = [], []
+            for source in ET.fromstring(dom.XMLDesc(0)).findall("devices/disk/source"):
+                if source.get("file"):
+                    files.append(source.get("file"))
+                elif source.get("pool"):
+                    volumes.append((source.get("pool"), source.get("volume")))
+            domains[dom.UUIDString()] = {
+                "name": dom.name(),
+                "active": bool(dom.isActive()),
+                "files": files,
+                "volumes": volumes,
+            }
+    return domains
+
+
+def guest_agent_command(vm_uuid: str, command: dict, timeout: int = 10):
+    """
+    Send a command to the qemu guest agent (org.qemu.guest_agent.0 channel).
+
+    Returns:
+        The agent's "return" payload
+    """
+    with connection() as conn:
+        dom = conn.lookupByUUIDString(vm_uuid)
+        reply = libvirt_qemu.qemuAgentCommand(dom, json.dumps(command), timeout, 0)
+    return json.loads(reply).get("return")
+
+
+def wait_for_guest_agent(vm_uuid: str, timeout: int = 120) -> None:
+    """Block until the guest agent answers guest-ping."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            guest_agent_command(vm_uuid, {"execute": "guest-ping"}, timeout=5)
+            return
+        except libvirt.libvirtError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Guest agent of VM {vm_uuid} not up within {timeout}s")
+            time.sleep(1)
+
+
+def guest_exec(
+    vm_uuid: str,
+    path: str,
+    args: list[str] | None = None,
+    input_data: bytes | None = None,
+    timeout: int = 30
+) -> dict:
+    """
+    Run a program inside the guest through the guest agent and wait for it.
+
+    Args:
+        vm_uuid: Libvirt UUID
+        path: Program to run inside the guest
+        args: Program arguments
+        input_data: Bytes fed to the program's stdin
+        timeout: Seconds to wait for the program to exit
+
+    Returns:
+        guest-exec-status payload (exitcode, out-data, err-data)
+
+    Raises:
+        RuntimeError: If the program exits non-zero
+    """
+    arguments = {"path": path, "arg": args or [], "capture-output": True}
+    if input_data is not None:
+        arguments["input-data"] = base64.b64encode(input_data).decode()
+    
+    pid = guest_agent_command(
+        vm_uuid, {"execute": "guest-exec", "arguments": arguments}
+    )["pid"]
+    
+    deadline = time.monotonic() + timeout
+    while True:
+        status = guest_agent_command(
+            vm_uuid, {"execute": "guest-exec-status", "arguments": {"pid": pid}}
+        )
+        if status.get("exited"):
+            break
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{path} did not finish in VM {vm_uuid} within {timeout}s")
+        time.sleep(0.2)
     
-    return domains
\ No newline at end of file
+    if status.get("exitcode", 0) != 0:
+        stderr = base64.b64decode(status.get("err-data", "")).decode(errors="replace")
+        raise RuntimeError(f"{path} exited with {status.get('exitcode')} in VM {vm_uuid}: {stderr}")
+    
+    return status
+
+
+# Sets hostname and appends the SSH key (stdin) for the image's user.
+# Plain POSIX sh + awk so it works on busybox (Alpine) as well.
+_SET_IDENTITY_SCRIPT = """
+set -e
+name="$1"
+user="$2"
+hostname "$name"
+echo "$name" > /etc/hostname
+printf '127.0.1.1 %s\\n' "$name" >> /etc/hosts
+home=$(awk -F: -v u="$user" '$1 == u { print $6 }' /etc/passwd)
+mkdir -p "$home/.ssh"
+cat >> "$home/.ssh/authorized_keys"
+chmod 700 "$home/.ssh"
+chmod 600 "$home/.ssh/authorized_keys"
+chown -R "$user" "$home/.ssh"
+"""
+
+
+def set_guest_identity(vm_uuid: str, hostname: str, username: str, ssh_key: str) -> None:
+    """Apply hostname and SSH key to a running guest through the guest agent."""
+    guest_exec(
+        vm_uuid,
+        "/bin/sh",
+        ["-c", _SET_IDENTITY_SCRIPT, "sh", hostname, username],
+        input_data=(ssh_key.strip() + "\n").encode()
+    )
+    logger.info(f"Set hostname {hostname} and SSH key for {username} in VM {vm_uuid}")
+
+
+# Takes the NIC with MAC $1 down, so a saved memory state holds no address
+# that every VM restored from it would bring back up.
+_LINK_DOWN_SCRIPT = """
+set -e
+for dev in /sys/class/net/*; do
+    if [ "$(cat "$dev/address")" = "$1" ]; then
+        ip link set dev "$(basename "$dev")" down
+    fi
+done
+"""
+
+# After a restore: move the NIC from the saved MAC ($1) to the VM's own ($2),
+# give the guest a fresh machine-id and SSH host keys, and get a lease for
+# the new MAC. Best effort across systemd-networkd, dhclient and udhcpc.
+_RESEED_SCRIPT = """
+set -e
+iface=""
+for dev in /sys/class/net/*; do
+    if [ "$(cat "$dev/address")" = "$1" ]; then
+        iface=$(basename "$dev")
+    fi
+done
+[ -n "$iface" ] || { echo "no interface with MAC $1" >&2; exit 1; }
+ip link set dev "$iface" down
+ip link set dev "$iface" address "$2"
+ip link set dev "$iface" up
+if [ -w /etc/machine-id ]; then
+    rm -f /etc/machine-id
+    systemd-machine-id-setup >/dev/null 2>&1 || dbus-uuidgen > /etc/machine-id || true
+fi
+rm -f /etc/ssh/ssh_host_*
+ssh-keygen -A >/dev/null
+systemctl restart ssh 2>/dev/null || systemctl restart sshd 2>/dev/null || rc-service sshd restart 2>/dev/null || true
+if command -v networkctl >/dev/null && networkctl status "$iface" >/dev/null 2>&1; then
+    networkctl reconfigure "$iface"
+elif command -v dhclient >/dev/null; then
+    dhclient -r "$iface" 2>/dev/null || true
+    dhclient "$iface"
+else
+    udhcpc -i "$iface" -n -q
+fi
+"""
+
+
+def guest_link_down(vm_uuid: str, mac_address: str) -> None:
+    """Take a guest's NIC down through the guest agent."""
+    guest_exec(vm_uuid, "/bin/sh", ["-c", _LINK_DOWN_SCRIPT, "sh", mac_address])
+
+
+def reseed_guest(vm_uuid: str, saved_mac: str, mac_address: str) -> None:
+    """
+    Make a VM restored from a shared memory state unique on the network.
+
+    Syncs the guest clock (it resumes at the time of the save), switches
+    its NIC to `mac_address` and renews its DHCP lease, and regenerates
+    machine-id and SSH host keys.
+    """
+    guest_agent_command(vm_uuid, {"execute": "guest-set-time"})
+    guest_exec(vm_uuid, "/bin/sh", ["-c", _RESEED_SCRIPT, "sh", saved_mac, mac_address], timeout=60)
+    logger.info(f"Reseeded restored VM {vm_uuid} with MAC {mac_address}")
@@ -0,0 +1,233 @@
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+import libvirt
+
+logger = logging.getLogger(__name__)
+
+# virEventRegisterDefaultImpl may only be called once per process, and
+# before the connections that rely on it (keepalives, domain events) open
+_event_loop_lock = threading.Lock()
+_event_loop_thread: threading.Thread | None = None
+
+
+def _run_event_loop() -> None:
+    while True:
+        if libvirt.virEventRunDefaultImpl() < 0:
+            logger.warning("libvirt event loop iteration failed")
+            time.sleep(1)
+
+
+def start_event_loop() -> None:
+    """Register libvirt's default event implementation and run it in a daemon thread (idempotent)."""
+    global _event_loop_thread
+    with _event_loop_lock:
+        if _event_loop_thread is not None:
+            return
+        libvirt.virEventRegisterDefaultImpl()
+        _event_loop_thread = threading.Thread(
+            target=_run_event_loop, name="libvirt-events", daemon=True
+        )
+        _event_loop_thread.start()
+
+
+class ConnectionPool:
+    """
+    Bounded pool of libvirt connections shared by the API and executor threads.
+
+    Each caller gets a connection to itself for the duration of a
+    `with pool.connection() as conn:` block. Connections send libvirt
+    keepalives, so a dead daemon closes them in the background and they
+    are replaced on their next checkout instead of probing on every call.
+    Opening is serialized and backs off exponentially while libvirt is
+    unreachable, so a restart doesn't turn into a reconnect storm.
+    """
+
+    def __init__(
+        self,
+        uri: str,
+        size: int,
+        keepalive_interval: int = 5,
+        keepalive_count: int = 3,
+        acquire_timeout: float = 30.0,
+        backoff_base: float = 0.5,
+        backoff_max: float = 30.0
+    ):
+        self.uri = uri
+        self.size = size
+        self.keepalive_interval = keepalive_interval
+        self.keepalive_count = keepalive_count
+        self.acquire_timeout = acquire_timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._idle: list[libvirt.virConnect] = []
+        self._open_count = 0
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self._connect_lock = threading.Lock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_error: libvirt.libvirtError | None = None
+        self._metrics = {
+            "acquisitions": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "peak_in_use": 0,
+            "connects": 0,
+            "reconnects": 0,
+            "connect_failures": 0,
+        }
+
+    def _open_connection(self) -> libvirt.virConnect:
+        start_event_loop()
+        conn = libvirt.open(self.uri)
+        if self.keepalive_interval > 0:
+            try:
+                conn.setKeepAlive(self.keepalive_interval, self.keepalive_count)
+            except libvirt.libvirtError as e:
+                # Drivers without an RPC transport (e.g. test:///) don't do keepalives
+                logger.debug(f"Keepalive not supported on {self.uri}: {e}")
+        return conn
+
+    def _open(self, deadline: float, reconnect: bool) -> libvirt.virConnect:
+        """Open a connection, backing off while libvirt keeps failing."""
+        with self._connect_lock:
+            while True:
+                delay = self._retry_at - time.monotonic()
+                if delay > 0:
+                    if time.monotonic() + delay > deadline:
+                        raise self._last_error or libvirt.libvirtError(
+                            f"libvirt at {self.uri} is unreachable"
+                        )
+                    time.sleep(delay)
+                try:
+                    conn = self._open_connection()
+                except libvirt.libvirtError as e:
+                    self._failures += 1
+                    self._last_error = e
+                    backoff = min(self.backoff_base * 2 ** (self._failures - 1), self.backoff_max)
+                    self._retry_at = time.monotonic() + backoff
+                    self._metrics["connect_failures"] += 1
+                    logger.warning(f"Failed to connect to libvirt at {self.uri}, retrying in {backoff}s: {e}")
+                    if self._retry_at > deadline:
+                        raise
+                    continue
+
+                if self._failures:
+                    logger.info(f"Reconnected to libvirt at {self.uri} after {self._failures} failures")
+                self._failures = 0
+                self._retry_at = 0.0
+                self._last_error = None
+                self._metrics["connects"] += 1
+                if reconnect:
+                    self._metrics["reconnects"] += 1
+                return conn
+
+    def _acquire(self, timeout: float | None) -> libvirt.virConnect:
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+        wait_start = time.monotonic()
+        with self._cond:
+            waited = False
+            while not self._idle and self._open_count >= self.size:
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(
+                        f"No libvirt connection free within {timeout or self.acquire_timeout}s "
+                        f"(pool size {self.size})"
+                    )
+                self._cond.wait(remaining)
+
+            waited_for = time.monotonic() - wait_start
+            self._in_use += 1
+            self._metrics["acquisitions"] += 1
+            self._metrics["peak_in_use"] = max(self._metrics["peak_in_use"], self._in_use)
+            if waited:
+                self._metrics["waits"] += 1
+                self._metrics["wait_time_total"] += waited_for
+                self._metrics["wait_time_max"] = max(self._metrics["wait_time_max"], waited_for)
+
+            conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                self._open_count += 1
+
+        reconnect = False
+        try:
+            # isAlive() is a local flag check; keepalive failures flip it
+            if conn is not None and not conn.isAlive():
+                self._close(conn)
+                conn = None
+                reconnect = True
+            if conn is None:
+                conn = self._open(deadline, reconnect)
+            return conn
+        except BaseException:
+            with self._cond:
+                self._open_count -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+    def _release(self, conn: libvirt.virConnect) -> None:
+        alive = conn.isAlive()
+        if not alive:
+            self._close(conn)
+        with self._cond:
+            self._in_use -= 1
+            if alive:
+                self._idle.append(conn)
+            else:
+                self._open_count -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _close(conn: libvirt.virConnect) -> None:
+        try:
+            conn.close()
+        except libvirt.libvirtError:
+            pass
+
+    @contextmanager
+    def connection(self, timeout: float | None = None):
+        """
+        Check out a connection for the duration of the block.
+
+        Raises:
+            TimeoutError: If all connections stay busy for `timeout`
+                (default: acquire_timeout) seconds
+            libvirt.libvirtError: If libvirt can't be reached in that time
+        """
+        conn = self._acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    def close(self) -> None:
+        """Close idle connections (checked-out ones are closed on release)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._open_count -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self) -> dict:
+        """Utilisation metrics for sizing the pool."""
+        with self._cond:
+            acquisitions = self._metrics["acquisitions"]
+            return {
+                "uri": self.uri,
+                "size": self.size,
+                "open": self._open_count,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "reachable": self._failures == 0,
+                **self._metrics,
+                "wait_ratio": round(self._metrics["waits"] / acquisitions, 3) if acquisitions else 0.0,
+                "wait_time_total": round(self._metrics["wait_time_total"], 3),
+                "wait_time_max": round(self._metrics["wait_time_max"], 3),
+            }
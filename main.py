@@ -4,7 +4,7 @@ import logging
 from contextlib import asynccontextmanager
 from typing import Annotated
 
-from fastapi import FastAPI, Header, HTTPException, Depends
+from fastapi import FastAPI, Header, HTTPException, Depends, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import FileResponse
@@ -16,35 +16,55 @@ from config import (
     MIN_MEMORY_MB, 
     MAX_MEMORY_MB, 
     MIN_VCPUS, 
-    MAX_VCPUS
+    MAX_VCPUS,
+    MAX_DISK_GB,
+    DEFAULT_DISK_IOPS,
+    DEFAULT_DISK_BYTES_PER_SEC,
+    MAX_DISK_IOPS,
+    MAX_DISK_BYTES_PER_SEC,
+    MAX_BATCH_SIZE,
+    BATCH_CONCURRENCY,
+    TEARDOWN_CONCURRENCY,
+    VMS_PAGE_SIZE,
+    MAX_VMS_PAGE_SIZE,
+    CLOUD_INIT_MODE
 )
-from SQL.database import init_db
-from SQL.USERS_related import get_user_by_api_key
-from SQL.VM_related import (
-    add_vm_record, 
-    get_vm_by_id, 
-    list_vms_by_owner, 
-    delete_vm_record,
-    VMRecord
+from SQL.database import init_db, transaction
+from SQL.VM_related import add_vm_records, VMRecord
+from SQL.SNAPSHOTS_related import (
+    get_snapshot,
+    list_snapshots
 )
-from libvirt_client import (
-    create_domain, 
-    build_domain_xml, 
-    destroy_domain, 
-    get_domain_state,
-    get_conn as get_libvirt_conn
+from SQL.OPERATIONS_related import (
+    add_operations,
+    get_operation,
+    get_latest_operation_for_vm,
+    OperationRecord
 )
-from storage import clone_base_image, delete_disk_image
-from cloudinit import create_config_iso, delete_config_iso
+from SQL.PORTS_related import release_ports
+from libvirt_client import pool as libvirt_pool
+from storage import get_disk_path, overlay_pool
+from cloudinit import get_iso_path
 from network import (
     allocate_port, 
-    add_port_forward, 
-    remove_port_forward,
-    poll_vm_ip
+    allocate_ports
 )
+import aio
+import db
+import provisioner
+import warm_pool
+import golden
+import forwarding
+import reconciler
+import snapshots
+from lease_watcher import watcher as lease_watcher
+from domain_cache import cache as domain_cache
+from metadata_server import server as metadata_server
+from provisioner import ProvisionSpec, ssh_connection_info
+from auth_service import require_admin
 
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -55,21 +75,77 @@ class AuthRequest(BaseModel):
     password: str
 
 
-class CreateVMRequest(BaseModel):
-    name: str
+class VMSpec(BaseModel):
     ssh_key: str
     image_type: str = "debian-12"
     memory_mb: int = 512
     vcpus: int = 1
+    disk_iops: int | None = None
+    disk_bytes_per_sec: int | None = None
+
+
+class CreateVMRequest(VMSpec):
+    name: str
+
+
+class SnapshotRequest(BaseModel):
+    name: str
+    quiesce: bool = True
+
+
+class CloneVMRequest(BaseModel):
+    name: str
+    ssh_key: str
+    snapshot_id: str | None = None
+
+
+class DiskResizeRequest(BaseModel):
+    size_gb: int
+
+
+class DiskLimitsRequest(BaseModel):
+    disk_iops: int | None = None
+    disk_bytes_per_sec: int | None = None
+
+
+class BatchCreateVMRequest(BaseModel):
+    spec: VMSpec
+    count: int | None = None
+    names: list[str] | None = None
+    name_prefix: str = "vm"
+    wait: bool = False
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     ensure_directories()
     init_db()
+    await aio.run(forwarding.backend.sync, await db.list_port_forwards())
+    # Before anything new is started: leftovers of the last run are orphans
+    try:
+        await reconciler.reconcile(dry_run=False, startup=True)
+    except Exception as e:
+        logger.error(f"Startup reconcile failed: {e!r}")
+    lease_watcher.start()
+    domain_cache.start()
+    overlay_pool.start()
+    if CLOUD_INIT_MODE == "nocloud-net":
+        metadata_server.start()
+    await warm_pool.start()
+    await golden.start()
+    await _resume_teardowns()
+    provisioner.submit(reconciler.run_periodically())
     logger.info("VM Provisioner started")
     yield
     logger.info("VM Provisioner shutting down")
+    await provisioner.shutdown()
+    lease_watcher.stop()
+    domain_cache.stop()
+    overlay_pool.stop()
+    metadata_server.stop()
+    aio.shutdown()
+    db.shutdown()
+    libvirt_pool.close()
 
 
 app = FastAPI(title="VM Provisioner", lifespan=lifespan)
@@ -94,7 +170,7 @@ app.add_middleware(
 
 
 async def get_current_user(x_api_key: str = Header(..., alias="X-API-Key")):
-    user = get_user_by_api_key(x_api_key)
+    user = await db.get_user_by_api_key(x_api_key)
     if not user:
         raise HTTPException(401, "Invalid API key")
     return user
@@ -104,152 +180,321 @@ def clamp(value: int, min_val: int, max_val: int) -> int:
     return max(min_val, min(value, max_val))
 
 
-def cleanup_vm_resources(vm_id: str, host_port: int | None, vm_ip: str | None, 
-                        disk_path: str | None, iso_path: str | None, 
-                        libvirt_uuid: str | None):
-    """Best-effort cleanup on failure."""
-    logger.info(f"Cleaning up resources for failed VM {vm_id}")
-    
-    if host_port and vm_ip:
-        try:
-            remove_port_forward(host_port, vm_ip)
-        except Exception as e:
-            logger.warning(f"Cleanup: failed to remove port forward: {e}")
-    
-    if libvirt_uuid:
-        try:
-            destroy_domain(libvirt_uuid, undefine=True)
-        except Exception as e:
-            logger.warning(f"Cleanup: failed to destroy domain: {e}")
-    
-    if disk_path:
-        try:
-            delete_disk_image(vm_id)
-        except Exception as e:
-            logger.warning(f"Cleanup: failed to delete disk: {e}")
-    
-    if iso_path:
-        try:
-            delete_config_iso(vm_id)
-        except Exception as e:
-            logger.warning(f"Cleanup: failed to delete ISO: {e}")
+def clamp_io_limit(value: int | None, default: int, max_val: int) -> int:
+    """Disk I/O limit to apply: `default` if not given, capped at `max_val` (0: unlimited)."""
+    value = default if value is None else max(value, 0)
+    if max_val:
+        return min(value or max_val, max_val)
+    return value
 
 
-@app.post("/vms")
+@app.post("/vms", status_code=202)
 async def create_vm(
     body: CreateVMRequest,
     user: dict = Depends(get_current_user)
 ):
     """
     Create a new VM.
+
+    Stores a 'provisioning' record and returns 202 with an operation id
+    right away; the pipeline runs in the background and its progress is
+    visible through GET /operations/{id} and GET /vms/{id}. When the warm
+    pool has a matching pre-booted VM it is used instead of a cold boot;
+    otherwise the VM is restored from the image's golden memory state
+    when there is one.
     """
-    name = body.name
-    ssh_key = body.ssh_key
-    image_type = body.image_type
-    memory_mb = body.memory_mb
-    vcpus = body.vcpus
+    spec = _validate_spec(body)
+    
+    try:
+        host_port = await db.run(allocate_port)
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+
+    # Persist the pending VM and its operation before returning, in the
+    # transaction that takes its pre-booted VM (if any) out of the pool
+    def store(pool_vm: dict | None):
+        vm_record, operation, job = _new_vm(
+            user, body.name, spec, host_port,
+            vm_id=pool_vm["vm_id"] if pool_vm else None
+        )
+        _add_pending_vms([vm_record], [operation])
+        return vm_record, operation, job
+
+    try:
+        pool_vm, (vm_record, operation, job) = await warm_pool.claim(
+            spec.image_type, spec.memory_mb, spec.vcpus, store
+        )
+    except Exception:
+        await db.run(release_ports, [host_port])
+        raise
+
+    golden_state = None if pool_vm else await golden.lookup(spec.image_type, spec.memory_mb, spec.vcpus)
+    provisioner.submit(golden.restoring(
+        golden_state,
+        provisioner.run_create_pipeline(operation["id"], job, pool_vm, golden_state)
+    ))
+
+    return _accepted_vm(vm_record, operation)
 
-    # Validate inputs
-    if image_type not in IMAGES:
-        raise HTTPException(400, f"Unknown image type: {image_type}")
+
+@app.post("/vms:batch", status_code=202)
+async def create_vms_batch(
+    body: BatchCreateVMRequest,
+    response: Response,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Create many identical VMs in one call.
+
+    Ports for the whole batch are reserved in one transaction and the VM
+    records and operations stored in another, then the pipelines run with
+    at most BATCH_CONCURRENCY in flight. With `wait` the call returns the
+    final per-VM results (failed VMs are already cleaned up); otherwise it
+    returns 202 with one operation per VM.
+    """
+    if (body.count is None) == (body.names is None):
+        raise HTTPException(400, "Provide exactly one of 'count' or 'names'")
     
-    memory_mb = clamp(memory_mb, MIN_MEMORY_MB, MAX_MEMORY_MB)
-    vcpus = clamp(vcpus, MIN_VCPUS, MAX_VCPUS)
+    names = body.names or [f"{body.name_prefix}-{i + 1}" for i in range(body.count)]
+    if not 1 <= len(names) <= MAX_BATCH_SIZE:
+        raise HTTPException(400, f"Batch size must be between 1 and {MAX_BATCH_SIZE}")
     
-    vm_id = str(uuid.uuid4())
-    now = datetime.utcnow().isoformat()
+    spec = _validate_spec(body.spec)
+    
+    try:
+        ports = await db.run(allocate_ports, len(names))
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+
+    prepared = [
+        _new_vm(user, name, spec, host_port)
+        for name, host_port in zip(names, ports)
+    ]
+    await _store_pending_vms([vm for vm, _, _ in prepared], [op for _, op, _ in prepared])
+
+    # One lookup for the whole batch: every VM restores from the same build
+    golden_state = await golden.lookup(spec.image_type, spec.memory_mb, spec.vcpus, len(prepared))
+    jobs = [(op["id"], job, golden_state) for _, op, job in prepared]
+    task = provisioner.submit(golden.restoring(
+        golden_state,
+        provisioner.run_create_batch(jobs, BATCH_CONCURRENCY)
+    ))
+
+    if not body.wait:
+        return {
+            "count": len(prepared),
+            "vms": [_accepted_vm(vm, op) for vm, op, _ in prepared]
+        }
+
+    # Shielded so a client disconnect doesn't cancel the batch itself
+    await asyncio.shield(task)
+    response.status_code = 200
     
-    # Variables for cleanup tracking
-    host_port = None
-    disk_path = None
-    iso_path = None
-    libvirt_uuid = None
-    vm_ip = None
+    results = []
+    for vm, op, _ in prepared:
+        final = await db.run(get_operation, op["id"], user["id"])
+        entry = {
+            "id": vm["id"],
+            "name": vm["name"],
+            "status": "running" if final["status"] == "succeeded" else "error",
+            "operation": _operation_summary(final)
+        }
+        if final["status"] == "succeeded":
+            entry["ssh_connection"] = final["result"]["ssh_connection"]
+        results.append(entry)
     
+    return {
+        "count": len(results),
+        "succeeded": sum(1 for r in results if r["status"] == "running"),
+        "vms": results
+    }
+
+
+def _add_pending_vms(vm_records: list[VMRecord], operations: list[OperationRecord]) -> None:
+    with transaction():
+        add_vm_records(vm_records)
+        add_operations(operations)
+
+
+async def _store_pending_vms(vm_records: list[VMRecord], operations: list[OperationRecord]) -> None:
+    """
+    Insert pending VM records and their operations in one transaction;
+    the reserved ports are released if that fails.
+    """
     try:
-        # 1. Allocate port
-        host_port = allocate_port()
-        
-        # 2. Create cloud-init ISO
-        iso_path = str(create_config_iso(vm_id, name, image_type, ssh_key))
-        
-        # 3. Clone disk image (blocking IO, run in thread)
-        loop = asyncio.get_event_loop()
-        disk_path = str(await loop.run_in_executor(
-            None, clone_base_image, vm_id, image_type
-        ))
-        
-        # 4. Build XML and create VM
-        xml = build_domain_xml(
-            vm_id=vm_id,
-            name=name,
-            disk_path=disk_path,
-            iso_path=iso_path,
-            memory_mb=memory_mb,
-            vcpus=vcpus
+        await db.run(_add_pending_vms, vm_records, operations)
+    except Exception:
+        await db.run(release_ports, [vm["host_port"] for vm in vm_records])
+        raise
+
+
+def _validate_spec(spec: VMSpec) -> VMSpec:
+    """Reject unknown images and clamp resources to the configured limits."""
+    if spec.image_type not in IMAGES:
+        raise HTTPException(400, f"Unknown image type: {spec.image_type}")
+    
+    return VMSpec(
+        ssh_key=spec.ssh_key,
+        image_type=spec.image_type,
+        memory_mb=clamp(spec.memory_mb, MIN_MEMORY_MB, MAX_MEMORY_MB),
+        vcpus=clamp(spec.vcpus, MIN_VCPUS, MAX_VCPUS),
+        disk_iops=clamp_io_limit(spec.disk_iops, DEFAULT_DISK_IOPS, MAX_DISK_IOPS),
+        disk_bytes_per_sec=clamp_io_limit(
+            spec.disk_bytes_per_sec, DEFAULT_DISK_BYTES_PER_SEC, MAX_DISK_BYTES_PER_SEC
         )
-        libvirt_uuid = await loop.run_in_executor(None, create_domain, xml)
-        
-        # 5. Poll for IP (blocking, has internal timeout)
-        conn = get_libvirt_conn()
-        vm_ip = await loop.run_in_executor(None, poll_vm_ip, conn, libvirt_uuid)
-        
-        # 6. Setup port forward
-        await loop.run_in_executor(None, add_port_forward, host_port, vm_ip)
-        
-        # 7. Save to DB
-        vm_record: VMRecord = {
-            "id": vm_id,
-            "name": name,
-            "owner_id": user["id"],
-            "status": "running",
-            "ip": vm_ip,
-            "host_port": host_port,
-            "disk_path": disk_path,
-            "iso_path": iso_path,
-            "created_at": now
-        }
-        await loop.run_in_executor(None, add_vm_record, vm_record)
-        
-        # 8. Return success
-        server_ip = os.getenv("SERVER_PUBLIC_IP", "127.0.0.1")
-        username = IMAGES[image_type]["username"]
-        
-        return {
-            "id": vm_id,
-            "name": name,
-            "status": "running",
-            "ssh_connection": {
-                "host": server_ip,
-                "port": host_port,
-                "username": username,
-                "command": f"ssh -p {host_port} {username}@{server_ip}"
-            },
-            "specs": {
-                "memory_mb": memory_mb,
-                "vcpus": vcpus,
-                "image": IMAGES[image_type]["name"]
-            }
+    )
+
+
+def _new_vm(
+    user: dict, name: str, spec: VMSpec, host_port: int, vm_id: str | None = None
+) -> tuple[VMRecord, OperationRecord, ProvisionSpec]:
+    """Build the pending VM record, its create operation and the pipeline input."""
+    vm_id = vm_id or str(uuid.uuid4())
+    now = datetime.utcnow().isoformat()
+    
+    vm_record: VMRecord = {
+        "id": vm_id,
+        "name": name,
+        "owner_id": user["id"],
+        "status": "provisioning",
+        "host_port": host_port,
+        "disk_path": str(get_disk_path(vm_id, spec.image_type)),
+        "iso_path": str(get_iso_path(vm_id)),
+        "created_at": now,
+        "image_type": spec.image_type,
+        "memory_mb": spec.memory_mb,
+        "vcpus": spec.vcpus,
+        "disk_iops": spec.disk_iops,
+        "disk_bytes_per_sec": spec.disk_bytes_per_sec
+    }
+    operation: OperationRecord = {
+        "id": str(uuid.uuid4()),
+        "vm_id": vm_id,
+        "owner_id": user["id"],
+        "kind": "create",
+        "status": "pending",
+        "stage": "queued",
+        "created_at": now,
+        "updated_at": now
+    }
+    job: ProvisionSpec = {
+        "vm_id": vm_id,
+        "name": name,
+        "owner_id": user["id"],
+        "image_type": spec.image_type,
+        "ssh_key": spec.ssh_key,
+        "memory_mb": spec.memory_mb,
+        "vcpus": spec.vcpus,
+        "host_port": host_port,
+        "disk_iops": spec.disk_iops,
+        "disk_bytes_per_sec": spec.disk_bytes_per_sec
+    }
+    return vm_record, operation, job
+
+
+def _accepted_vm(vm: VMRecord, op: OperationRecord) -> dict:
+    """Response body for a VM whose create operation was just queued."""
+    return {
+        "id": vm["id"],
+        "name": vm["name"],
+        "status": "provisioning",
+        "operation": {
+            "id": op["id"],
+            "status": "pending",
+            "href": f"/operations/{op['id']}"
+        },
+        "specs": {
+            "memory_mb": vm["memory_mb"],
+            "vcpus": vm["vcpus"],
+            "image": IMAGES[vm["image_type"]]["name"]
         }
-        
+    }
+
+
+def _operation_summary(op: OperationRecord | None) -> dict | None:
+    if not op:
+        return None
+    return {
+        "id": op["id"],
+        "kind": op["kind"],
+        "status": op["status"],
+        "stage": op["stage"],
+        "error": op["error"]
+    }
+
+
+@app.get("/operations/{op_id}")
+async def get_operation_status(op_id: str, user: dict = Depends(get_current_user)):
+    """Get progress and result of a background operation."""
+    op = await db.run(get_operation, op_id, user["id"])
+    if not op:
+        raise HTTPException(404, "Operation not found")
+    return op
+
+
+async def _fill_state_cache(vms: list[VMRecord]) -> None:
+    """Load running VMs the state cache hasn't seen yet, with one bulk libvirt call."""
+    missing = [
+        vm["id"] for vm in vms
+        if vm["status"] == "running" and domain_cache.get(vm["id"]) is None
+    ]
+    if not missing:
+        return
+    
+    try:
+        states = await aio.get_domain_states()
     except Exception as e:
-        logger.error(f"VM creation failed: {e}")
-        cleanup_vm_resources(vm_id, host_port, vm_ip, disk_path, iso_path, libvirt_uuid)
-        raise HTTPException(500, f"VM creation failed: {str(e)}")
+        logger.warning(f"Failed to fetch domain states: {e}")
+        return
+    
+    for vm_id in missing:
+        if vm_id in states:
+            domain_cache.set(vm_id, states[vm_id])
+
+
+def _vm_status(vm: VMRecord) -> tuple[str, str | None]:
+    """
+    Status shown for a VM and when it was last observed.
+
+    Running VMs report their domain state from the event-driven cache
+    (call _fill_state_cache first for domains it may not have seen yet).
+    """
+    if vm["status"] != "running":
+        return vm["status"], None
+    
+    cached = domain_cache.get(vm["id"])
+    if cached is None:
+        return "unknown", None
+    
+    state, updated_at = cached
+    return state, datetime.fromtimestamp(updated_at, timezone.utc).isoformat()
 
 
 @app.get("/vms")
-def list_vms(user: dict = Depends(get_current_user)):
-    """List all VMs for current user."""
-    vms = list_vms_by_owner(user["id"])
+async def list_vms(
+    limit: int = VMS_PAGE_SIZE,
+    cursor: str | None = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    List the current user's VMs, newest first, one page at a time.
+
+    Pass the response's `next_cursor` as `cursor` to get the next page;
+    it is null on the last one.
+    """
+    try:
+        vms, next_cursor = await db.list_vms_page(
+            user["id"], clamp(limit, 1, MAX_VMS_PAGE_SIZE), cursor
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     server_ip = os.getenv("SERVER_PUBLIC_IP", "127.0.0.1")
     
+    await _fill_state_cache(vms)
+    
     result = []
     for vm in vms:
-        try:
-            status = get_domain_state(vm["id"])
-        except Exception as e:
-            status = "unknown"
+        status, state_updated_at = _vm_status(vm)
         
         # Determine username from image_type if stored, default to "debian"
         image_type = vm.get("image_type", "debian-12")
@@ -259,72 +504,323 @@ def list_vms(user: dict = Depends(get_current_user)):
             "id": vm["id"],
             "name": vm["name"],
             "status": status,
+            "state_updated_at": state_updated_at,
             "ip": vm.get("ip"),
             "port": vm["host_port"],
             "username": username,
             "created_at": vm["created_at"]
         })
     
-    return {"vms": result, "server_ip": server_ip}
+    return {
+        "vms": result,
+        "next_cursor": next_cursor,
+        "server_ip": server_ip,
+        "state_cache": domain_cache.info()
+    }
 
 
 @app.get("/vms/{vm_id}")
-def get_vm(vm_id: str, user: dict = Depends(get_current_user)):
+async def get_vm(vm_id: str, user: dict = Depends(get_current_user)):
     """Get specific VM details."""
-    vm = get_vm_by_id(vm_id, user["id"])
+    vm = await db.get_vm_by_id(vm_id, user["id"])
     if not vm:
         raise HTTPException(404, "VM not found")
     
-    server_ip = os.getenv("SERVER_PUBLIC_IP", "127.0.0.1")
-    
-    # Determine username from iso_path or store image_type in DB
-    username = "debian"  # Default, should parse from stored data
+    await _fill_state_cache([vm])
+    status, state_updated_at = _vm_status(vm)
+    operation = await db.run(get_latest_operation_for_vm, vm_id)
     
     return {
         "id": vm["id"],
         "name": vm["name"],
-        "status": get_domain_state(vm["id"]),
-        "ssh_connection": {
-            "host": server_ip,
-            "port": vm["host_port"],
-            "username": username,
-            "command": f"ssh -p {vm['host_port']} {username}@{server_ip}"
-        },
+        "status": status,
+        "state_updated_at": state_updated_at,
+        "state_cache": domain_cache.info(),
+        "ip": vm.get("ip"),
+        "ssh_connection": ssh_connection_info(vm["host_port"], vm.get("image_type")),
+        "operation": _operation_summary(operation),
         "created_at": vm["created_at"]
     }
 
 
-@app.delete("/vms/{vm_id}")
-def delete_vm(vm_id: str, user: dict = Depends(get_current_user)):
-    """Destroy a VM and cleanup resources."""
-    vm = get_vm_by_id(vm_id, user["id"])
+@app.delete("/vms/{vm_id}", status_code=202)
+async def delete_vm(vm_id: str, user: dict = Depends(get_current_user)):
+    """
+    Delete a VM.
+
+    Marks the VM 'deleting' and returns 202 with an operation id; the
+    domain, disk, cloud-init config, port forward and IP reservation are
+    torn down in the background, then the record is removed.
+    """
+    vms, skipped = await db.mark_vms_deleting(user["id"], [vm_id])
+    if skipped:
+        raise HTTPException(409, f"VM is {skipped[0]['reason']}")
+    if not vms:
+        raise HTTPException(404, "VM not found")
+    
+    accepted = await _start_teardown(user["id"], vms)
+    return accepted[0]
+
+
+@app.delete("/vms", status_code=202)
+async def delete_vms(
+    ids: Annotated[list[str] | None, Query()] = None,
+    name_prefix: str | None = None,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Delete every VM matching the filters (`ids`, repeatable, and/or `name_prefix`).
+
+    Matching VMs are marked 'deleting' in one transaction and torn down
+    in the background, TEARDOWN_CONCURRENCY at a time, with their port
+    forwards removed in one go. VMs that can't be deleted yet are listed
+    under `skipped`.
+    """
+    if ids is None and not name_prefix:
+        raise HTTPException(400, "Provide 'ids' and/or 'name_prefix'")
+    
+    vms, skipped = await db.mark_vms_deleting(user["id"], ids, name_prefix or None)
+    accepted = await _start_teardown(user["id"], vms) if vms else []
+    return {"count": len(accepted), "vms": accepted, "skipped": skipped}
+
+
+async def _start_teardown(owner_id: str, vms: list[VMRecord]) -> list[dict]:
+    """Store a delete operation per VM and tear them down in the background."""
+    now = datetime.utcnow().isoformat()
+    operations: list[OperationRecord] = [
+        {
+            "id": str(uuid.uuid4()),
+            "vm_id": vm["id"],
+            "owner_id": owner_id,
+            "kind": "delete",
+            "status": "pending",
+            "stage": "queued",
+            "created_at": now,
+            "updated_at": now
+        }
+        for vm in vms
+    ]
+    await db.run(add_operations, operations)
+    
+    jobs = [(op["id"], vm) for op, vm in zip(operations, vms)]
+    provisioner.submit(provisioner.run_delete_batch(jobs, TEARDOWN_CONCURRENCY))
+    
+    return [
+        {
+            "id": vm["id"],
+            "name": vm["name"],
+            "status": "deleting",
+            "operation": {"id": op["id"], "status": "pending", "href": f"/operations/{op['id']}"}
+        }
+        for op, vm in zip(operations, vms)
+    ]
+
+
+async def _resume_teardowns() -> None:
+    """Finish the deletions a shutdown interrupted (VMs left 'deleting')."""
+    vms = await db.list_vms_by_status("deleting")
+    jobs = []
+    for vm in vms:
+        op = await db.run(get_latest_operation_for_vm, vm["id"])
+        if op and op["kind"] == "delete":
+            jobs.append((op["id"], vm))
+        else:
+            await _start_teardown(vm["owner_id"], [vm])
+    if jobs:
+        logger.info(f"Resuming {len(jobs)} interrupted VM deletions")
+        provisioner.submit(provisioner.run_delete_batch(jobs, TEARDOWN_CONCURRENCY))
+
+
+async def _get_ready_vm(vm_id: str, user: dict) -> VMRecord:
+    vm = await db.get_vm_by_id(vm_id, user["id"])
     if not vm:
         raise HTTPException(404, "VM not found")
+    if vm["status"] in ("provisioning", "deleting", "error"):
+        raise HTTPException(409, f"VM is {vm['status']}")
+    return vm
+
+
+def _disk_limits(vm: VMRecord) -> dict:
+    return {
+        "disk_iops": vm.get("disk_iops") or 0,
+        "disk_bytes_per_sec": vm.get("disk_bytes_per_sec") or 0
+    }
+
+
+@app.get("/vms/{vm_id}/disk")
+async def get_vm_disk(vm_id: str, user: dict = Depends(get_current_user)):
+    """Disk size, format and I/O limits of a VM."""
+    vm = await _get_ready_vm(vm_id, user)
+    try:
+        info = await aio.get_disk_info(vm_id, vm.get("image_type"), vm["disk_path"])
+    except FileNotFoundError:
+        raise HTTPException(404, "Disk not found")
+    
+    return {
+        "id": vm_id,
+        "format": info.get("format"),
+        "virtual_size": info.get("virtual-size"),
+        "actual_size": info.get("actual-size"),
+        **_disk_limits(vm)
+    }
+
+
+@app.post("/vms/{vm_id}/disk:resize")
+async def resize_vm_disk(
+    vm_id: str,
+    body: DiskResizeRequest,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Grow a VM's disk.
+
+    Running VMs are resized online (blockResize) and see the new size
+    right away; stopped ones have their image resized. Disks never shrink.
+    """
+    if not 1 <= body.size_gb <= MAX_DISK_GB:
+        raise HTTPException(400, f"Disk size must be between 1 and {MAX_DISK_GB} GB")
+    vm = await _get_ready_vm(vm_id, user)
     
-    # Remove port forward
     try:
-        remove_port_forward(vm["host_port"], vm["ip"])
-    except Exception as e:
-        logger.warning(f"Failed to remove port forward: {e}")
+        online = await aio.resize_vm_disk(
+            vm_id, vm.get("image_type"), body.size_gb, vm["disk_path"]
+        )
+    except ValueError as e:
+        raise HTTPException(400, str(e))
     
-    # Stop and undefine in libvirt
+    return {"id": vm_id, "size_gb": body.size_gb, "online": online}
+
+
+@app.put("/vms/{vm_id}/disk/limits")
+async def set_vm_disk_limits(
+    vm_id: str,
+    body: DiskLimitsRequest,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Change a VM's disk IOPS and bytes/sec limits, live.
+
+    Omitted fields keep their current value; 0 removes a limit (within
+    the MAX_DISK_* caps).
+    """
+    vm = await _get_ready_vm(vm_id, user)
+    current = _disk_limits(vm)
+    disk_iops = clamp_io_limit(
+        current["disk_iops"] if body.disk_iops is None else body.disk_iops,
+        DEFAULT_DISK_IOPS, MAX_DISK_IOPS
+    )
+    disk_bytes_per_sec = clamp_io_limit(
+        current["disk_bytes_per_sec"] if body.disk_bytes_per_sec is None else body.disk_bytes_per_sec,
+        DEFAULT_DISK_BYTES_PER_SEC, MAX_DISK_BYTES_PER_SEC
+    )
+    
+    await aio.set_block_iotune(vm_id, disk_iops, disk_bytes_per_sec)
+    await db.update_vm_disk_limits(vm_id, user["id"], disk_iops, disk_bytes_per_sec)
+    
+    return {"id": vm_id, "disk_iops": disk_iops, "disk_bytes_per_sec": disk_bytes_per_sec}
+
+
+async def _get_snapshot_vm(vm_id: str, user: dict) -> VMRecord:
+    vm = await _get_ready_vm(vm_id, user)
+    if not snapshots.supports_snapshots(vm.get("image_type")):
+        raise HTTPException(400, "Snapshots need an image on the qcow2 storage backend")
+    return vm
+
+
+@app.post("/vms/{vm_id}/snapshots", status_code=201)
+async def create_vm_snapshot(
+    vm_id: str,
+    body: SnapshotRequest,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Take an external disk-only snapshot of a VM.
+
+    With `quiesce` (default) guest filesystems are frozen through the
+    guest agent; `quiesced` in the response says whether that worked.
+    """
+    await _get_snapshot_vm(vm_id, user)
     try:
-        destroy_domain(vm_id, undefine=True)
-    except Exception as e:
-        logger.warning(f"Failed to destroy domain: {e}")
+        snapshot = await aio.run(
+            snapshots.create_snapshot, vm_id, user["id"], body.name, body.quiesce
+        )
+    except ValueError as e:
+        raise HTTPException(409, str(e))
+    return snapshot
+
+
+@app.get("/vms/{vm_id}/snapshots")
+async def list_vm_snapshots(vm_id: str, user: dict = Depends(get_current_user)):
+    """List a VM's snapshots, oldest first."""
+    await _get_ready_vm(vm_id, user)
+    return {"snapshots": await db.run(list_snapshots, vm_id)}
+
+
+@app.post("/vms/{vm_id}/snapshots/{snapshot_id}:revert")
+async def revert_vm_snapshot(
+    vm_id: str,
+    snapshot_id: str,
+    user: dict = Depends(get_current_user)
+):
+    """Put a VM's disk back to a snapshot (a running VM is restarted)."""
+    await _get_snapshot_vm(vm_id, user)
+    if not await db.run(get_snapshot, snapshot_id, vm_id):
+        raise HTTPException(404, "Snapshot not found")
     
-    # Cleanup files
-    delete_disk_image(vm_id)
-    delete_config_iso(vm_id)
+    await aio.run(snapshots.revert_snapshot, vm_id, user["id"], snapshot_id)
+    return {"id": vm_id, "snapshot_id": snapshot_id, "reverted": True}
+
+
+@app.post("/vms/{vm_id}:clone", status_code=202)
+async def clone_vm(
+    vm_id: str,
+    body: CloneVMRequest,
+    user: dict = Depends(get_current_user)
+):
+    """
+    Create a VM as a linked clone of another VM's snapshot.
+
+    The new disk is a qcow2 overlay on the snapshot's frozen image, so
+    the clone boots with everything the source had installed. Without
+    `snapshot_id` a snapshot of the source is taken first. Runs as a
+    background operation like POST /vms.
+    """
+    source = await _get_snapshot_vm(vm_id, user)
+    
+    if body.snapshot_id:
+        snapshot = await db.run(get_snapshot, body.snapshot_id, vm_id)
+        if not snapshot:
+            raise HTTPException(404, "Snapshot not found")
+    else:
+        name = f"clone-{datetime.utcnow().strftime('%Y%m%dT%H%M%S.%f')}"
+        snapshot = await aio.run(snapshots.create_snapshot, vm_id, user["id"], name)
+    
+    spec = _validate_spec(VMSpec(
+        ssh_key=body.ssh_key,
+        image_type=source["image_type"],
+        memory_mb=source["memory_mb"] or MIN_MEMORY_MB,
+        vcpus=source["vcpus"] or MIN_VCPUS,
+        disk_iops=source.get("disk_iops"),
+        disk_bytes_per_sec=source.get("disk_bytes_per_sec")
+    ))
+    try:
+        host_port = await db.run(allocate_port)
+    except RuntimeError as e:
+        raise HTTPException(503, str(e))
+    
+    vm_record, operation, job = _new_vm(user, body.name, spec, host_port)
+    vm_record["source_snapshot_id"] = snapshot["id"]
+    operation["kind"] = "clone"
+    job["backing_disk"] = snapshot["disk_path"]
+    await _store_pending_vms([vm_record], [operation])
     
-    # Remove from DB
-    delete_vm_record(vm_id, user["id"])
+    provisioner.submit(provisioner.run_create_pipeline(operation["id"], job))
     
-    return {"deleted": True, "id": vm_id}
+    return {**_accepted_vm(vm_record, operation), "source": {"vm_id": vm_id, "snapshot_id": snapshot["id"]}}
 
 
 @app.get("/images")
-def list_images():
+async def list_images():
     """List available VM images."""
     return {
         key: {"name": val["name"], "username": val["username"]}
@@ -346,8 +842,7 @@ async def signup(body: AuthRequest):
     api_key = secrets.token_urlsafe(32)
     
     # Add user to database
-    from SQL.USERS_related import add_user
-    user = add_user(name, password, api_key)
+    user = await db.add_user(name, password, api_key)
     
     if user is None:
         raise HTTPException(400, "User already exists or invalid data")
@@ -368,20 +863,13 @@ async def login(body: AuthRequest):
     password = body.password
     
     from SQL.USERS_related import verify_password
-    from SQL.database import get_conn
     
     # Get user by name
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT id, name, hashed_password, api_key_hash FROM users WHERE name = ?",
-            (name,)
-        ).fetchone()
+    user = await db.get_user_by_name(name)
     
-    if not row:
+    if not user:
         raise HTTPException(401, "Invalid username or password")
     
-    user = dict(row)
-    
     # Verify password
     if not verify_password(password, user["hashed_password"]):
         raise HTTPException(401, "Invalid username or password")
@@ -392,15 +880,7 @@ async def login(body: AuthRequest):
     new_api_key = secrets.token_urlsafe(32)
     
     # Update the API key in database
-    from SQL.USERS_related import hash_api_key
-    new_hash = hash_api_key(new_api_key)
-    
-    with get_conn() as conn:
-        conn.execute(
-            "UPDATE users SET api_key_hash = ? WHERE id = ?",
-            (new_hash, user["id"])
-        )
-        conn.commit()
+    await db.update_api_key(user["id"], new_api_key)
     
     return {
         "message": "Login successful",
@@ -410,8 +890,44 @@ async def login(body: AuthRequest):
     }
 
 
+@app.get("/pool")
+async def pool_stats():
+    """Warm pool depth and hit/miss counters per image type."""
+    return await db.run(warm_pool.stats)
+
+
+@app.get("/pool/overlays")
+async def overlay_pool_stats():
+    """Ready disk overlays and hit ratio per image type."""
+    return await aio.run(overlay_pool.stats)
+
+
+@app.get("/images/golden")
+async def golden_state_stats():
+    """Golden memory state, restore/miss counters and build status per image type."""
+    return await aio.run(golden.stats)
+
+
+@app.get("/reconcile", dependencies=[Depends(require_admin)])
+async def reconcile_report():
+    """What a reconcile would repair now (nothing is changed). Admin only."""
+    return await reconciler.reconcile(dry_run=True)
+
+
+@app.post("/reconcile", dependencies=[Depends(require_admin)])
+async def run_reconcile():
+    """Remove orphaned resources and repair drifted state now. Admin only."""
+    return await reconciler.reconcile(dry_run=False)
+
+
+@app.get("/libvirt")
+async def libvirt_stats():
+    """Libvirt connection pool utilisation and state cache freshness."""
+    return {"connections": libvirt_pool.stats(), "state_cache": domain_cache.info()}
+
+
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
@@ -0,0 +1,100 @@
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METADATA_HOST, METADATA_PORT
+from SQL.METADATA_related import get_instance_metadata
+from SQL.IPS_related import get_ip_allocation
+from network import generate_mac_address
+from lease_watcher import watcher as lease_watcher
+
+logger = logging.getLogger(__name__)
+
+# Files cloud-init's NoCloud datasource fetches from the seed URL
+DOCUMENTS = ("meta-data", "user-data", "vendor-data")
+
+
+def client_allowed(vm_id: str, client_ip: str) -> bool:
+    """
+    Only the VM itself may read its documents, when we know its address.
+
+    The address comes from the VM's static DHCP reservation or, failing
+    that, its current lease; a VM whose address is not known yet is let
+    through (the vm_id in the URL is an unguessable UUID).
+    """
+    allocation = get_ip_allocation(vm_id)
+    expected = allocation["ip"] if allocation else lease_watcher.lookup(generate_mac_address(vm_id))
+    return expected is None or expected == client_ip
+
+
+class MetadataHandler(BaseHTTPRequestHandler):
+    """Serves GET /<vm_id>/{meta-data,user-data,vendor-data}."""
+
+    server_version = "vm-provisioner-metadata"
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if len(parts) != 2 or parts[1] not in DOCUMENTS:
+            self.send_error(404)
+            return
+        vm_id, document = parts
+
+        metadata = get_instance_metadata(vm_id)
+        if metadata is None:
+            self.send_error(404)
+            return
+        if not client_allowed(vm_id, self.client_address[0]):
+            logger.warning(f"Refused {document} of VM {vm_id} to {self.client_address[0]}")
+            self.send_error(403)
+            return
+
+        body = {
+            "meta-data": metadata["meta_data"],
+            "user-data": metadata["user_data"],
+            "vendor-data": "",
+        }[document].encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        logger.info(f"Served {document} to VM {vm_id}")
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.client_address[0]} {format % args}")
+
+
+class MetadataServer:
+    """NoCloud-net HTTP datasource on the VM network, run in a daemon thread."""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self._httpd: ThreadingHTTPServer | None = None
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        """Bind and start serving (idempotent)."""
+        if self._httpd is not None:
+            return
+        self._httpd = ThreadingHTTPServer((self.host, self.port), MetadataHandler)
+        self._httpd.daemon_threads = True
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(
+            target=self._httpd.serve_forever, name="metadata-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"Serving cloud-init metadata on http://{self.host}:{self.port}/")
+
+    def stop(self) -> None:
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+        self._thread = None
+
+
+# Shared server, started by the API when CLOUD_INIT_MODE is nocloud-net
+server = MetadataServer(METADATA_HOST, METADATA_PORT)
@@ -1,107 +1,76 @@
-import subprocess
 import time
 import logging
-import json
 import libvirt
-from pathlib import Path
 
-from config import START_PORT, END_PORT, VM_NETWORK
-from SQL.database import get_conn
+from config import START_PORT, END_PORT
+from SQL.PORTS_related import reserve_ports
+from lease_watcher import watcher as lease_watcher
+import forwarding
 
 logger = logging.getLogger(__name__)
 
 
 def allocate_port() -> int:
     """
-    Find next available host port for SSH forwarding.
-    Scans database to find highest used port, returns next.
+    Reserve the lowest free host port for SSH forwarding.
+
+    Freed ports are reused, and the port is taken atomically, so
+    concurrent creates never share one (see SQL.PORTS_related). It stays
+    reserved until the VM record is stored; call release_ports() if the
+    record is never written.
     """
-    with get_conn() as conn:
-        row = conn.execute(
-            "SELECT MAX(host_port) FROM vms"
-        ).fetchone()
-        
-        max_port = row[0] if row[0] else START_PORT - 1
-        next_port = max_port + 1
-        
-        if next_port > END_PORT:
-            raise RuntimeError(f"No available ports in range {START_PORT}-{END_PORT}")
-        
-        return next_port
+    try:
+        return reserve_ports(1)[0]
+    except RuntimeError:
+        raise RuntimeError(f"No available ports in range {START_PORT}-{END_PORT}") from None
+
+
+def allocate_ports(count: int) -> list[int]:
+    """
+    Reserve the `count` lowest free host ports at once (used by batch creates).
+    All or nothing, like allocate_port.
+    """
+    try:
+        return reserve_ports(count)
+    except RuntimeError:
+        raise RuntimeError(
+            f"Not enough available ports in range {START_PORT}-{END_PORT} "
+            f"for {count} VMs"
+        ) from None
 
 
 def add_port_forward(host_port: int, vm_ip: str) -> None:
     """
-    Add iptables rules to forward host_port -> vm_ip:22.
+    Forward host_port -> vm_ip:22 with the configured FORWARD_BACKEND.
     
     This allows: ssh -p <host_port> user@<server_public_ip>
-    
-    Two rules are needed:
-      1. PREROUTING DNAT: rewrite destination to vm_ip:22
-      2. FORWARD ACCEPT: allow the rewritten packet through to the VM
     """
-    # DNAT rule in PREROUTING
-    dnat_cmd = [
-        "iptables", "-t", "nat", "-A", "PREROUTING",
-        "-p", "tcp",
-        "--dport", str(host_port),
-        "-j", "DNAT",
-        "--to-destination", f"{vm_ip}:22"
-    ]
-    subprocess.run(dnat_cmd, check=True, capture_output=True, text=True)
-    
-    # FORWARD rule to allow the DNAT'd traffic through
-    forward_cmd = [
-        "iptables", "-A", "FORWARD",
-        "-p", "tcp",
-        "-d", vm_ip,
-        "--dport", "22",
-        "-j", "ACCEPT"
-    ]
-    subprocess.run(forward_cmd, check=True, capture_output=True, text=True)
-    
-    logger.info(f"Added port forward: host:{host_port} -> {vm_ip}:22")
+    forwarding.backend.add(host_port, vm_ip)
 
 
 def remove_port_forward(host_port: int, vm_ip: str) -> None:
-    """Remove iptables DNAT and FORWARD rules when VM is destroyed."""
-    # Remove DNAT rule
-    dnat_cmd = [
-        "iptables", "-t", "nat", "-D", "PREROUTING",
-        "-p", "tcp",
-        "--dport", str(host_port),
-        "-j", "DNAT",
-        "--to-destination", f"{vm_ip}:22"
-    ]
-    subprocess.run(dnat_cmd, check=True, capture_output=True, text=True)
-    
-    # Remove FORWARD rule
-    forward_cmd = [
-        "iptables", "-D", "FORWARD",
-        "-p", "tcp",
-        "-d", vm_ip,
-        "--dport", "22",
-        "-j", "ACCEPT"
-    ]
-    subprocess.run(forward_cmd, check=False, capture_output=True, text=True)
-    
-    logger.info(f"Removed port forward: host:{host_port} -> {vm_ip}:22")
+    """Remove a VM's forward when it is destroyed."""
+    forwarding.backend.remove(host_port, vm_ip)
+
+
+def remove_port_forwards(forwards: list[tuple[int, str]]) -> None:
+    """Remove many (host_port, vm_ip) forwards at once (one nftables transaction)."""
+    forwarding.backend.update([], forwards)
 
 
 def get_vm_ip_from_leases(mac_address: str, timeout: int = 30) -> str | None:
     """
     Get VM IP from libvirt's dnsmasq leases file.
     Fallback if qemu-guest-agent fails.
+
+    Reads the shared lease watcher's index instead of re-parsing the file.
     """
-    leases_file = Path(f"/var/lib/libvirt/dnsmasq/{VM_NETWORK}.leases")
+    lease_watcher.start()
     
     for _ in range(timeout):
-        if leases_file.exists():
-            content = leases_file.read_text()
-            for line in content.strip().split("\n"):
-                parts = line.split()
-                if len(parts) >= 5 and parts[1].lower() == mac_address.lower():
-                    return parts[2]  # IP address
+        ip = lease_watcher.lookup(mac_address)
+        if ip:
+            return ip
         
         time.sleep(1)
     
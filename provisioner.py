@@ -0,0 +1,538 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, TypedDict, NotRequired
+
+from config import IMAGES, PROVISION_WORKERS, IP_WAIT_TIMEOUT, STATIC_DHCP, CLOUD_INIT_MODE
+from SQL.VM_related import VMRecord, update_vm_status, delete_vm_record
+from SQL.SNAPSHOTS_related import delete_snapshots
+from SQL.OPERATIONS_related import update_operation
+from libvirt_client import (
+    create_domain,
+    build_domain_xml,
+    destroy_domain,
+    set_guest_identity,
+    set_block_iotune,
+    restore_domain,
+    reseed_guest,
+    connection as libvirt_connection
+)
+from storage import (
+    get_disk_path,
+    clone_base_image,
+    create_linked_clone,
+    delete_disk_image,
+    domain_disk_args
+)
+from cloudinit import (
+    get_iso_path,
+    get_metadata_url,
+    prepare_cloud_config,
+    delete_cloud_config
+)
+from network import (
+    add_port_forward,
+    remove_port_forward,
+    remove_port_forwards,
+    poll_vm_ip,
+    generate_mac_address
+)
+from lease_watcher import watcher as lease_watcher
+from ipam import reserve_vm_ip, release_vm_ip
+
+logger = logging.getLogger(__name__)
+
+
+class ProvisionSpec(TypedDict):
+    vm_id: str
+    name: str
+    owner_id: str
+    image_type: str
+    ssh_key: str
+    memory_mb: int
+    vcpus: int
+    host_port: int
+    disk_iops: int
+    disk_bytes_per_sec: int
+    # Linked clones: snapshot image the disk is overlaid on instead of the template
+    backing_disk: NotRequired[str]
+
+
+# Dedicated pool so long-running pipelines don't compete with request handlers
+_executor = ThreadPoolExecutor(
+    max_workers=PROVISION_WORKERS,
+    thread_name_prefix="provision"
+)
+
+# Name of the stage that makes the cloud-init config available
+CONFIG_STAGE = "building_iso" if CLOUD_INIT_MODE == "iso" else "storing_metadata"
+
+# Strong references to in-flight pipelines (asyncio only keeps weak ones)
+_tasks: set[asyncio.Task] = set()
+
+
+def ssh_connection_info(host_port: int, image_type: str | None) -> dict:
+    """Build the SSH connection block returned to API clients."""
+    server_ip = os.getenv("SERVER_PUBLIC_IP", "127.0.0.1")
+    username = IMAGES.get(image_type, {}).get("username", "debian")
+    return {
+        "host": server_ip,
+        "port": host_port,
+        "username": username,
+        "command": f"ssh -p {host_port} {username}@{server_ip}"
+    }
+
+
+def cleanup_vm_resources(vm_id: str, host_port: int | None, vm_ip: str | None,
+                        disk_path: str | None, iso_path: str | None,
+                        libvirt_uuid: str | None):
+    """Best-effort cleanup on failure."""
+    logger.info(f"Cleaning up resources for failed VM {vm_id}")
+
+    if host_port and vm_ip:
+        try:
+            remove_port_forward(host_port, vm_ip)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to remove port forward: {e}")
+
+    if libvirt_uuid:
+        try:
+            destroy_domain(libvirt_uuid, undefine=True)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to destroy domain: {e}")
+
+    if disk_path:
+        try:
+            delete_disk_image(vm_id)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to delete disk: {e}")
+
+    if iso_path or CLOUD_INIT_MODE == "nocloud-net":
+        try:
+            delete_cloud_config(vm_id)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to delete cloud-init config: {e}")
+
+    if STATIC_DHCP:
+        try:
+            release_vm_ip(vm_id)
+        except Exception as e:
+            logger.warning(f"Cleanup: failed to release IP: {e}")
+
+
+async def run_blocking(func, *args):
+    """Run a blocking call on the provisioning executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+def _poll_vm_ip(libvirt_uuid: str) -> str:
+    with libvirt_connection() as conn:
+        return poll_vm_ip(conn, libvirt_uuid, timeout=IP_WAIT_TIMEOUT)
+
+
+async def wait_for_vm_ip(vm_id: str) -> str:
+    """
+    Wait for the IP of a freshly started domain.
+
+    The shared lease watcher wakes us as soon as the VM's deterministic
+    MAC gets a DHCP lease; hosts without a dnsmasq lease directory fall
+    back to polling libvirt.
+    """
+    if lease_watcher.available:
+        return await lease_watcher.wait_for_ip(generate_mac_address(vm_id), IP_WAIT_TIMEOUT)
+    return await run_blocking(_poll_vm_ip, vm_id)
+
+
+async def run_stage_graph(
+    op_id: str | None,
+    stages: dict[str, tuple[tuple[str, ...], Callable[[], Awaitable[None]]]],
+    timings: dict[str, dict]
+) -> None:
+    """
+    Run provisioning stages as a dependency graph.
+
+    Args:
+        op_id: Operation whose `stage` field tracks the stages in progress
+            (None for background work without an operation)
+        stages: name -> (dependency names, coroutine function); a stage
+            starts as soon as all of its dependencies have finished, so
+            independent stages run concurrently. Dependencies must be
+            listed before the stages that need them.
+        timings: Filled with {"start": s, "duration": s} per stage,
+            relative to the start of the graph (also on failure)
+
+    Raises:
+        The first stage error, once every stage that had already started
+        has settled (executor threads can't be interrupted, and cleanup
+        must see everything they created). Stages whose dependencies
+        failed never start.
+    """
+    loop = asyncio.get_running_loop()
+    graph_start = loop.time()
+    active: set[str] = set()
+    started: set[str] = set()
+    tasks: dict[str, asyncio.Task] = {}
+
+    async def run_stage(name, deps, func):
+        if deps:
+            # asyncio.wait (unlike gather) never cancels the dependencies
+            await asyncio.wait([tasks[dep] for dep in deps])
+            for dep in deps:
+                tasks[dep].result()  # re-raise a dependency's failure
+        started.add(name)
+        active.add(name)
+        logger.info(f"Operation {op_id}: {name}")
+        stage_start = loop.time()
+        try:
+            if op_id is not None:
+                await run_blocking(update_operation, op_id, None, "+".join(sorted(active)))
+            await func()
+        finally:
+            active.discard(name)
+            timings[name] = {
+                "start": round(stage_start - graph_start, 3),
+                "duration": round(loop.time() - stage_start, 3)
+            }
+
+    for name, (deps, func) in stages.items():
+        tasks[name] = asyncio.ensure_future(run_stage(name, deps, func))
+
+    graph = asyncio.gather(*tasks.values(), return_exceptions=True)
+    try:
+        results = await asyncio.shield(graph)
+    except asyncio.CancelledError:
+        for name, task in tasks.items():
+            if name not in started:
+                task.cancel()
+        await graph
+        raise
+    finally:
+        timings["total"] = {"start": 0.0, "duration": round(loop.time() - graph_start, 3)}
+
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+
+
+async def run_create_pipeline(
+    op_id: str,
+    spec: ProvisionSpec,
+    pool_vm: dict | None = None,
+    golden_state: dict | None = None
+) -> None:
+    """
+    Provision a VM whose record was already stored with status 'provisioning'.
+
+    The cloud-init ISO (or, in nocloud-net mode, the documents served by
+    the metadata server) and the disk overlay are built concurrently; only
+    domain creation waits for both. With STATIC_DHCP the VM's address is
+    reserved up front (see ipam.reserve_vm_ip), so the port forward goes
+    in alongside the build instead of after a DHCP lease shows up. When
+    `pool_vm` (a claimed warm pool entry, see warm_pool.claim) is given,
+    the VM already runs: its hostname and SSH key are injected through the
+    guest agent while the port forward is set up. A spec with
+    `backing_disk` (POST /vms/{id}:clone) gets a linked clone of that
+    snapshot image instead of a template overlay; its new instance-id
+    makes cloud-init redo the per-instance setup (hostname, SSH keys, host
+    keys). With `golden_state` (see golden.lookup) the disk is an overlay
+    on the golden disk and the domain is restored from the saved memory
+    state instead of booted; the guest agent then moves it to its own MAC
+    and address, renews its host keys and applies hostname and SSH key.
+    Stage transitions and per-stage timings are written to the operation
+    record. On success the VM is marked 'running' and the operation result
+    carries the SSH connection info; on failure resources are cleaned up,
+    the VM is marked 'error' and the operation 'failed'.
+    """
+    vm_id = spec["vm_id"]
+    image_type = spec["image_type"]
+    host_port = spec["host_port"]
+
+    # Filled in by the stages, read back for cleanup tracking
+    state: dict[str, str | None] = {
+        "iso_path": None,
+        "disk_path": None,
+        "libvirt_uuid": None,
+        "vm_ip": None,
+    }
+    if pool_vm:
+        iso_path = get_iso_path(vm_id)
+        state.update({
+            "iso_path": str(iso_path) if iso_path.exists() else None,
+            "disk_path": str(get_disk_path(vm_id, image_type)),
+            "libvirt_uuid": vm_id,
+            "vm_ip": pool_vm["ip"],
+        })
+    timings: dict[str, dict] = {}
+
+    async def build_iso():
+        iso_path = await run_blocking(
+            prepare_cloud_config, vm_id, spec["name"], image_type, spec["ssh_key"]
+        )
+        state["iso_path"] = str(iso_path) if iso_path else None
+
+    async def clone_disk():
+        if golden_state:
+            disk_path = await run_blocking(create_linked_clone, vm_id, golden_state["disk_path"])
+        elif spec.get("backing_disk"):
+            disk_path = await run_blocking(create_linked_clone, vm_id, spec["backing_disk"])
+        else:
+            disk_path = await run_blocking(clone_base_image, vm_id, image_type)
+        state["disk_path"] = str(disk_path)
+
+    async def start_domain():
+        xml = build_domain_xml(
+            vm_id=vm_id,
+            name=spec["name"],
+            disk_path=state["disk_path"],
+            iso_path=state["iso_path"],
+            memory_mb=spec["memory_mb"],
+            vcpus=spec["vcpus"],
+            metadata_url=get_metadata_url(vm_id),
+            disk_iops=spec["disk_iops"],
+            disk_bytes_per_sec=spec["disk_bytes_per_sec"],
+            **domain_disk_args(vm_id, image_type)
+        )
+        state["libvirt_uuid"] = await run_blocking(create_domain, xml)
+
+    async def restore_state():
+        state["libvirt_uuid"] = await run_blocking(
+            restore_domain, golden_state["state_path"], vm_id, spec["name"],
+            state["disk_path"], generate_mac_address(vm_id)
+        )
+
+    async def reseed():
+        await run_blocking(
+            reseed_guest, vm_id, golden_state["mac_address"], generate_mac_address(vm_id)
+        )
+        await inject_identity()
+
+    async def reserve_ip():
+        state["vm_ip"] = await run_blocking(reserve_vm_ip, vm_id)
+
+    async def wait_for_ip():
+        state["vm_ip"] = await wait_for_vm_ip(state["libvirt_uuid"])
+
+    async def forward_port():
+        await run_blocking(add_port_forward, host_port, state["vm_ip"])
+
+    async def inject_identity():
+        await run_blocking(
+            set_guest_identity, vm_id, spec["name"],
+            IMAGES[image_type]["username"], spec["ssh_key"]
+        )
+
+    async def limit_disk_io():
+        await run_blocking(
+            set_block_iotune, vm_id, spec["disk_iops"], spec["disk_bytes_per_sec"]
+        )
+
+    if pool_vm:
+        stages = {
+            "injecting_identity": ((), inject_identity),
+            "forwarding_port": ((), forward_port),
+        }
+        # Pool VMs boot without limits; apply the requested ones live
+        if spec["disk_iops"] or spec["disk_bytes_per_sec"]:
+            stages["limiting_disk_io"] = ((), limit_disk_io)
+    elif golden_state:
+        # No cloud-init run: the saved guest is past it
+        stages = {
+            "cloning_disk": ((), clone_disk),
+            "restoring_memory": (("cloning_disk",), restore_state),
+        }
+        if STATIC_DHCP:
+            # The reservation must exist before the guest asks for a lease
+            stages["reserving_ip"] = ((), reserve_ip)
+            stages["injecting_identity"] = (("restoring_memory", "reserving_ip"), reseed)
+            stages["forwarding_port"] = (("reserving_ip",), forward_port)
+        else:
+            stages["injecting_identity"] = (("restoring_memory",), reseed)
+            stages["waiting_for_ip"] = (("injecting_identity",), wait_for_ip)
+            stages["forwarding_port"] = (("waiting_for_ip",), forward_port)
+        # The saved domain has no limits; apply the requested ones live
+        if spec["disk_iops"] or spec["disk_bytes_per_sec"]:
+            stages["limiting_disk_io"] = (("restoring_memory",), limit_disk_io)
+    elif STATIC_DHCP:
+        # The address is pinned before boot, so the forward doesn't wait for the VM
+        stages = {
+            "reserving_ip": ((), reserve_ip),
+            CONFIG_STAGE: ((), build_iso),
+            "cloning_disk": ((), clone_disk),
+            "creating_domain": (("reserving_ip", CONFIG_STAGE, "cloning_disk"), start_domain),
+            "forwarding_port": (("reserving_ip",), forward_port),
+        }
+    else:
+        stages = {
+            CONFIG_STAGE: ((), build_iso),
+            "cloning_disk": ((), clone_disk),
+            "creating_domain": ((CONFIG_STAGE, "cloning_disk"), start_domain),
+            "waiting_for_ip": (("creating_domain",), wait_for_ip),
+            "forwarding_port": (("waiting_for_ip",), forward_port),
+        }
+
+    try:
+        await run_blocking(update_operation, op_id, "running")
+        await run_stage_graph(op_id, stages, timings)
+
+        await run_blocking(update_vm_status, vm_id, spec["owner_id"], "running", state["vm_ip"])
+
+        result = {
+            "id": vm_id,
+            "name": spec["name"],
+            "status": "running",
+            "source": (
+                "warm_pool" if pool_vm
+                else "golden_state" if golden_state
+                else "clone" if spec.get("backing_disk")
+                else "cold_boot"
+            ),
+            "ssh_connection": ssh_connection_info(host_port, image_type),
+            "specs": {
+                "memory_mb": spec["memory_mb"],
+                "vcpus": spec["vcpus"],
+                "image": IMAGES[image_type]["name"]
+            }
+        }
+        await run_blocking(update_operation, op_id, "succeeded", "done", None, result, timings)
+        logger.info(f"VM {vm_id} provisioned (operation {op_id}), timings: {timings}")
+
+    except BaseException as e:
+        # Also covers cancellation on shutdown, so nothing is left half-built
+        error = "cancelled" if isinstance(e, asyncio.CancelledError) else str(e)
+        logger.error(f"VM creation failed: {error}")
+        await run_blocking(
+            cleanup_vm_resources,
+            vm_id, host_port, state["vm_ip"], state["disk_path"],
+            state["iso_path"], state["libvirt_uuid"]
+        )
+        await run_blocking(update_vm_status, vm_id, spec["owner_id"], "error")
+        await run_blocking(update_operation, op_id, "failed", None, error, None, timings)
+        if not isinstance(e, Exception):
+            raise
+
+
+async def run_create_batch(
+    jobs: list[tuple[str, ProvisionSpec, dict | None]],
+    concurrency: int
+) -> None:
+    """
+    Run create pipelines for a batch with at most `concurrency` in flight.
+
+    Each job is (operation id, spec, golden state or None).
+
+    Failures stay per-VM: each pipeline cleans up its own resources and
+    records the error on its operation.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(op_id: str, spec: ProvisionSpec, golden_state: dict | None):
+        async with semaphore:
+            await run_create_pipeline(op_id, spec, golden_state=golden_state)
+
+    await asyncio.gather(*(run_one(*job) for job in jobs))
+
+
+async def run_delete_pipeline(op_id: str, vm: VMRecord, forward_removed: bool = False) -> None:
+    """
+    Tear down a VM whose record was already marked 'deleting'.
+
+    The domain is destroyed and undefined, then its disk, snapshots and
+    cloud-init config are deleted, while the port forward (unless
+    `forward_removed`, see run_delete_batch) and the IP reservation are
+    released alongside. Those steps are best effort, as a half-created VM
+    may lack any of them. The record goes last, which frees its host
+    port. If deleting the files fails the VM is marked 'error' (DELETE
+    can be retried) and the operation 'failed'; a teardown cancelled on
+    shutdown leaves the VM 'deleting' and is resumed at the next startup.
+    """
+    vm_id = vm["id"]
+    timings: dict[str, dict] = {}
+
+    async def best_effort(description: str, func, *args):
+        try:
+            await run_blocking(func, *args)
+        except Exception as e:
+            logger.warning(f"Teardown of {vm_id}: failed to {description}: {e}")
+
+    async def remove_forward():
+        await best_effort("remove port forward", remove_port_forward, vm["host_port"], vm["ip"])
+
+    async def destroy():
+        await best_effort("destroy domain", destroy_domain, vm_id, True)
+
+    async def delete_files():
+        await run_blocking(delete_disk_image, vm_id)
+        await run_blocking(delete_cloud_config, vm_id)
+        await run_blocking(delete_snapshots, vm_id)
+
+    async def release_ip():
+        await best_effort("release IP", release_vm_ip, vm_id)
+
+    stages = {
+        "destroying_domain": ((), destroy),
+        # The disk can only go once no qemu process holds it
+        "deleting_files": (("destroying_domain",), delete_files),
+    }
+    if vm.get("ip") and not forward_removed:
+        stages["removing_forward"] = ((), remove_forward)
+    if STATIC_DHCP:
+        stages["releasing_ip"] = ((), release_ip)
+
+    try:
+        await run_blocking(update_operation, op_id, "running")
+        await run_stage_graph(op_id, stages, timings)
+        await run_blocking(delete_vm_record, vm_id, vm["owner_id"])
+        await run_blocking(
+            update_operation, op_id, "succeeded", "done", None,
+            {"id": vm_id, "name": vm["name"], "deleted": True}, timings
+        )
+        logger.info(f"VM {vm_id} deleted (operation {op_id}), timings: {timings}")
+    except Exception as e:
+        logger.error(f"VM deletion failed: {e}")
+        await run_blocking(update_vm_status, vm_id, vm["owner_id"], "error", vm.get("ip"))
+        await run_blocking(update_operation, op_id, "failed", None, str(e), None, timings)
+
+
+async def run_delete_batch(jobs: list[tuple[str, VMRecord]], concurrency: int) -> None:
+    """
+    Tear down many VMs with at most `concurrency` in flight.
+
+    Each job is (operation id, VM record). The port forwards of the whole
+    batch are removed first in one backend update (a single nftables
+    transaction) instead of one per VM.
+    """
+    forwards = [(vm["host_port"], vm["ip"]) for _, vm in jobs if vm.get("ip")]
+    forward_removed = False
+    if forwards:
+        try:
+            await run_blocking(remove_port_forwards, forwards)
+            forward_removed = True
+        except Exception as e:
+            # Fall back to one removal per VM
+            logger.warning(f"Failed to remove {len(forwards)} port forwards at once: {e}")
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(op_id: str, vm: VMRecord):
+        async with semaphore:
+            await run_delete_pipeline(op_id, vm, forward_removed)
+
+    await asyncio.gather(*(run_one(*job) for job in jobs))
+
+
+def submit(coro) -> asyncio.Task:
+    """Schedule a pipeline coroutine in the background and keep it referenced."""
+    task = asyncio.get_running_loop().create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return task
+
+
+async def shutdown() -> None:
+    """Cancel in-flight pipelines (they clean up after themselves) and stop the executor."""
+    for task in list(_tasks):
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _executor.shutdown(wait=False)
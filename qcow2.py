@@ -0,0 +1,268 @@
+import os
+import struct
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# Native reader/writer for the parts of the qcow2 format the provisioner
+# needs (docs/interop/qcow2.txt in the QEMU tree): creating empty images
+# and copy-on-write overlays, and reading header/backing/allocation info,
+# without forking qemu-img.
+
+MAGIC = b"QFI\xfb"
+CLUSTER_BITS = 16
+CLUSTER_SIZE = 1 << CLUSTER_BITS
+REFCOUNT_ORDER = 4  # 16-bit refcounts, qemu's default
+
+# Version 3 header: fixed fields up to and including header_length
+_HEADER_V3 = struct.Struct(">4sIQIIQIIQQIIQQQQII")
+_HEADER_V2_SIZE = 72
+_HEADER_V3_SIZE = _HEADER_V3.size  # 104
+
+_EXT_END = 0x00000000
+_EXT_BACKING_FORMAT = 0xE2792ACA
+
+_INCOMPAT_DIRTY = 1 << 0
+_INCOMPAT_CORRUPT = 1 << 1
+# Incompatible features we can still read headers and allocation of
+_INCOMPAT_KNOWN = _INCOMPAT_DIRTY | _INCOMPAT_CORRUPT
+
+_L1_OFFSET_MASK = 0x00FFFFFFFFFFFE00
+_L2_OFFSET_MASK = 0x00FFFFFFFFFFFE00
+_L2_COMPRESSED = 1 << 62
+
+
+class Qcow2Error(ValueError):
+    """The file is not a qcow2 image this module can handle."""
+
+
+def _pad8(data: bytes) -> bytes:
+    return data + bytes(-len(data) % 8)
+
+
+def _l1_size(virtual_size: int) -> int:
+    # Each L2 table maps CLUSTER_SIZE / 8 clusters
+    l2_coverage = CLUSTER_SIZE * (CLUSTER_SIZE // 8)
+    return max(1, -(-virtual_size // l2_coverage))
+
+
+def create_image(
+    path: Path,
+    virtual_size: int | None = None,
+    backing_file: str | None = None,
+    backing_format: str = "qcow2"
+) -> Path:
+    """
+    Write an empty qcow2 (v3) image, optionally backed by another image.
+
+    Same layout as `qemu-img create -f qcow2 [-b backing -F fmt]`: header
+    cluster, refcount table, one refcount block and the L1 table, four
+    clusters in total. The file is created exclusively and left sparse.
+
+    Args:
+        path: Image to create (must not exist)
+        virtual_size: Disk size in bytes; defaults to the backing image's
+        backing_file: Backing image path stored in the header
+        backing_format: Format of the backing image
+
+    Raises:
+        Qcow2Error: If no size is given and the backing file can't be read
+        FileExistsError: If `path` exists
+    """
+    if virtual_size is None:
+        if backing_file is None:
+            raise Qcow2Error("virtual_size is required without a backing file")
+        if backing_format != "qcow2":
+            raise Qcow2Error(f"Can't read the size of a {backing_format} backing file")
+        virtual_size = read_header(Path(backing_file))["virtual_size"]
+
+    refcount_table_offset = 1 * CLUSTER_SIZE
+    refcount_block_offset = 2 * CLUSTER_SIZE
+    l1_table_offset = 3 * CLUSTER_SIZE
+    l1_size = _l1_size(virtual_size)
+    if l1_size * 8 > CLUSTER_SIZE:
+        raise Qcow2Error(f"Virtual size {virtual_size} too large for a one-cluster L1 table")
+
+    extensions = b""
+    backing = b""
+    if backing_file:
+        fmt = backing_format.encode()
+        extensions += struct.pack(">II", _EXT_BACKING_FORMAT, len(fmt)) + _pad8(fmt)
+        backing = str(backing_file).encode()
+    extensions += struct.pack(">II", _EXT_END, 0)
+
+    backing_offset = _HEADER_V3_SIZE + len(extensions) if backing else 0
+    if backing_offset + len(backing) > CLUSTER_SIZE or len(backing) > 1023:
+        raise Qcow2Error("Backing file name too long")
+
+    header = _HEADER_V3.pack(
+        MAGIC,
+        3,                        # version
+        backing_offset,
+        len(backing),
+        CLUSTER_BITS,
+        virtual_size,
+        0,                        # crypt_method
+        l1_size,
+        l1_table_offset,
+        refcount_table_offset,
+        1,                        # refcount_table_clusters
+        0,                        # nb_snapshots
+        0,                        # snapshots_offset
+        0,                        # incompatible_features
+        0,                        # compatible_features
+        0,                        # autoclear_features
+        REFCOUNT_ORDER,
+        _HEADER_V3_SIZE,          # header_length
+    )
+
+    # Clusters 0-3 (header, refcount table, refcount block, L1) are in use
+    refcount_table = struct.pack(">Q", refcount_block_offset)
+    refcount_block = struct.pack(">4H", 1, 1, 1, 1)
+
+    with open(path, "xb") as f:
+        f.write(header + extensions + backing)
+        f.seek(refcount_table_offset)
+        f.write(refcount_table)
+        f.seek(refcount_block_offset)
+        f.write(refcount_block)
+        # L1 table is all zeros: nothing allocated yet
+        f.truncate(l1_table_offset + CLUSTER_SIZE)
+
+    return Path(path)
+
+
+def create_overlay(path: Path, backing_file: Path, backing_format: str = "qcow2") -> Path:
+    """Create a copy-on-write overlay of `backing_file` with the same virtual size."""
+    return create_image(path, backing_file=str(backing_file), backing_format=backing_format)
+
+
+def read_header(path: Path) -> dict:
+    """
+    Parse a qcow2 header and its extensions.
+
+    Returns:
+        dict with version, cluster_size, virtual_size, backing_file,
+        backing_format, l1_size, l1_table_offset, refcount_bits,
+        incompatible_features, dirty and corrupt
+
+    Raises:
+        Qcow2Error: If the file is not a (supported) qcow2 image
+    """
+    with open(path, "rb") as f:
+        data = f.read(CLUSTER_SIZE)
+    return _parse_header(data)
+
+
+def _parse_header(data: bytes) -> dict:
+    if len(data) < _HEADER_V2_SIZE or data[:4] != MAGIC:
+        raise Qcow2Error("Not a qcow2 image")
+
+    version = struct.unpack_from(">I", data, 4)[0]
+    if version == 2:
+        fields = struct.unpack_from(">4sIQIIQIIQQIIQ", data)
+        incompatible = 0
+        refcount_order = 4
+        header_length = _HEADER_V2_SIZE
+    elif version == 3:
+        if len(data) < _HEADER_V3_SIZE:
+            raise Qcow2Error("Truncated qcow2 header")
+        fields = _HEADER_V3.unpack_from(data)
+        incompatible = fields[13]
+        refcount_order = fields[16]
+        header_length = fields[17]
+    else:
+        raise Qcow2Error(f"Unsupported qcow2 version {version}")
+
+    (_, _, backing_offset, backing_size, cluster_bits, virtual_size,
+     crypt_method, l1_size, l1_table_offset) = fields[:9]
+
+    if incompatible & ~_INCOMPAT_KNOWN:
+        raise Qcow2Error(f"Unsupported qcow2 incompatible features {incompatible:#x}")
+    if crypt_method:
+        raise Qcow2Error("Encrypted qcow2 images are not supported")
+
+    backing_format = None
+    pos = header_length
+    while pos + 8 <= len(data):
+        ext_type, ext_length = struct.unpack_from(">II", data, pos)
+        if ext_type == _EXT_END:
+            break
+        if ext_type == _EXT_BACKING_FORMAT:
+            backing_format = data[pos + 8:pos + 8 + ext_length].decode()
+        pos += 8 + ext_length + (-ext_length % 8)
+
+    backing_file = None
+    if backing_offset:
+        backing_file = data[backing_offset:backing_offset + backing_size].decode()
+
+    return {
+        "version": version,
+        "cluster_size": 1 << cluster_bits,
+        "virtual_size": virtual_size,
+        "backing_file": backing_file,
+        "backing_format": backing_format,
+        "l1_size": l1_size,
+        "l1_table_offset": l1_table_offset,
+        "refcount_bits": 1 << refcount_order,
+        "incompatible_features": incompatible,
+        "dirty": bool(incompatible & _INCOMPAT_DIRTY),
+        "corrupt": bool(incompatible & _INCOMPAT_CORRUPT),
+    }
+
+
+def count_allocated_clusters(path: Path, header: dict | None = None) -> int:
+    """Number of guest clusters allocated in this image (not counting its backing chain)."""
+    header = header or read_header(path)
+    cluster_size = header["cluster_size"]
+    allocated = 0
+    with open(path, "rb") as f:
+        f.seek(header["l1_table_offset"])
+        l1 = struct.unpack(f">{header['l1_size']}Q", f.read(header["l1_size"] * 8))
+        for l1_entry in l1:
+            l2_offset = l1_entry & _L1_OFFSET_MASK
+            if not l2_offset:
+                continue
+            f.seek(l2_offset)
+            l2 = struct.unpack(f">{cluster_size // 8}Q", f.read(cluster_size))
+            allocated += sum(
+                1 for entry in l2
+                if entry & _L2_COMPRESSED or entry & _L2_OFFSET_MASK
+            )
+    return allocated
+
+
+def image_info(path: Path) -> dict:
+    """
+    Image info in the shape of `qemu-img info --output=json` (for this image only).
+
+    Raises:
+        Qcow2Error: If the file is not a (supported) qcow2 image
+    """
+    path = Path(path)
+    header = read_header(path)
+    info = {
+        "filename": str(path),
+        "format": "qcow2",
+        "virtual-size": header["virtual_size"],
+        "actual-size": os.stat(path).st_blocks * 512,
+        "cluster-size": header["cluster_size"],
+        "dirty-flag": header["dirty"],
+        "allocated-clusters": count_allocated_clusters(path, header),
+        "format-specific": {
+            "type": "qcow2",
+            "data": {
+                "compat": "1.1" if header["version"] == 3 else "0.10",
+                "refcount-bits": header["refcount_bits"],
+                "corrupt": header["corrupt"],
+            }
+        }
+    }
+    if header["backing_file"]:
+        backing = header["backing_file"]
+        info["backing-filename"] = backing
+        info["full-backing-filename"] = str(path.parent / backing) if not os.path.isabs(backing) else backing
+        if header["backing_format"]:
+            info["backing-filename-format"] = header["backing_format"]
+    return info
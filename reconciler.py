@@ -0,0 +1,268 @@
+import os
+import time
+import asyncio
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import TypedDict
+
+from config import (
+    INSTANCE_DIR,
+    CLOUD_INIT_DIR,
+    STORAGE_POOL,
+    RECONCILE_INTERVAL,
+    RECONCILE_GRACE_SECONDS
+)
+from SQL.database import transaction
+from SQL.VM_related import list_vm_states, mark_vms_error
+from SQL.OPERATIONS_related import fail_vm_operations
+from SQL.POOL_related import list_pool_vms
+from SQL.IPS_related import list_ip_allocations
+from SQL.METADATA_related import list_instance_metadata_ids, delete_instance_metadata
+from libvirt_client import list_domain_disks, destroy_domain, get_domain_states
+from ipam import release_vm_ip
+import forwarding
+import golden
+import aio
+
+logger = logging.getLogger(__name__)
+
+# Compares what the database says should exist with what does: libvirt
+# domains, files in INSTANCE_DIR and CLOUD_INIT_DIR, installed port
+# forwards, IP reservations and nocloud documents. Resources no VM record
+# (or warm pool entry, or golden build) owns are removed; running VMs
+# whose domain is gone are marked 'error' (failing their unfinished
+# operations) and missing forwards re-added. VMs left 'deleting' by a
+# restart are main._resume_teardowns' job; here they only count as in flight.
+# Only the domains whose disks live in our directories (or STORAGE_POOL
+# volumes named after the domain) are considered ours.
+
+
+class Inventory(TypedDict):
+    vms: list[dict]
+    known_ids: set[str]
+    domains: dict[str, dict]
+    disk_files: list[tuple[str, float]]
+    iso_files: list[tuple[str, float]]
+    forwards: list[tuple[int, str]]
+    ip_allocations: list[dict]
+    metadata_ids: list[str]
+
+
+def _scan(directory: Path, suffixes: tuple[str, ...]) -> list[tuple[str, float]]:
+    """(path, mtime) of the regular, non-hidden files with one of `suffixes`."""
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                (entry.path, entry.stat().st_mtime)
+                for entry in entries
+                if entry.is_file() and not entry.name.startswith(".") and entry.name.endswith(suffixes)
+            ]
+    except FileNotFoundError:
+        return []
+
+
+def owner_id(path: str) -> str:
+    """VM id a per-VM file belongs to: '<id>.qcow2', '<id>@<snapshot>.raw', '<id>.iso'."""
+    return Path(path).name.split("@")[0].rsplit(".", 1)[0]
+
+
+def collect() -> Inventory:
+    """
+    Read the host state, then the database (blocking).
+
+    In that order: records are written before the resources they own, so
+    anything seen on the host was created after its record, which the
+    database read then includes.
+    """
+    domains = list_domain_disks()
+    disk_files = _scan(INSTANCE_DIR, (".qcow2", ".raw"))
+    iso_files = _scan(CLOUD_INIT_DIR, (".iso",))
+    forwards = forwarding.backend.list_forwards()
+
+    # Pool first: a claim moves a VM from the pool to the vms table in one
+    # transaction, so reading them in this order sees it in at least one
+    pool_ids = {pool_vm["vm_id"] for pool_vm in list_pool_vms()}
+    vms = list_vm_states()
+    known_ids = {vm["id"] for vm in vms} | pool_ids
+    known_ids.update(golden.known_ids())
+    return {
+        "vms": vms,
+        "known_ids": known_ids,
+        "domains": domains,
+        "disk_files": disk_files,
+        "iso_files": iso_files,
+        "forwards": forwards,
+        "ip_allocations": list_ip_allocations(),
+        "metadata_ids": list_instance_metadata_ids(),
+    }
+
+
+def _is_ours(vm_uuid: str, domain: dict) -> bool:
+    roots = (str(INSTANCE_DIR) + os.sep, str(golden.GOLDEN_DIR) + os.sep)
+    return (
+        any(path.startswith(roots) for path in domain["files"])
+        or (STORAGE_POOL, f"{vm_uuid}.raw") in domain["volumes"]
+    )
+
+
+def plan(inventory: Inventory, startup: bool = False, now: float | None = None) -> dict:
+    """
+    Work out the repairs for an inventory (pure; nothing is changed).
+
+    Args:
+        inventory: From collect()
+        startup: No pipeline survives a restart, so VMs still
+            'provisioning' are treated as failed
+        now: Current time for the file grace period (default: time.time())
+
+    Returns:
+        Report with one list per action
+    """
+    now = time.time() if now is None else now
+    known_ids = inventory["known_ids"]
+    domains = inventory["domains"]
+    stale = now - RECONCILE_GRACE_SECONDS
+
+    actions = {
+        "destroy_domains": [],
+        "delete_disks": [],
+        "delete_isos": [],
+        "remove_forwards": [],
+        "add_forwards": [],
+        "release_ips": [],
+        "delete_metadata": [],
+        "mark_error": [],
+    }
+
+    for vm_uuid, domain in sorted(domains.items()):
+        if vm_uuid not in known_ids and _is_ours(vm_uuid, domain):
+            actions["destroy_domains"].append({"uuid": vm_uuid, "name": domain["name"]})
+
+    for key, files in (("delete_disks", inventory["disk_files"]), ("delete_isos", inventory["iso_files"])):
+        actions[key] = sorted(
+            path for path, mtime in files
+            if owner_id(path) not in known_ids and mtime < stale
+        )
+
+    # Forwards of VMs being built or torn down are in flux; leave them alone.
+    # Only ports in START_PORT..END_PORT are managed: the rest aren't ours
+    # (or belong to VMs from before the range was changed).
+    expected: dict[int, str] = {}
+    in_flight: set[int] = set()
+    for vm in inventory["vms"]:
+        if vm["status"] == "running" and vm["id"] not in domains:
+            # Its domain may have appeared since the scan (see _mark_error);
+            # the forward goes on a later run, once the VM is 'error'
+            actions["mark_error"].append({"id": vm["id"], "reason": "domain missing"})
+            in_flight.add(vm["host_port"])
+        elif vm["status"] == "provisioning" and startup:
+            actions["mark_error"].append({"id": vm["id"], "reason": "provisioning interrupted"})
+        elif not forwarding.in_port_range(vm["host_port"]):
+            continue
+        elif vm["status"] == "running" and vm["ip"]:
+            expected[vm["host_port"]] = vm["ip"]
+        elif vm["status"] in ("provisioning", "deleting"):
+            in_flight.add(vm["host_port"])
+
+    seen: set[tuple[int, str]] = set()
+    for host_port, vm_ip in inventory["forwards"]:
+        if host_port in in_flight or not forwarding.in_port_range(host_port):
+            continue
+        if expected.get(host_port) == vm_ip and (host_port, vm_ip) not in seen:
+            seen.add((host_port, vm_ip))
+            continue
+        actions["remove_forwards"].append({"host_port": host_port, "vm_ip": vm_ip})
+    for host_port, vm_ip in sorted(expected.items()):
+        if (host_port, vm_ip) not in seen:
+            actions["add_forwards"].append({"host_port": host_port, "vm_ip": vm_ip})
+
+    for allocation in inventory["ip_allocations"]:
+        if allocation["vm_id"] not in known_ids:
+            actions["release_ips"].append({"vm_id": allocation["vm_id"], "ip": allocation["ip"]})
+    actions["delete_metadata"] = sorted(
+        vm_id for vm_id in inventory["metadata_ids"] if vm_id not in known_ids
+    )
+
+    return {
+        "generated_at": datetime.utcnow().isoformat(),
+        "startup": startup,
+        "total": sum(len(items) for items in actions.values()),
+        "actions": actions,
+    }
+
+
+def _mark_error(vms: list[dict], startup: bool) -> None:
+    """Mark VMs 'error' and fail their unfinished operations with the reason, in one transaction."""
+    # collect() lists domains before it reads the VM records, so a create
+    # pipeline can define a domain and mark its VM 'running' in between;
+    # look again and spare the VMs whose domain exists by now
+    if any(vm["reason"] == "domain missing" for vm in vms):
+        domains = get_domain_states()
+        vms = [vm for vm in vms if vm["reason"] != "domain missing" or vm["id"] not in domains]
+    if not vms:
+        return
+    statuses = ("running", "provisioning") if startup else ("running",)
+    with transaction():
+        mark_vms_error([vm["id"] for vm in vms], statuses)
+        fail_vm_operations([(vm["id"], vm["reason"]) for vm in vms])
+
+
+def apply(report: dict) -> list[str]:
+    """
+    Carry out a plan. Each item is best effort; forwards go through the
+    backend in one batch and status changes in one transaction.
+
+    Returns:
+        Errors of the items that failed
+    """
+    actions = report["actions"]
+    errors = []
+
+    def attempt(description: str, func, *args) -> None:
+        try:
+            func(*args)
+        except Exception as e:
+            logger.warning(f"Reconcile: failed to {description}: {e}")
+            errors.append(f"{description}: {e}")
+
+    for domain in actions["destroy_domains"]:
+        attempt(f"destroy domain {domain['uuid']}", destroy_domain, domain["uuid"], True)
+    for path in actions["delete_disks"] + actions["delete_isos"]:
+        attempt(f"delete {path}", os.unlink, path)
+
+    attempt(
+        "update port forwards",
+        forwarding.backend.update,
+        [(f["host_port"], f["vm_ip"]) for f in actions["add_forwards"]],
+        [(f["host_port"], f["vm_ip"]) for f in actions["remove_forwards"]]
+    )
+
+    for allocation in actions["release_ips"]:
+        attempt(f"release IP of {allocation['vm_id']}", release_vm_ip, allocation["vm_id"])
+    for vm_id in actions["delete_metadata"]:
+        attempt(f"delete metadata of {vm_id}", delete_instance_metadata, vm_id)
+
+    attempt("mark VMs as error", _mark_error, actions["mark_error"], report["startup"])
+
+    logger.info(f"Reconcile: {report['total']} actions, {len(errors)} failed")
+    return errors
+
+
+async def reconcile(dry_run: bool = True, startup: bool = False) -> dict:
+    """Collect, plan and (unless `dry_run`) apply; returns the report."""
+    report = plan(await aio.run(collect), startup)
+    report["dry_run"] = dry_run
+    if not dry_run and report["total"]:
+        report["errors"] = await aio.run(apply, report)
+    return report
+
+
+async def run_periodically() -> None:
+    """Reconcile every RECONCILE_INTERVAL seconds (after the startup run)."""
+    while RECONCILE_INTERVAL > 0:
+        await asyncio.sleep(RECONCILE_INTERVAL)
+        try:
+            await reconcile(dry_run=False)
+        except Exception as e:
+            logger.error(f"Reconcile failed: {e!r}")
@@ -0,0 +1,103 @@
+import uuid
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime
+from pathlib import Path
+
+from config import IMAGES
+from SQL.VM_related import get_vm_by_id, update_vm_disk_path
+from SQL.SNAPSHOTS_related import (
+    add_snapshot,
+    get_snapshot,
+    list_snapshots,
+    is_snapshot_disk,
+    SnapshotRecord
+)
+from libvirt_client import create_external_snapshot, switch_disk_source
+from storage import create_overlay, snapshot_overlay_path
+
+logger = logging.getLogger(__name__)
+
+# Snapshot and revert both replace the VM's current disk; one at a time per VM
+_locks: defaultdict[str, threading.Lock] = defaultdict(threading.Lock)
+
+
+def supports_snapshots(image_type: str | None) -> bool:
+    """External snapshots and linked clones need the qcow2 storage backend."""
+    return IMAGES.get(image_type, {}).get("storage") == "qcow2"
+
+
+def create_snapshot(vm_id: str, owner_id: str, name: str, quiesce: bool = True) -> SnapshotRecord:
+    """
+    Take an external disk snapshot of a VM.
+
+    The VM's current image is frozen as the snapshot's disk and the VM
+    continues on a new overlay, which becomes its recorded disk_path.
+    Frozen images are never written again, so linked clones and reverts
+    can be stacked on them.
+
+    Raises:
+        ValueError: If the VM is gone or already has a snapshot `name`
+    """
+    with _locks[vm_id]:
+        vm = get_vm_by_id(vm_id, owner_id)
+        if vm is None:
+            raise ValueError(f"VM {vm_id} not found")
+        if any(s["name"] == name for s in list_snapshots(vm_id)):
+            raise ValueError(f"Snapshot {name} already exists")
+        
+        snapshot_id = str(uuid.uuid4())
+        overlay_path = snapshot_overlay_path(vm_id, snapshot_id)
+        quiesced = create_external_snapshot(vm_id, snapshot_id, overlay_path, quiesce)
+        
+        snapshot: SnapshotRecord = {
+            "id": snapshot_id,
+            "vm_id": vm_id,
+            "owner_id": owner_id,
+            "name": name,
+            "disk_path": vm["disk_path"],
+            "quiesced": quiesced,
+            "created_at": datetime.utcnow().isoformat()
+        }
+        add_snapshot(snapshot)
+        update_vm_disk_path(vm_id, str(overlay_path))
+    return snapshot
+
+
+def revert_snapshot(vm_id: str, owner_id: str, snapshot_id: str) -> Path:
+    """
+    Put a VM's disk back to a snapshot.
+
+    The VM gets a fresh overlay on the snapshot's frozen image (and is
+    restarted if it ran); its previous overlay is deleted unless a later
+    snapshot froze it.
+
+    Returns:
+        The VM's new disk path
+
+    Raises:
+        ValueError: If the VM or the snapshot is gone
+    """
+    with _locks[vm_id]:
+        vm = get_vm_by_id(vm_id, owner_id)
+        snapshot = get_snapshot(snapshot_id, vm_id)
+        if vm is None or snapshot is None:
+            raise ValueError(f"Snapshot {snapshot_id} of VM {vm_id} not found")
+        
+        overlay_path = snapshot_overlay_path(vm_id, str(uuid.uuid4()))
+        create_overlay(overlay_path, Path(snapshot["disk_path"]))
+        try:
+            switch_disk_source(vm_id, overlay_path)
+        except Exception:
+            overlay_path.unlink(missing_ok=True)
+            raise
+        update_vm_disk_path(vm_id, str(overlay_path))
+        
+        previous = vm["disk_path"]
+        if not is_snapshot_disk(previous):
+            Path(previous).unlink(missing_ok=True)
+            logger.info(f"Deleted discarded disk {previous} of VM {vm_id}")
+    
+    logger.info(f"Reverted VM {vm_id} to snapshot {snapshot['name']}")
+    return overlay_path
@@ -1,15 +1,401 @@
+import os
+import json
+import uuid
+import errno
+import fcntl
 import subprocess
+import threading
 from pathlib import Path
+from collections import Counter
 import logging
+from abc import ABC, abstractmethod
 
-from config import INSTANCE_DIR, IMAGES
+import libvirt
+
+from config import INSTANCE_DIR, IMAGES, OVERLAY_POOL_SIZE, STORAGE_POOL
+import libvirt_client
+import qcow2
 
 logger = logging.getLogger(__name__)
 
+# ioctl(dest_fd, FICLONE, src_fd) shares all of src's extents with dest
+# (linux/fs.h: _IOW(0x94, 9, int)); XFS with reflink=1 and btrfs support it
+FICLONE = 0x40049409
+# errnos meaning "this filesystem/pair of files can't be reflinked"
+_NO_REFLINK = (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS)
+
+
+def _sparse_copy(src_fd: int, dest_fd: int) -> None:
+    """Copy only the data extents of src (SEEK_DATA/SEEK_HOLE), keeping holes."""
+    size = os.fstat(src_fd).st_size
+    offset = 0
+    while offset < size:
+        try:
+            data = os.lseek(src_fd, offset, os.SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                break  # only a hole left
+            raise
+        hole = os.lseek(src_fd, data, os.SEEK_HOLE)
+        while data < hole:
+            copied = os.copy_file_range(src_fd, dest_fd, hole - data, data, data)
+            if copied == 0:
+                break
+            data += copied
+        offset = hole
+    os.ftruncate(dest_fd, size)
+
+
+def reflink_copy(src: Path, dest: Path) -> bool:
+    """
+    Copy a file by reflink, falling back to a sparse copy.
+
+    Args:
+        src: File to copy
+        dest: New file (must not exist)
+
+    Returns:
+        True if dest shares src's extents, False if its data was copied
+    """
+    with open(src, "rb") as fsrc, open(dest, "xb") as fdest:
+        try:
+            fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+            return True
+        except OSError as e:
+            if e.errno not in _NO_REFLINK:
+                raise
+        _sparse_copy(fsrc.fileno(), fdest.fileno())
+        return False
+
+
+class StorageBackend(ABC):
+    """
+    How a VM's disk is created from its image template and managed.
+
+    The backend of an image is its `storage` entry in config.IMAGES.
+    `disk_path` is what is recorded for the VM; `domain_disk` gives the
+    disk arguments for `libvirt_client.build_domain_xml`. `info` and
+    `resize` take the VM's current disk path when it has moved (external
+    snapshots put a new overlay on top of the disk).
+    """
+
+    name = ""
+
+    @abstractmethod
+    def disk_path(self, vm_id: str) -> Path:
+        ...
+
+    @abstractmethod
+    def clone(self, vm_id: str, image_type: str) -> Path:
+        ...
+
+    @abstractmethod
+    def delete(self, vm_id: str) -> None:
+        ...
+
+    @abstractmethod
+    def info(self, vm_id: str, disk_path: Path | None = None) -> dict:
+        ...
+
+    @abstractmethod
+    def resize(self, vm_id: str, new_size_gb: int, disk_path: Path | None = None) -> None:
+        ...
+
+    @abstractmethod
+    def snapshot(self, vm_id: str, name: str) -> None:
+        ...
+
+    @abstractmethod
+    def domain_disk(self, vm_id: str) -> dict:
+        ...
+
+
+class Qcow2Backend(StorageBackend):
+    """qcow2 overlay on the template, taken from the overlay pool when one is ready."""
+
+    name = "qcow2"
+
+    def disk_path(self, vm_id: str) -> Path:
+        return INSTANCE_DIR / f"{vm_id}.qcow2"
+
+    def clone(self, vm_id: str, image_type: str) -> Path:
+        template_path = IMAGES[image_type]["template_path"]
+        dest_path = self.disk_path(vm_id)
+        
+        if overlay_pool.claim(image_type, dest_path):
+            logger.info(f"Took pooled clone of {template_path} for {dest_path}")
+            return dest_path
+        
+        create_overlay(dest_path, template_path)
+        logger.info(f"Created clone {dest_path} from {template_path}")
+        return dest_path
+
+    def delete(self, vm_id: str) -> None:
+        # The disk and the overlays of its external snapshots
+        for disk_path in [self.disk_path(vm_id), *INSTANCE_DIR.glob(f"{vm_id}@*.qcow2")]:
+            if disk_path.exists():
+                disk_path.unlink()
+                logger.info(f"Deleted disk {disk_path}")
+
+    def info(self, vm_id: str, disk_path: Path | None = None) -> dict:
+        disk_path = Path(disk_path or self.disk_path(vm_id))
+        
+        if not disk_path.exists():
+            raise FileNotFoundError(f"Disk not found: {disk_path}")
+        
+        try:
+            return qcow2.image_info(disk_path)
+        except qcow2.Qcow2Error as e:
+            logger.debug(f"Native header parse failed for {disk_path} ({e}), using qemu-img")
+        
+        result = subprocess.run(
+            ["qemu-img", "info", "--output=json", str(disk_path)],
+            capture_output=True,
+            text=True,
+            check=True
+        )
+        return json.loads(result.stdout)
+
+    def resize(self, vm_id: str, new_size_gb: int, disk_path: Path | None = None) -> None:
+        disk_path = Path(disk_path or self.disk_path(vm_id))
+        
+        cmd = ["qemu-img", "resize", str(disk_path), f"{new_size_gb}G"]
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        logger.info(f"Resized {disk_path} to {new_size_gb}GB")
+
+    def snapshot(self, vm_id: str, name: str) -> None:
+        # Internal snapshot inside the image; the VM must be stopped
+        disk_path = self.disk_path(vm_id)
+        
+        cmd = ["qemu-img", "snapshot", "-c", name, str(disk_path)]
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+        logger.info(f"Created snapshot {name} of {disk_path}")
+
+    def domain_disk(self, vm_id: str) -> dict:
+        return {"disk_format": "qcow2"}
+
+
+class ReflinkRawBackend(StorageBackend):
+    """
+    Standalone raw disk per VM, no backing chain.
+
+    Cloned from a raw copy of the template (converted once, next to the
+    qcow2 template) by reflink, so on XFS/btrfs the clone is as cheap as
+    an overlay; other filesystems get a sparse copy.
+    """
+
+    name = "reflink"
+
+    def disk_path(self, vm_id: str) -> Path:
+        return INSTANCE_DIR / f"{vm_id}.raw"
+
+    def _snapshot_path(self, vm_id: str, name: str) -> Path:
+        return INSTANCE_DIR / f"{vm_id}@{name}.raw"
+
+    def raw_template(self, image_type: str) -> Path:
+        """Raw copy of an image's template, (re)converted when the template is newer."""
+        template_path = IMAGES[image_type]["template_path"]
+        raw_path = template_path.with_suffix(".raw")
+        
+        with _raw_template_lock:
+            if raw_path.exists() and raw_path.stat().st_mtime_ns >= template_path.stat().st_mtime_ns:
+                return raw_path
+            
+            tmp_path = raw_path.with_name(f".tmp-{raw_path.name}")
+            cmd = [
+                "qemu-img", "convert",
+                "-f", "qcow2",
+                "-O", "raw",
+                str(template_path),
+                str(tmp_path)
+            ]
+            subprocess.run(cmd, check=True, capture_output=True, text=True)
+            os.rename(tmp_path, raw_path)
+            logger.info(f"Converted {template_path} to raw template {raw_path}")
+            return raw_path
+
+    def clone(self, vm_id: str, image_type: str) -> Path:
+        raw_template = self.raw_template(image_type)
+        dest_path = self.disk_path(vm_id)
+        
+        reflinked = reflink_copy(raw_template, dest_path)
+        how = "reflink" if reflinked else "sparse copy"
+        logger.info(f"Created {dest_path} from {raw_template} ({how})")
+        return dest_path
+
+    def delete(self, vm_id: str) -> None:
+        for path in [self.disk_path(vm_id), *INSTANCE_DIR.glob(f"{vm_id}@*.raw")]:
+            if path.exists():
+                path.unlink()
+                logger.info(f"Deleted disk {path}")
+
+    def info(self, vm_id: str, disk_path: Path | None = None) -> dict:
+        disk_path = Path(disk_path or self.disk_path(vm_id))
+        
+        if not disk_path.exists():
+            raise FileNotFoundError(f"Disk not found: {disk_path}")
+        
+        st = disk_path.stat()
+        return {
+            "filename": str(disk_path),
+            "format": "raw",
+            "virtual-size": st.st_size,
+            "actual-size": st.st_blocks * 512,
+        }
+
+    def resize(self, vm_id: str, new_size_gb: int, disk_path: Path | None = None) -> None:
+        disk_path = Path(disk_path or self.disk_path(vm_id))
+        new_size = new_size_gb * 1024 ** 3
+        
+        if new_size < disk_path.stat().st_size:
+            raise ValueError(f"Refusing to shrink {disk_path} to {new_size_gb}GB")
+        os.truncate(disk_path, new_size)
+        logger.info(f"Resized {disk_path} to {new_size_gb}GB")
+
+    def snapshot(self, vm_id: str, name: str) -> None:
+        snapshot_path = self._snapshot_path(vm_id, name)
+        reflink_copy(self.disk_path(vm_id), snapshot_path)
+        logger.info(f"Created snapshot {snapshot_path}")
+
+    def domain_disk(self, vm_id: str) -> dict:
+        return {"disk_format": "raw"}
+
+
+class LibvirtPoolBackend(StorageBackend):
+    """
+    Raw volume per VM in a libvirt storage pool (dir, logical, rbd, ...).
+
+    The template must be a volume of the same pool (by file name) or of
+    any pool libvirt knows its path in. Clones ask libvirt for a reflink
+    first and fall back to a full copy. The recorded disk path is
+    `<pool>/<volume>`; the domain references the volume, not a file.
+    """
+
+    name = "libvirt-pool"
+
+    def __init__(self, pool_name: str):
+        self.pool_name = pool_name
+
+    def volume_name(self, vm_id: str) -> str:
+        return f"{vm_id}.raw"
+
+    def disk_path(self, vm_id: str) -> Path:
+        return Path(self.pool_name) / self.volume_name(vm_id)
+
+    def _volume_xml(self, name: str, capacity: int) -> str:
+        return (
+            f"<volume><name>{name}</name>"
+            f"<capacity unit='bytes'>{capacity}</capacity>"
+            f"<target><format type='raw'/></target></volume>"
+        )
+
+    def _clone_volume(self, pool, source, name: str) -> None:
+        xml = self._volume_xml(name, source.info()[1])
+        try:
+            pool.createXMLFrom(xml, source, libvirt.VIR_STORAGE_VOL_CREATE_REFLINK)
+        except libvirt.libvirtError as e:
+            logger.debug(f"Reflink clone not possible in pool {self.pool_name} ({e}), copying")
+            pool.createXMLFrom(xml, source, 0)
+
+    def _lookup(self, pool, name: str):
+        """Volume by name, or None if it doesn't exist."""
+        try:
+            return pool.storageVolLookupByName(name)
+        except libvirt.libvirtError as e:
+            if e.get_error_code() == libvirt.VIR_ERR_NO_STORAGE_VOL:
+                return None
+            raise
+
+    def clone(self, vm_id: str, image_type: str) -> Path:
+        template_path = IMAGES[image_type]["template_path"]
+        
+        with libvirt_client.connection() as conn:
+            pool = conn.storagePoolLookupByName(self.pool_name)
+            template = self._lookup(pool, template_path.name)
+            if template is None:
+                template = conn.storageVolLookupByPath(str(template_path))
+            self._clone_volume(pool, template, self.volume_name(vm_id))
+        
+        logger.info(f"Created volume {self.volume_name(vm_id)} in pool {self.pool_name} from {template_path}")
+        return self.disk_path(vm_id)
+
+    def delete(self, vm_id: str) -> None:
+        with libvirt_client.connection() as conn:
+            pool = conn.storagePoolLookupByName(self.pool_name)
+            names = [self.volume_name(vm_id)] + [
+                name for name in pool.listVolumes() if name.startswith(f"{vm_id}@")
+            ]
+            for name in names:
+                volume = self._lookup(pool, name)
+                if volume is not None:
+                    volume.delete(0)
+                    logger.info(f"Deleted volume {name} from pool {self.pool_name}")
+
+    def info(self, vm_id: str, disk_path: Path | None = None) -> dict:
+        with libvirt_client.connection() as conn:
+            pool = conn.storagePoolLookupByName(self.pool_name)
+            volume = self._lookup(pool, self.volume_name(vm_id))
+            if volume is None:
+                raise FileNotFoundError(f"Volume not found: {self.disk_path(vm_id)}")
+            _, capacity, allocation = volume.info()
+            return {
+                "filename": volume.path(),
+                "format": "raw",
+                "virtual-size": capacity,
+                "actual-size": allocation,
+                "pool": self.pool_name,
+            }
+
+    def resize(self, vm_id: str, new_size_gb: int, disk_path: Path | None = None) -> None:
+        with libvirt_client.connection() as conn:
+            pool = conn.storagePoolLookupByName(self.pool_name)
+            pool.storageVolLookupByName(self.volume_name(vm_id)).resize(new_size_gb * 1024 ** 3, 0)
+        logger.info(f"Resized volume {self.disk_path(vm_id)} to {new_size_gb}GB")
+
+    def snapshot(self, vm_id: str, name: str) -> None:
+        with libvirt_client.connection() as conn:
+            pool = conn.storagePoolLookupByName(self.pool_name)
+            source = pool.storageVolLookupByName(self.volume_name(vm_id))
+            self._clone_volume(pool, source, f"{vm_id}@{name}.raw")
+        logger.info(f"Created snapshot {vm_id}@{name}.raw in pool {self.pool_name}")
+
+    def domain_disk(self, vm_id: str) -> dict:
+        return {
+            "disk_format": "raw",
+            "disk_pool": self.pool_name,
+            "disk_volume": self.volume_name(vm_id),
+        }
+
+
+_raw_template_lock = threading.Lock()
+
+# Backends by IMAGES "storage" name
+backends: dict[str, StorageBackend] = {
+    "qcow2": Qcow2Backend(),
+    "reflink": ReflinkRawBackend(),
+    "libvirt-pool": LibvirtPoolBackend(STORAGE_POOL),
+}
+
+
+def get_backend(image_type: str | None = None) -> StorageBackend:
+    """Storage backend of an image type (qcow2 when not known)."""
+    if image_type is None:
+        return backends["qcow2"]
+    return backends[IMAGES[image_type]["storage"]]
+
+
+def _backends_in_use() -> list[StorageBackend]:
+    return [backends[name] for name in dict.fromkeys(image["storage"] for image in IMAGES.values())]
+
+
+def get_disk_path(vm_id: str, image_type: str | None = None) -> Path:
+    """Path (or `<pool>/<volume>` for libvirt pools) of the disk that belongs to a VM."""
+    return get_backend(image_type).disk_path(vm_id)
+
 
 def clone_base_image(vm_id: str, image_type: str) -> Path:
     """
-    Create copy-on-write clone of template image.
+    Create a VM's disk from its image template, with the image's storage backend.
     
     Args:
         vm_id: UUID for the new VM
@@ -19,7 +405,6 @@ def clone_base_image(vm_id: str, image_type: str) -> Path:
         Path to cloned disk image
     """
     template_path = IMAGES[image_type]["template_path"]
-    dest_path = INSTANCE_DIR / f"{vm_id}.qcow2"
     
     # Ensure instance directory exists
     INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
@@ -28,54 +413,258 @@ def clone_base_image(vm_id: str, image_type: str) -> Path:
     if not template_path.exists():
         raise FileNotFoundError(f"Template not found: {template_path}")
     
-    # Create copy-on-write clone (backing file)
-    cmd = [
-        "qemu-img", "create",
-        "-f", "qcow2",
-        "-F", "qcow2",
-        "-b", str(template_path),
-        str(dest_path)
-    ]
-    
-    subprocess.run(cmd, check=True, capture_output=True, text=True)
-    logger.info(f"Created clone {dest_path} from {template_path}")
-    
+    return get_backend(image_type).clone(vm_id, image_type)
+
+
+def snapshot_overlay_path(vm_id: str, snapshot_id: str) -> Path:
+    """Overlay a VM writes to after an external snapshot (or a revert to one)."""
+    return INSTANCE_DIR / f"{vm_id}@{snapshot_id}.qcow2"
+
+
+def create_linked_clone(vm_id: str, backing_path: Path) -> Path:
+    """
+    Create a VM's disk as a qcow2 overlay on a snapshot of another VM's disk.
+
+    Args:
+        vm_id: UUID for the new VM
+        backing_path: Frozen disk image of the snapshot
+
+    Returns:
+        Path to the new disk (the qcow2 backend's path for the VM)
+    """
+    dest_path = backends["qcow2"].disk_path(vm_id)
+    INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
+    create_overlay(dest_path, Path(backing_path))
+    logger.info(f"Created linked clone {dest_path} on {backing_path}")
     return dest_path
 
 
-def delete_disk_image(vm_id: str) -> None:
-    """Remove VM disk image."""
-    disk_path = INSTANCE_DIR / f"{vm_id}.qcow2"
-    if disk_path.exists():
-        disk_path.unlink()
-        logger.info(f"Deleted disk {disk_path}")
+def domain_disk_args(vm_id: str, image_type: str) -> dict:
+    """Disk format/source arguments for build_domain_xml."""
+    return get_backend(image_type).domain_disk(vm_id)
 
 
-def get_disk_info(vm_id: str) -> dict:
-    """Get qcow2 image info (size, backing file, etc)."""
-    disk_path = INSTANCE_DIR / f"{vm_id}.qcow2"
-    
-    if not disk_path.exists():
-        raise FileNotFoundError(f"Disk not found: {disk_path}")
-    
-    result = subprocess.run(
-        ["qemu-img", "info", "--output=json", str(disk_path)],
-        capture_output=True,
-        text=True,
-        check=True
-    )
+def create_overlay(dest_path: Path, template_path: Path) -> None:
+    """
+    Create a copy-on-write overlay (backing file) of a template.
+
+    Written natively when the template's header can be read, otherwise
+    through qemu-img.
+    """
+    try:
+        qcow2.create_overlay(dest_path, template_path)
+    except qcow2.Qcow2Error as e:
+        logger.debug(f"Native overlay not possible for {template_path} ({e}), using qemu-img")
+        cmd = [
+            "qemu-img", "create",
+            "-f", "qcow2",
+            "-F", "qcow2",
+            "-b", str(template_path),
+            str(dest_path)
+        ]
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+
+
+def template_stamp(template_path: Path) -> str:
+    """
+    Identity of a template file's current contents.
+
+    Replacing or rewriting the template changes its inode, size or mtime;
+    hashing multi-GB templates would cost more than the overlays save.
+    """
+    st = template_path.stat()
+    return f"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"
+
+
+class OverlayPool:
+    """
+    Ready-made overlays per image type, so creating a VM disk is one rename.
+
+    Overlays live in `<root>/<image_type>/<template stamp>/`. They are
+    written under a temporary name and renamed into place, so a claim
+    never sees a partial file. A claim renames one of them to the VM's
+    disk path. Overlays made for an older version of the template (another
+    stamp) are never handed out and are deleted on the next refill. A
+    background thread refills an image's pool after every claim.
+    """
+
+    def __init__(self, root: Path, size: int):
+        self.root = Path(root)
+        self.size = size
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+        self.invalidations: Counter = Counter()
+        self._pending: set[str] = set()
+        self._wakeup = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._stop = False
+
+    def _stamp_dir(self, image_type: str) -> Path | None:
+        template_path = IMAGES[image_type]["template_path"]
+        try:
+            return self.root / image_type / template_stamp(template_path)
+        except FileNotFoundError:
+            return None
+
+    def _ready(self, stamp_dir: Path) -> list[Path]:
+        try:
+            return sorted(stamp_dir.glob("*.qcow2"))
+        except FileNotFoundError:
+            return []
+
+    def claim(self, image_type: str, dest_path: Path) -> bool:
+        """Move a pooled overlay to `dest_path`; False if none is ready."""
+        if self.size <= 0:
+            return False
+        
+        stamp_dir = self._stamp_dir(image_type)
+        for overlay in self._ready(stamp_dir) if stamp_dir else []:
+            if dest_path.exists():
+                raise FileExistsError(f"Disk already exists: {dest_path}")
+            try:
+                os.rename(overlay, dest_path)
+            except FileNotFoundError:
+                continue  # taken by a concurrent claim
+            self.hits[image_type] += 1
+            self.schedule_refill(image_type)
+            return True
+        
+        self.misses[image_type] += 1
+        self.schedule_refill(image_type)
+        return False
+
+    def refill(self, image_type: str) -> None:
+        """Drop overlays of old template versions and top the pool up to size."""
+        stamp_dir = self._stamp_dir(image_type)
+        if stamp_dir is None:
+            return
+        
+        image_dir = stamp_dir.parent
+        if image_dir.exists():
+            for entry in image_dir.iterdir():
+                if entry != stamp_dir:
+                    self.invalidations[image_type] += sum(1 for _ in entry.glob("*.qcow2"))
+                    for path in entry.iterdir():
+                        path.unlink()
+                    entry.rmdir()
+                    logger.info(f"Discarded overlay pool {entry} (template changed)")
+        stamp_dir.mkdir(parents=True, exist_ok=True)
+        for tmp in stamp_dir.glob(".tmp-*"):
+            tmp.unlink()
+        
+        template_path = IMAGES[image_type]["template_path"]
+        while len(self._ready(stamp_dir)) < self.size and not self._stop:
+            name = str(uuid.uuid4())
+            tmp_path = stamp_dir / f".tmp-{name}.qcow2"
+            create_overlay(tmp_path, template_path)
+            os.rename(tmp_path, stamp_dir / f"{name}.qcow2")
+
+    def schedule_refill(self, image_type: str) -> None:
+        """Queue a background refill (no-op until start())."""
+        if self._thread is None:
+            return
+        with self._wakeup:
+            self._pending.add(image_type)
+            self._wakeup.notify()
+
+    def start(self) -> None:
+        """Start the refill thread and fill every image's pool (idempotent)."""
+        if self._thread is not None or self.size <= 0:
+            return
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="overlay-pool", daemon=True)
+        self._thread.start()
+        for image_type in _pooled_images():
+            self.schedule_refill(image_type)
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+        with self._wakeup:
+            self._stop = True
+            self._wakeup.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._wakeup:
+                while not self._pending and not self._stop:
+                    self._wakeup.wait()
+                if self._stop:
+                    return
+                image_type = self._pending.pop()
+            try:
+                self.refill(image_type)
+            except Exception as e:
+                logger.warning(f"Failed to refill overlay pool for {image_type}: {e}")
+
+    def stats(self) -> dict:
+        """Per-image pool depth, hit/miss counters and hit ratio."""
+        result = {}
+        for image_type in _pooled_images():
+            stamp_dir = self._stamp_dir(image_type)
+            hits, misses = self.hits[image_type], self.misses[image_type]
+            result[image_type] = {
+                "target": self.size,
+                "ready": len(self._ready(stamp_dir)) if stamp_dir else 0,
+                "hits": hits,
+                "misses": misses,
+                "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else None,
+                "invalidated": self.invalidations[image_type],
+            }
+        return result
+
+
+def _pooled_images() -> list[str]:
+    return [image_type for image_type, image in IMAGES.items() if image["storage"] == "qcow2"]
+
+
+# Shared pool of ready overlays under INSTANCE_DIR/.pool
+overlay_pool = OverlayPool(INSTANCE_DIR / ".pool", OVERLAY_POOL_SIZE)
+
+
+def delete_disk_image(vm_id: str, image_type: str | None = None) -> None:
+    """Remove VM disk image (from every backend in use when the image type isn't given)."""
+    for backend in [get_backend(image_type)] if image_type else _backends_in_use():
+        backend.delete(vm_id)
+
+
+def get_disk_info(
+    vm_id: str,
+    image_type: str | None = None,
+    disk_path: Path | None = None
+) -> dict:
+    """
+    Get disk info (size, format, backing file, etc) in `qemu-img info` keys.
+
+    `disk_path` is the VM's current disk when it differs from the
+    backend's default (after external snapshots).
+    """
+    if image_type:
+        return get_backend(image_type).info(vm_id, disk_path)
     
-    import json
-    return json.loads(result.stdout)
+    for backend in _backends_in_use():
+        try:
+            return backend.info(vm_id)
+        except FileNotFoundError:
+            continue
+    raise FileNotFoundError(f"Disk not found: {get_disk_path(vm_id)}")
 
 
-def resize_disk(vm_id: str, new_size_gb: int) -> None:
+def resize_disk(
+    vm_id: str,
+    new_size_gb: int,
+    image_type: str | None = None,
+    disk_path: Path | None = None
+) -> None:
     """
     Resize VM disk. Must be done while VM is stopped.
-    Size is in GB, converted to qemu-img format (e.g., '20G').
+    Size is in GB.
     """
-    disk_path = INSTANCE_DIR / f"{vm_id}.qcow2"
-    
-    cmd = ["qemu-img", "resize", str(disk_path), f"{new_size_gb}G"]
-    subprocess.run(cmd, check=True, capture_output=True, text=True)
-    logger.info(f"Resized {disk_path} to {new_size_gb}GB")
\ No newline at end of file
+    get_backend(image_type).resize(vm_id, new_size_gb, disk_path)
+
+
+def snapshot_disk(vm_id: str, name: str, image_type: str | None = None) -> None:
+    """Snapshot a stopped VM's disk under `name`, in its backend's native way."""
+    get_backend(image_type).snapshot(vm_id, name)
@@ -0,0 +1,30 @@
+"""
+Tests for aio module.
+"""
+import threading
+import pytest
+
+
+class TestAio:
+    """Test the async host I/O facade."""
+
+    @pytest.mark.asyncio
+    async def test_run_uses_host_io_executor(self):
+        """Test blocking calls run on the dedicated executor, not the loop thread."""
+        import aio
+        
+        name = await aio.run(lambda: threading.current_thread().name)
+        
+        assert name.startswith("host-io")
+
+    @pytest.mark.asyncio
+    async def test_facade_calls_through(self, monkeypatch):
+        """Test facade functions forward their arguments to the blocking API."""
+        import aio
+        
+        calls = []
+        monkeypatch.setattr(aio.libvirt_client, "set_block_iotune", lambda *args: calls.append(args))
+        
+        await aio.set_block_iotune("vm-1", 500, 0)
+        
+        assert calls == [("vm-1", 500, 0)]
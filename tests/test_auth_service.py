@@ -57,3 +57,30 @@ class TestAuthService:
             await get_current_user(x_api_key="fake-key")
         
         assert exc_info.value.status_code == 401
+
+    @pytest.mark.asyncio
+    async def test_require_admin(self, monkeypatch):
+        """Test only the configured admin key passes; tenant keys get 403."""
+        import auth_service
+        from SQL.USERS_related import add_user
+        
+        monkeypatch.setattr(auth_service, "ADMIN_API_KEY", "admin-key")
+        add_user(name="testuser", password="password123", plaintext_api_key="tenant-key")
+        
+        await auth_service.require_admin(x_api_key="admin-key")
+        with pytest.raises(HTTPException) as exc_info:
+            await auth_service.require_admin(x_api_key="tenant-key")
+        
+        assert exc_info.value.status_code == 403
+
+    @pytest.mark.asyncio
+    async def test_require_admin_unset(self, monkeypatch):
+        """Test admin endpoints are closed when no ADMIN_API_KEY is configured."""
+        import auth_service
+        
+        monkeypatch.setattr(auth_service, "ADMIN_API_KEY", "")
+        
+        with pytest.raises(HTTPException) as exc_info:
+            await auth_service.require_admin(x_api_key="")
+        
+        assert exc_info.value.status_code == 403
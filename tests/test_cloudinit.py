@@ -38,6 +38,19 @@ class TestCloudInit:
         assert "sudo: ALL=(ALL) NOPASSWD:ALL" in result
         assert "ssh_authorized_keys:" in result
 
+    def test_render_user_data_without_ssh_key(self):
+        """Test user-data for warm pool VMs has no authorized keys entry."""
+        from cloudinit import render_template
+        
+        result = render_template("user-data.yaml.j2", {
+            "name": "pool-vm",
+            "username": "debian",
+            "ssh_key": ""
+        })
+        
+        assert "name: debian" in result
+        assert "ssh_authorized_keys" not in result
+
     def test_render_meta_data_template(self):
         """Test meta-data.yaml.j2 rendering."""
         from cloudinit import render_template
@@ -119,3 +132,35 @@ class TestCloudInit:
         from cloudinit import delete_config_iso
         
         delete_config_iso("nonexistent-vm")
+
+    def _read_iso(self, iso_file, **path):
+        import io
+        import pycdlib
+        
+        iso = pycdlib.PyCdlib()
+        iso.open(str(iso_file))
+        out = io.BytesIO()
+        iso.get_file_from_iso_fp(out, **path)
+        iso.close()
+        return out.getvalue()
+
+    def test_template_iso_readable_in_all_namespaces(self):
+        """Test the template-patched ISO holds the documents under ISO9660, Joliet and Rock Ridge names."""
+        from cloudinit import create_config_iso, render_config
+        
+        iso_path = create_config_iso("test-vm-tpl", "tpl-vm", "debian-12", "ssh-rsa AAAA test")
+        user_data, meta_data = render_config("test-vm-tpl", "tpl-vm", "debian-12", "ssh-rsa AAAA test")
+        
+        assert self._read_iso(iso_path, iso_path="/USER_DATA;1") == user_data.encode()
+        assert self._read_iso(iso_path, joliet_path="/user-data") == user_data.encode()
+        assert self._read_iso(iso_path, rr_path="/user-data") == user_data.encode()
+        assert self._read_iso(iso_path, rr_path="/meta-data") == meta_data.encode()
+
+    def test_oversized_config_falls_back_to_pycdlib(self):
+        """Test documents larger than the template's extents still produce a valid ISO."""
+        from cloudinit import create_config_iso, USER_DATA_CAPACITY
+        
+        ssh_key = "ssh-rsa " + "A" * USER_DATA_CAPACITY
+        iso_path = create_config_iso("test-vm-big", "big-vm", "debian-12", ssh_key)
+        
+        assert ssh_key.encode() in self._read_iso(iso_path, rr_path="/user-data")
@@ -67,3 +67,27 @@ class TestConfig:
         from config import CLOUD_INIT_ISO_LABEL
         
         assert CLOUD_INIT_ISO_LABEL == 'cidata'
+
+    def test_parse_image_counts(self):
+        """Test parsing per-image pool sizes."""
+        from config import parse_image_counts
+        
+        assert parse_image_counts("") == {}
+        assert parse_image_counts("debian-12=2, alpine=1") == {"debian-12": 2, "alpine": 1}
+
+    def test_parse_image_counts_unknown_image(self):
+        """Test unknown image types are rejected."""
+        from config import parse_image_counts
+        
+        with pytest.raises(ValueError, match="Unknown image type"):
+            parse_image_counts("windows=3")
+
+    def test_parse_image_settings(self):
+        """Test parsing per-image string settings such as storage backends."""
+        from config import parse_image_settings, IMAGES, STORAGE_BACKENDS
+        
+        assert parse_image_settings("debian-12=reflink, alpine = libvirt-pool") == {
+            "debian-12": "reflink", "alpine": "libvirt-pool"
+        }
+        for image_config in IMAGES.values():
+            assert image_config["storage"] in STORAGE_BACKENDS
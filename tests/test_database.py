@@ -37,6 +37,11 @@ class TestDatabase:
                 "SELECT name FROM sqlite_master WHERE type='table' AND name='vms'"
             )
             assert cursor.fetchone() is not None
+            
+            cursor = conn.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' AND name='operations'"
+            )
+            assert cursor.fetchone() is not None
 
     def test_users_table_schema(self):
         """Test users table has correct schema."""
@@ -68,6 +73,30 @@ class TestDatabase:
             assert 'disk_path' in columns
             assert 'iso_path' in columns
             assert 'created_at' in columns
+            assert 'image_type' in columns
+            assert 'memory_mb' in columns
+            assert 'vcpus' in columns
+
+    def test_init_db_migrates_old_vms_table(self):
+        """Test init_db adds new columns to a vms table from an older release."""
+        import sqlite3
+        from config import DB_PATH
+        from pathlib import Path
+        from SQL.database import init_db, get_conn
+        
+        Path(DB_PATH).unlink()
+        with sqlite3.connect(DB_PATH) as conn:
+            conn.execute("""CREATE TABLE vms (
+                id TEXT PRIMARY KEY, name TEXT NOT NULL, owner_id TEXT NOT NULL,
+                status TEXT NOT NULL, ip TEXT, host_port INTEGER UNIQUE NOT NULL,
+                disk_path TEXT NOT NULL, iso_path TEXT NOT NULL, created_at TEXT NOT NULL
+            )""")
+        
+        init_db()
+        
+        with get_conn() as conn:
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(vms)")}
+        assert {'image_type', 'memory_mb', 'vcpus'} <= columns
 
     def test_get_conn_context_manager(self):
         """Test get_conn works as context manager."""
@@ -89,3 +118,78 @@ class TestDatabase:
             row = conn.execute("SELECT * FROM users WHERE id = ?", ("test-id",)).fetchone()
             assert row['id'] == "test-id"
             assert row['name'] == "testuser"
+
+    def test_vm_listing_uses_index(self):
+        """Test listing a tenant's VMs is an index range scan, without a sort."""
+        from SQL.database import get_conn
+        
+        with get_conn() as conn:
+            plan = " ".join(row[3] for row in conn.execute(
+                """EXPLAIN QUERY PLAN SELECT * FROM vms
+                   WHERE owner_id = ? AND (created_at, id) < (?, ?)
+                   ORDER BY created_at DESC, id DESC LIMIT ?""",
+                ("owner", "2024-01-01", "vm", 10)
+            ))
+        
+        assert "USING INDEX vms_owner_created" in plan
+        assert "TEMP B-TREE" not in plan
+
+    def test_wal_mode(self):
+        """Test the database runs in WAL mode with the tuned settings."""
+        from SQL.database import get_conn
+        
+        with get_conn() as conn:
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+
+    def test_connection_reused_per_thread(self):
+        """Test a thread keeps its connection and other threads get their own."""
+        import threading
+        from SQL.database import get_conn
+        
+        with get_conn() as first:
+            pass
+        with get_conn() as second:
+            pass
+        assert first is second
+        
+        other = []
+        thread = threading.Thread(target=lambda: other.append(get_conn().__enter__()))
+        thread.start()
+        thread.join()
+        assert other[0] is not first
+
+    def test_uncommitted_writes_rolled_back(self):
+        """Test a write left uncommitted doesn't leak into the next use."""
+        from SQL.database import get_conn
+        
+        with get_conn() as conn:
+            conn.execute("INSERT INTO users (id, name, hashed_password, api_key_hash) VALUES ('u', 'n', 'h', 'k')")
+        
+        with get_conn() as conn:
+            assert conn.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+
+    def test_transaction_commits_together(self, sample_vm_record):
+        """Test SQL functions inside transaction() commit as one."""
+        from SQL.database import transaction
+        from SQL.VM_related import add_vm_record, list_vms_by_owner
+        
+        with transaction():
+            add_vm_record(sample_vm_record)
+            add_vm_record({**sample_vm_record, "id": "vm-2", "host_port": 2223})
+        
+        assert len(list_vms_by_owner(sample_vm_record["owner_id"])) == 2
+
+    def test_transaction_rolls_back_together(self, sample_vm_record):
+        """Test an error undoes the writes the functions already 'committed'."""
+        from SQL.database import transaction
+        from SQL.VM_related import add_vm_record, list_vms_by_owner
+        from SQL.PORTS_related import reserve_ports, count_free_ports
+        
+        with pytest.raises(RuntimeError):
+            with transaction():
+                add_vm_record(sample_vm_record)
+                reserve_ports(1000)
+        
+        assert list_vms_by_owner(sample_vm_record["owner_id"]) == []
+        assert count_free_ports() == 101
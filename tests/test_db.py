@@ -0,0 +1,82 @@
+"""
+Tests for db module.
+"""
+import time
+import asyncio
+import sqlite3
+import threading
+import pytest
+
+
+class TestDb:
+    """Test the async database facade."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+
+        from SQL.database import init_db
+        init_db()
+
+        yield
+
+    @pytest.mark.asyncio
+    async def test_run_uses_db_executor(self):
+        """Test queries run on the dedicated executor, not the loop thread."""
+        import db
+
+        name = await db.run(lambda: threading.current_thread().name)
+
+        assert name.startswith("db")
+
+    @pytest.mark.asyncio
+    async def test_users_round_trip(self):
+        """Test signup, lookup by key and key rotation through the facade."""
+        import db
+
+        user = await db.add_user("alice", "secret", "key-1")
+        assert (await db.get_user_by_api_key("key-1"))["id"] == user["id"]
+
+        assert await db.update_api_key(user["id"], "key-2") is True
+        assert await db.get_user_by_api_key("key-1") is None
+        assert (await db.get_user_by_name("alice"))["id"] == user["id"]
+
+    @pytest.mark.asyncio
+    async def test_loop_responsive_while_database_locked(self):
+        """Test the event loop keeps running while a write waits for a locked database."""
+        import db
+        from config import DB_PATH
+
+        user = await db.add_user("alice", "secret", "key-1")
+
+        # Another writer holds the write lock for half a second
+        locker = sqlite3.connect(DB_PATH, check_same_thread=False)
+        locker.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.5, locker.rollback).start()
+
+        gaps = []
+
+        async def ticker():
+            last = time.perf_counter()
+            while True:
+                await asyncio.sleep(0.01)
+                now = time.perf_counter()
+                gaps.append(now - last)
+                last = now
+
+        ticks = asyncio.ensure_future(ticker())
+        start = time.perf_counter()
+        assert await db.update_api_key(user["id"], "key-2") is True
+        waited = time.perf_counter() - start
+        ticks.cancel()
+        locker.close()
+
+        assert waited >= 0.4
+        assert len(gaps) >= 20
+        assert max(gaps) < 0.1
@@ -0,0 +1,126 @@
+"""
+Tests for domain_cache module.
+"""
+import pytest
+
+
+class FakeDomain:
+    def __init__(self, uuid, state=None):
+        self.uuid = uuid
+        self._state = state
+
+    def UUIDString(self):
+        return self.uuid
+
+
+class FakeConn:
+    def __init__(self, domains):
+        self.domains = domains
+
+    def getAllDomainStats(self, stats):
+        return [(dom, {"state.state": dom._state, "state.reason": 0}) for dom in self.domains]
+
+
+class FakeEventConn(FakeConn):
+    """Read-only connection whose first `failures` resyncs fail."""
+
+    def __init__(self, domains, failures=0):
+        super().__init__(domains)
+        self.failures = failures
+        self.closed = False
+
+    def setKeepAlive(self, interval, count):
+        pass
+
+    def registerCloseCallback(self, cb, opaque):
+        pass
+
+    def domainEventRegisterAny(self, dom, event_id, cb, opaque):
+        pass
+
+    def getAllDomainStats(self, stats):
+        import libvirt
+        if self.failures:
+            self.failures -= 1
+            raise libvirt.libvirtError("Cannot recv data")
+        return super().getAllDomainStats(stats)
+
+    def close(self):
+        self.closed = True
+
+
+class TestDomainStateCache:
+    """Test the event-driven domain state cache."""
+
+    @pytest.fixture
+    def cache(self):
+        from domain_cache import DomainStateCache
+        
+        return DomainStateCache("test:///default")
+
+    def test_resync_replaces_states(self, cache):
+        """Test a resync loads every domain and drops unknown ones."""
+        import libvirt
+        
+        cache.set("gone", "running")
+        cache.resync(FakeConn([
+            FakeDomain("vm-1", libvirt.VIR_DOMAIN_RUNNING),
+            FakeDomain("vm-2", libvirt.VIR_DOMAIN_SHUTOFF),
+        ]))
+        
+        assert cache.get("vm-1")[0] == "running"
+        assert cache.get("vm-2")[0] == "shutoff"
+        assert cache.get("gone") is None
+
+    def test_lifecycle_events_update_state(self, cache):
+        """Test lifecycle events move a domain between states."""
+        import libvirt
+        
+        dom = FakeDomain("vm-1")
+        cache._on_lifecycle(None, dom, libvirt.VIR_DOMAIN_EVENT_DEFINED, 0, None)
+        assert cache.get("vm-1")[0] == "shutoff"
+        
+        cache._on_lifecycle(None, dom, libvirt.VIR_DOMAIN_EVENT_STARTED, 0, None)
+        assert cache.get("vm-1")[0] == "running"
+        
+        cache._on_lifecycle(None, dom, libvirt.VIR_DOMAIN_EVENT_SUSPENDED, 0, None)
+        assert cache.get("vm-1")[0] == "paused"
+        
+        cache._on_lifecycle(None, dom, libvirt.VIR_DOMAIN_EVENT_DEFINED, 0, None)
+        assert cache.get("vm-1")[0] == "paused"
+        
+        cache._on_lifecycle(None, dom, libvirt.VIR_DOMAIN_EVENT_UNDEFINED, 0, None)
+        assert cache.get("vm-1") is None
+
+    def test_info_reports_staleness(self, cache):
+        """Test the cache is stale until connected and resynced, and after a disconnect."""
+        assert cache.info()["stale"] is True
+        
+        cache._connected = True
+        cache.resync(FakeConn([]))
+        assert cache.info()["stale"] is False
+        assert cache.info()["synced_at"] is not None
+        
+        cache._on_close(None, 0, None)
+        assert cache.info()["stale"] is True
+
+    def test_failed_resync_retried(self, cache, monkeypatch):
+        """Test a connect whose resync fails is dropped, so the next attempt reconnects."""
+        import libvirt
+        import domain_cache
+        
+        first = FakeEventConn([], failures=1)
+        conns = iter([first, FakeEventConn([FakeDomain("vm-1", libvirt.VIR_DOMAIN_RUNNING)])])
+        monkeypatch.setattr(domain_cache.libvirt, "openReadOnly", lambda uri: next(conns))
+        
+        with pytest.raises(libvirt.libvirtError):
+            cache._connect()
+        
+        assert first.closed
+        assert not cache._connected
+        assert cache.info()["live"] is False
+        
+        cache._connect()
+        
+        assert cache.info()["live"] is True
+        assert cache.get("vm-1")[0] == "running"
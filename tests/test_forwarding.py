@@ -0,0 +1,163 @@
+"""
+Tests for forwarding module.
+"""
+import threading
+import pytest
+
+
+class TestIptablesBackend:
+    """Test the per-VM iptables rules (dry run)."""
+
+    def test_add_and_remove(self):
+        """Test a forward is a DNAT and a FORWARD rule, removed with -D."""
+        from forwarding import IptablesBackend
+
+        backend = IptablesBackend(dry_run=True)
+        backend.add(2222, "192.168.122.10")
+        backend.remove(2222, "192.168.122.10")
+
+        assert backend.applied == [
+            ["iptables", "-t", "nat", "-A", "PREROUTING", "-p", "tcp", "--dport", "2222",
+             "-j", "DNAT", "--to-destination", "192.168.122.10:22"],
+            ["iptables", "-A", "FORWARD", "-p", "tcp", "-d", "192.168.122.10",
+             "--dport", "22", "-j", "ACCEPT"],
+            ["iptables", "-t", "nat", "-D", "PREROUTING", "-p", "tcp", "--dport", "2222",
+             "-j", "DNAT", "--to-destination", "192.168.122.10:22"],
+            ["iptables", "-D", "FORWARD", "-p", "tcp", "-d", "192.168.122.10",
+             "--dport", "22", "-j", "ACCEPT"],
+        ]
+
+    def test_parse_forwards(self):
+        """Test SSH DNAT rules in the port range are read back from iptables -S, duplicates included."""
+        from forwarding import parse_iptables_forwards
+
+        rules = "\n".join([
+            "-P PREROUTING ACCEPT",
+            "-A PREROUTING -p tcp -m tcp --dport 2222 -j DNAT --to-destination 192.168.122.10:22",
+            "-A PREROUTING -p tcp -m tcp --dport 2222 -j DNAT --to-destination 192.168.122.10:22",
+            "-A PREROUTING -p tcp -m tcp --dport 8080 -j DNAT --to-destination 192.168.122.20:80",
+            "-A PREROUTING -p tcp -m tcp --dport 22022 -j DNAT --to-destination 10.0.0.5:22",
+            "-A PREROUTING -m addrtype --dst-type LOCAL -j DOCKER",
+        ])
+
+        assert parse_iptables_forwards(rules) == [(2222, "192.168.122.10"), (2222, "192.168.122.10")]
+
+    def test_incomplete_backend_rejected(self):
+        """Test a backend missing part of the interface fails when created, not when called."""
+        from forwarding import ForwardingBackend
+        
+        class AddOnly(ForwardingBackend):
+            def add(self, host_port, vm_ip):
+                pass
+        
+        with pytest.raises(TypeError):
+            AddOnly(dry_run=True)
+
+
+class TestNftablesBackend:
+    """Test the nftables map backend (dry run)."""
+
+    @pytest.fixture
+    def backend(self):
+        from forwarding import NftablesBackend
+
+        return NftablesBackend(table="vmp", flush_window=0, dry_run=True)
+
+    def test_ruleset(self, backend):
+        """Test the table holds one map, one set and two fixed rules."""
+        ruleset = backend.ruleset({2223: "192.168.122.11", 2222: "192.168.122.10"})
+
+        assert ruleset.startswith("table ip vmp {\n")
+        assert "elements = { 2222 : 192.168.122.10 . 22, 2223 : 192.168.122.11 . 22 }" in ruleset
+        assert "elements = { 192.168.122.10, 192.168.122.11 }" in ruleset
+        assert "dnat ip addr . port to tcp dport map @ssh_dnat" in ruleset
+        assert "ip daddr @ssh_targets tcp dport 22 accept" in ruleset
+
+    def test_empty_ruleset_has_no_elements(self, backend):
+        """Test empty maps are declared without an elements line (invalid nft)."""
+        assert "elements" not in backend.ruleset({})
+
+    def test_sync_replaces_table(self, backend):
+        """Test sync rebuilds the whole table in one transaction."""
+        backend.sync({2222: "192.168.122.10"})
+
+        script, = backend.applied
+        assert script.startswith("add table ip vmp\ndelete table ip vmp\ntable ip vmp {")
+        assert "2222 : 192.168.122.10 . 22" in script
+        assert backend.forwards == {2222: "192.168.122.10"}
+
+    def test_first_change_without_sync_replaces_table(self, backend):
+        """Test the first batch loads the table when sync was never called."""
+        backend.add(2222, "192.168.122.10")
+
+        assert backend.applied[0].startswith("add table ip vmp\ndelete table ip vmp\n")
+
+    def test_changes_are_element_updates(self, backend):
+        """Test once loaded, forwards only add and delete map/set elements."""
+        backend.sync({2222: "192.168.122.10"})
+
+        backend.add(2223, "192.168.122.11")
+        backend.remove(2222, "192.168.122.10")
+
+        assert backend.applied[1:] == [
+            "add element ip vmp ssh_targets { 192.168.122.11 }\n"
+            "add element ip vmp ssh_dnat { 2223 : 192.168.122.11 . 22 }\n",
+            "delete element ip vmp ssh_dnat { 2222 }\n"
+            "delete element ip vmp ssh_targets { 192.168.122.10 }\n",
+        ]
+        assert backend.forwards == {2223: "192.168.122.11"}
+
+    def test_remove_unknown_forward_is_noop(self, backend):
+        """Test removing a forward that isn't installed runs nothing."""
+        backend.sync({})
+
+        backend.remove(2222, "192.168.122.10")
+
+        assert backend.transactions == 1
+
+    def test_concurrent_changes_share_one_transaction(self, backend):
+        """Test changes arriving within the flush window are applied together."""
+        backend.sync({})
+        backend.flush_window = 0.2
+        start = threading.Barrier(10)
+
+        def add(i):
+            start.wait()
+            backend.add(2222 + i, f"192.168.122.{10 + i}")
+
+        threads = [threading.Thread(target=add, args=(i,)) for i in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert backend.transactions == 2
+        assert len(backend.forwards) == 10
+        assert backend.applied[1].count(" . 22") == 10
+
+    def test_failed_transaction_raises_and_reloads(self, backend, monkeypatch):
+        """Test a failed nft run reaches the caller and the next batch rebuilds the table."""
+        backend.sync({2222: "192.168.122.10"})
+
+        def fail(script):
+            raise RuntimeError("nft failed")
+
+        original = backend._apply
+        monkeypatch.setattr(backend, "_apply", fail)
+        with pytest.raises(RuntimeError, match="nft failed"):
+            backend.add(2223, "192.168.122.11")
+        assert backend.forwards == {2222: "192.168.122.10"}
+
+        monkeypatch.setattr(backend, "_apply", original)
+        backend.add(2223, "192.168.122.11")
+        assert backend.applied[-1].startswith("add table ip vmp\ndelete table ip vmp\n")
+        assert "2223 : 192.168.122.11 . 22" in backend.applied[-1]
+
+    def test_update_is_one_transaction(self, backend):
+        """Test a bulk update applies removals and additions in one transaction."""
+        backend.sync({2222: "192.168.122.10", 2223: "192.168.122.11"})
+
+        backend.update(add=[(2224, "192.168.122.12")], remove=[(2222, "192.168.122.10")])
+
+        assert backend.transactions == 2
+        assert backend.list_forwards() == [(2223, "192.168.122.11"), (2224, "192.168.122.12")]
@@ -0,0 +1,179 @@
+"""
+Tests for golden module.
+"""
+import os
+import json
+import pytest
+
+
+class TestGoldenLookup:
+    """Test picking the golden memory state for a create request."""
+
+    @pytest.fixture(autouse=True)
+    def setup_golden(self, monkeypatch, temp_dir):
+        """Golden states for alpine under a temporary directory."""
+        import golden
+        from config import IMAGES
+
+        self.template = temp_dir / "alpine-template.qcow2"
+        self.template.write_bytes(b"template")
+        monkeypatch.setitem(IMAGES["alpine"], "template_path", self.template)
+        monkeypatch.setattr(golden, "GOLDEN_DIR", temp_dir / "golden")
+        monkeypatch.setattr(golden, "GOLDEN_IMAGES", ["alpine"])
+        monkeypatch.setattr(golden, "_restores", golden.Counter())
+        monkeypatch.setattr(golden, "_misses", golden.Counter())
+        monkeypatch.setattr(golden, "_restoring", golden.Counter())
+        monkeypatch.setattr(golden, "INSTANCE_DIR", temp_dir / "instances")
+        (temp_dir / "instances").mkdir()
+        # Builds boot real VMs; just record that one was requested
+        self.builds = []
+        monkeypatch.setattr(golden, "schedule_build", self.builds.append)
+
+        yield
+
+    def _saved_state(self, build_id="build-1"):
+        import golden
+        from qcow2 import create_image
+        from storage import template_stamp
+
+        build_dir = golden.GOLDEN_DIR / "alpine" / build_id
+        build_dir.mkdir(parents=True)
+        create_image(build_dir / "disk.qcow2", 1 << 20)
+        (build_dir / "memory.save").touch()
+        golden._set_current({
+            "image_type": "alpine",
+            "build_id": build_id,
+            "template_stamp": template_stamp(self.template),
+            "memory_mb": golden.GOLDEN_MEMORY_MB,
+            "vcpus": golden.GOLDEN_VCPUS,
+            "disk_path": str(build_dir / "disk.qcow2"),
+            "state_path": str(build_dir / "memory.save"),
+            "mac_address": "52:54:00:00:00:01",
+            "created_at": "2024-01-01T00:00:00"
+        })
+        return build_dir
+
+    @pytest.mark.asyncio
+    async def test_lookup_hit(self):
+        """Test a default-size request gets the current state."""
+        import golden
+
+        self._saved_state()
+
+        state = await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS)
+
+        assert state["build_id"] == "build-1"
+        assert self.builds == []
+        assert golden.stats()["alpine"]["restores"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lookup_missing_schedules_build(self):
+        """Test an image without a saved state counts a miss and gets built."""
+        import golden
+
+        assert await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS) is None
+        assert self.builds == ["alpine"]
+        assert golden.stats()["alpine"]["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_lookup_spec_differs(self):
+        """Test VMs with a non-default spec are booted normally."""
+        import golden
+
+        self._saved_state()
+
+        assert await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB * 2, golden.GOLDEN_VCPUS) is None
+        assert self.builds == []
+
+    @pytest.mark.asyncio
+    async def test_lookup_image_not_configured(self):
+        """Test images outside GOLDEN_IMAGES are never restored."""
+        import golden
+
+        assert await golden.lookup("debian-12", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS) is None
+        assert self.builds == []
+
+    @pytest.mark.asyncio
+    async def test_template_change_invalidates(self):
+        """Test a replaced template makes the saved state unusable and triggers a rebuild."""
+        import golden
+
+        self._saved_state()
+        st = self.template.stat()
+        os.utime(self.template, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+        assert golden.current("alpine") is None
+        assert await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS) is None
+        assert self.builds == ["alpine"]
+
+    def test_missing_save_file(self):
+        """Test a state whose memory file is gone is not used."""
+        import golden
+
+        build_dir = self._saved_state()
+        (build_dir / "memory.save").unlink()
+
+        assert golden.current("alpine") is None
+
+    def test_current_file_written_atomically(self):
+        """Test the pointer is valid JSON and no temporary file is left behind."""
+        import golden
+
+        self._saved_state()
+
+        image_dir = golden.GOLDEN_DIR / "alpine"
+        assert json.loads((image_dir / "current.json").read_text())["build_id"] == "build-1"
+        assert not (image_dir / "current.tmp").exists()
+
+    @pytest.mark.asyncio
+    async def test_batch_lookup_counts_every_vm(self):
+        """Test one lookup for a batch counts a restore per VM and holds the build once."""
+        import golden
+
+        self._saved_state()
+
+        state = await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS, 5)
+
+        assert golden.stats()["alpine"]["restores"] == 5
+        assert golden._restoring == {"build-1": 1}
+        golden.release(state)
+        assert golden._restoring == {}
+
+    def test_prune_superseded_builds(self):
+        """Test old builds go, but not the disks restored VMs still use or builds being restored from."""
+        import golden
+        from qcow2 import create_overlay
+
+        self._saved_state("build-0")
+        in_use = self._saved_state("build-2")
+        restoring = self._saved_state("build-3")
+        current = self._saved_state("build-4")
+        # A VM restored from build-2 has its disk on build-2's disk.qcow2
+        create_overlay(golden.INSTANCE_DIR / "vm-1.qcow2", in_use / "disk.qcow2")
+        golden._restoring["build-3"] += 1
+
+        golden.prune("alpine")
+
+        assert not (golden.GOLDEN_DIR / "alpine" / "build-0").exists()
+        assert (in_use / "disk.qcow2").exists()
+        assert not (in_use / "memory.save").exists()
+        assert (restoring / "memory.save").exists()
+        assert (current / "memory.save").exists()
+
+    @pytest.mark.asyncio
+    async def test_release_prunes_superseded_build(self):
+        """Test a build replaced while a restore used it is pruned once the restore is done."""
+        import golden
+
+        old = self._saved_state("build-1")
+        state = await golden.lookup("alpine", golden.GOLDEN_MEMORY_MB, golden.GOLDEN_VCPUS)
+        self._saved_state("build-2")
+
+        golden.prune("alpine")
+        assert old.exists()
+
+        async def pipeline():
+            return "done"
+
+        assert await golden.restoring(state, pipeline()) == "done"
+        assert not old.exists()
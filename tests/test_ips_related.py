@@ -0,0 +1,71 @@
+"""
+Tests for IPS_related module.
+"""
+import pytest
+
+
+class TestIPsRelated:
+    """Test IP allocation bookkeeping."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        yield
+
+    CANDIDATES = ["192.168.122.2", "192.168.122.3", "192.168.122.4"]
+
+    def test_reserve_first_free(self):
+        """Test addresses are handed out in candidate order."""
+        from SQL.IPS_related import reserve_ip
+        
+        assert reserve_ip("vm-1", "52:54:00:00:00:01", self.CANDIDATES, set()) == "192.168.122.2"
+        assert reserve_ip("vm-2", "52:54:00:00:00:02", self.CANDIDATES, set()) == "192.168.122.3"
+
+    def test_reserve_skips_excluded(self):
+        """Test addresses leased elsewhere are not handed out."""
+        from SQL.IPS_related import reserve_ip
+        
+        ip = reserve_ip("vm-1", "52:54:00:00:00:01", self.CANDIDATES, {"192.168.122.2"})
+        assert ip == "192.168.122.3"
+
+    def test_reserve_is_idempotent(self):
+        """Test a VM that already holds an address gets it back."""
+        from SQL.IPS_related import reserve_ip, list_ip_allocations
+        
+        first = reserve_ip("vm-1", "52:54:00:00:00:01", self.CANDIDATES, set())
+        again = reserve_ip("vm-1", "52:54:00:00:00:01", self.CANDIDATES, set())
+        assert first == again
+        assert len(list_ip_allocations()) == 1
+
+    def test_reserve_exhausted(self):
+        """Test an error is raised when every address is taken."""
+        from SQL.IPS_related import reserve_ip
+        
+        for i, _ in enumerate(self.CANDIDATES):
+            reserve_ip(f"vm-{i}", f"52:54:00:00:00:0{i}", self.CANDIDATES, set())
+        
+        with pytest.raises(RuntimeError, match="No free IP"):
+            reserve_ip("vm-x", "52:54:00:00:00:ff", self.CANDIDATES, set())
+
+    def test_release_frees_address(self):
+        """Test a released address can be reused."""
+        from SQL.IPS_related import reserve_ip, release_ip, get_ip_allocation
+        
+        reserve_ip("vm-1", "52:54:00:00:00:01", self.CANDIDATES, set())
+        released = release_ip("vm-1")
+        
+        assert released["ip"] == "192.168.122.2"
+        assert released["mac"] == "52:54:00:00:00:01"
+        assert get_ip_allocation("vm-1") is None
+        assert release_ip("vm-1") is None
+        assert reserve_ip("vm-2", "52:54:00:00:00:02", self.CANDIDATES, set()) == "192.168.122.2"
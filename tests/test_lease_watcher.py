@@ -0,0 +1,123 @@
+"""
+Tests for lease_watcher module.
+"""
+import asyncio
+import json
+import time
+import pytest
+
+
+LEASE_A = "{expiry} 52:54:00:aa:bb:cc 192.168.122.10 vm-a *"
+LEASE_B = "{expiry} 52:54:00:11:22:33 192.168.122.11 vm-b *"
+
+
+def _future():
+    return int(time.time()) + 3600
+
+
+class TestParseLeases:
+    """Test lease file parsing."""
+
+    def test_parse_leases_file(self):
+        """Test the classic dnsmasq leases format."""
+        from lease_watcher import parse_leases
+        
+        content = "\n".join([
+            LEASE_A.format(expiry=_future()),
+            LEASE_B.format(expiry=0),
+            "duid 00:01:00:01:2a:3b:4c:5d",
+        ])
+        
+        assert parse_leases(content) == {
+            "52:54:00:aa:bb:cc": "192.168.122.10",
+            "52:54:00:11:22:33": "192.168.122.11",
+        }
+
+    def test_parse_leases_skips_expired(self):
+        """Test expired leases are ignored."""
+        from lease_watcher import parse_leases
+        
+        content = LEASE_A.format(expiry=int(time.time()) - 10)
+        
+        assert parse_leases(content) == {}
+
+    def test_parse_status_json(self):
+        """Test libvirt's JSON <bridge>.status format."""
+        from lease_watcher import parse_leases
+        
+        content = json.dumps([{
+            "ip-address": "192.168.122.10",
+            "mac-address": "52:54:00:AA:BB:CC",
+            "hostname": "vm-a",
+            "expiry-time": _future()
+        }])
+        
+        assert parse_leases(content) == {"52:54:00:aa:bb:cc": "192.168.122.10"}
+
+
+class TestLeaseWatcher:
+    """Test the shared lease watcher."""
+
+    @pytest.fixture
+    def leases_file(self, temp_dir):
+        return temp_dir / "default.leases"
+
+    @pytest.fixture
+    def watcher(self, leases_file):
+        from lease_watcher import LeaseWatcher
+        
+        watcher = LeaseWatcher(leases_file, poll_interval=0.05)
+        yield watcher
+        watcher.stop()
+
+    def test_refresh_indexes_changes(self, watcher, leases_file):
+        """Test added and removed leases update the index."""
+        leases_file.write_text(LEASE_A.format(expiry=_future()) + "\n")
+        watcher.refresh()
+        assert watcher.lookup("52:54:00:AA:BB:CC") == "192.168.122.10"
+        
+        leases_file.write_text(LEASE_B.format(expiry=_future()) + "\n")
+        watcher.refresh()
+        assert watcher.lookup("52:54:00:aa:bb:cc") is None
+        assert watcher.lookup("52:54:00:11:22:33") == "192.168.122.11"
+
+    def test_missing_file(self, watcher):
+        """Test a lease file that doesn't exist yet is not an error."""
+        watcher.refresh()
+        
+        assert watcher.available is True
+        assert watcher.lookup("52:54:00:aa:bb:cc") is None
+
+    @pytest.mark.asyncio
+    async def test_wait_for_ip_already_leased(self, watcher, leases_file):
+        """Test a MAC that is already leased returns immediately."""
+        leases_file.write_text(LEASE_A.format(expiry=_future()) + "\n")
+        
+        ip = await watcher.wait_for_ip("52:54:00:aa:bb:cc", timeout=1)
+        
+        assert ip == "192.168.122.10"
+
+    @pytest.mark.asyncio
+    async def test_wait_for_ip_wakes_on_new_lease(self, watcher, leases_file):
+        """Test waiters are woken when their MAC appears."""
+        watcher.start()
+        
+        async def lease_later():
+            await asyncio.sleep(0.1)
+            leases_file.write_text(
+                LEASE_B.format(expiry=_future()) + "\n" + LEASE_A.format(expiry=_future()) + "\n"
+            )
+        
+        writer = asyncio.ensure_future(lease_later())
+        ip = await watcher.wait_for_ip("52:54:00:aa:bb:cc", timeout=5)
+        await writer
+        
+        assert ip == "192.168.122.10"
+
+    @pytest.mark.asyncio
+    async def test_wait_for_ip_timeout(self, watcher):
+        """Test a MAC that never gets a lease times out."""
+        with pytest.raises(TimeoutError, match="No DHCP lease"):
+            await watcher.wait_for_ip("52:54:00:aa:bb:cc", timeout=0.2)
+        
+        assert watcher._waiters == {}
@@ -0,0 +1,152 @@
+"""
+Tests for libvirt_client module.
+"""
+import pytest
+from unittest.mock import patch, MagicMock
+
+
+@pytest.fixture
+def dom():
+    """Domain returned by a patched libvirt connection."""
+    import libvirt_client
+    
+    conn = MagicMock()
+    connection = MagicMock()
+    connection.return_value.__enter__.return_value = conn
+    with patch.object(libvirt_client, "connection", connection):
+        yield conn.lookupByUUIDString.return_value
+
+
+class TestDiskControls:
+    """Test online disk resize and I/O limits."""
+
+    def test_domain_xml_iotune(self):
+        """Test disk limits are rendered into the disk's iotune element."""
+        from libvirt_client import build_domain_xml
+        
+        xml = build_domain_xml(
+            "test-vm", "test", "/tmp/test-vm.qcow2", None,
+            disk_iops=500, disk_bytes_per_sec=50 * 1024 ** 2
+        )
+        assert "<total_iops_sec>500</total_iops_sec>" in xml
+        assert f"<total_bytes_sec>{50 * 1024 ** 2}</total_bytes_sec>" in xml
+
+    def test_domain_xml_unlimited(self):
+        """Test no iotune element is rendered without limits."""
+        from libvirt_client import build_domain_xml
+        
+        xml = build_domain_xml("test-vm", "test", "/tmp/test-vm.qcow2", None)
+        assert "<iotune>" not in xml
+
+    def test_resize_block_online(self, dom):
+        """Test a running VM's disk grows with blockResize."""
+        import libvirt
+        from libvirt_client import resize_block
+        
+        dom.isActive.return_value = True
+        dom.blockInfo.return_value = [10 * 1024 ** 3, 0, 0]
+        
+        assert resize_block("test-vm", 20 * 1024 ** 3) is True
+        dom.blockResize.assert_called_once_with(
+            "vda", 20 * 1024 ** 3, libvirt.VIR_DOMAIN_BLOCK_RESIZE_BYTES
+        )
+
+    def test_resize_block_refuses_shrink(self, dom):
+        """Test disks never shrink."""
+        from libvirt_client import resize_block
+        
+        dom.isActive.return_value = True
+        dom.blockInfo.return_value = [10 * 1024 ** 3, 0, 0]
+        
+        with pytest.raises(ValueError, match="only grow"):
+            resize_block("test-vm", 5 * 1024 ** 3)
+        dom.blockResize.assert_not_called()
+
+    def test_resize_block_stopped(self, dom):
+        """Test stopped VMs are left to the offline path."""
+        from libvirt_client import resize_block
+        
+        dom.isActive.return_value = False
+        
+        assert resize_block("test-vm", 20 * 1024 ** 3) is False
+        dom.blockResize.assert_not_called()
+
+    def test_set_block_iotune_live_and_config(self, dom):
+        """Test limits apply to the running domain and its definition."""
+        import libvirt
+        from libvirt_client import set_block_iotune
+        
+        dom.isActive.return_value = True
+        set_block_iotune("test-vm", 200, 0)
+        
+        dom.setBlockIoTune.assert_called_once_with(
+            "vda",
+            {"total_iops_sec": 200, "total_bytes_sec": 0},
+            libvirt.VIR_DOMAIN_AFFECT_CONFIG | libvirt.VIR_DOMAIN_AFFECT_LIVE
+        )
+
+    def test_switch_disk_source(self, dom):
+        """Test the disk is re-pointed in the persistent definition and the VM restarted."""
+        import libvirt_client
+        
+        dom.isActive.return_value = True
+        dom.XMLDesc.return_value = libvirt_client.build_domain_xml(
+            "test-vm", "test", "/tmp/test-vm.qcow2", "/tmp/test-vm.iso"
+        )
+        conn = libvirt_client.connection.return_value.__enter__.return_value
+        
+        libvirt_client.switch_disk_source("test-vm", "/tmp/test-vm@new.qcow2")
+        
+        dom.destroy.assert_called_once()
+        xml = conn.defineXML.call_args.args[0]
+        assert "<source file=\"/tmp/test-vm@new.qcow2\" />" in xml
+        assert "<source file=\"/tmp/test-vm.iso\" />" in xml
+        dom.create.assert_called_once()
+
+
+class TestGoldenRestore:
+    """Test restoring a VM from a saved memory state."""
+
+    def _saved_xml(self):
+        from libvirt_client import build_domain_xml
+        
+        xml = build_domain_xml(
+            "golden-1", "golden-alpine", "/images/golden/disk.qcow2", "/tmp/golden-1.iso"
+        )
+        # Live paths and labels libvirt records in a save image
+        return xml.replace(
+            "</domain>",
+            "<seclabel type='dynamic' model='selinux'><label>svirt_t:c1</label></seclabel></domain>"
+        ).replace(
+            "<target type='virtio' name='org.qemu.guest_agent.0'/>",
+            "<source mode='bind' path='/run/golden-1.agent'/><target type='virtio' name='org.qemu.guest_agent.0'/>"
+        )
+
+    def test_restore_xml_retargets_vm(self, dom):
+        """Test the restored domain gets the new name, UUID and disk but keeps the saved MAC."""
+        import libvirt
+        import libvirt_client
+        from network import generate_mac_address
+        
+        conn = libvirt_client.connection.return_value.__enter__.return_value
+        conn.saveImageGetXMLDesc.return_value = self._saved_xml()
+        dom.XMLDesc.return_value = libvirt_client.build_domain_xml(
+            "new-vm", "new", "/instances/new-vm.qcow2", None
+        )
+        dom.UUIDString.return_value = "new-vm"
+        
+        libvirt_client.restore_domain(
+            "/images/golden/memory.save", "new-vm", "new", "/instances/new-vm.qcow2", "52:54:00:aa:bb:cc"
+        )
+        
+        path, xml, flags = conn.restoreFlags.call_args.args
+        assert flags == libvirt.VIR_DOMAIN_SAVE_RUNNING
+        assert "<name>new</name>" in xml
+        assert "<uuid>new-vm</uuid>" in xml
+        assert "/instances/new-vm.qcow2" in xml
+        assert "/images/golden/disk.qcow2" not in xml
+        assert generate_mac_address("golden-1") in xml
+        assert "golden-1.agent" not in xml
+        assert "svirt_t" not in xml
+        # The persistent definition carries the VM's own MAC for later boots
+        assert "52:54:00:aa:bb:cc" in conn.defineXML.call_args.args[0]
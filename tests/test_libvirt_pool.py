@@ -0,0 +1,136 @@
+"""
+Tests for libvirt_pool module.
+"""
+import threading
+import pytest
+
+
+class FakeConn:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def isAlive(self):
+        return self.alive
+
+    def close(self):
+        self.closed = True
+
+
+class FakePool:
+    """Mixin replacing the libvirt connect call."""
+
+    def __init__(self, *args, fail_times=0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.opened = []
+        self.fail_times = fail_times
+
+    def _open_connection(self):
+        import libvirt
+        
+        if self.fail_times:
+            self.fail_times -= 1
+            raise libvirt.libvirtError("connection refused")
+        conn = FakeConn()
+        self.opened.append(conn)
+        return conn
+
+
+@pytest.fixture
+def make_pool():
+    from libvirt_pool import ConnectionPool
+    
+    class TestPool(FakePool, ConnectionPool):
+        pass
+    
+    def make(size=2, **kwargs):
+        return TestPool("test:///default", size, **kwargs)
+    return make
+
+
+class TestConnectionPool:
+    """Test the bounded libvirt connection pool."""
+
+    def test_reuses_idle_connection(self, make_pool):
+        """Test a released connection is handed out again."""
+        pool = make_pool()
+        
+        with pool.connection() as first:
+            pass
+        with pool.connection() as second:
+            pass
+        
+        assert first is second
+        assert len(pool.opened) == 1
+        assert pool.stats()["acquisitions"] == 2
+
+    def test_bounded(self, make_pool):
+        """Test callers wait for a free connection and time out."""
+        pool = make_pool(size=1)
+        
+        with pool.connection():
+            with pytest.raises(TimeoutError):
+                with pool.connection(timeout=0.05):
+                    pass
+        
+        stats = pool.stats()
+        assert stats["open"] == 1
+        assert stats["peak_in_use"] == 1
+        assert stats["in_use"] == 0
+
+    def test_waiter_gets_released_connection(self, make_pool):
+        """Test a waiting caller is woken when a connection is released."""
+        pool = make_pool(size=1)
+        got = []
+        
+        with pool.connection() as conn:
+            waiter = threading.Thread(
+                target=lambda: got.append(pool.connection(timeout=5).__enter__())
+            )
+            waiter.start()
+            waiter.join(0.05)
+        waiter.join(5)
+        
+        assert got == [conn]
+        assert pool.stats()["waits"] == 1
+
+    def test_dead_connection_replaced(self, make_pool):
+        """Test a connection closed by keepalive is replaced on checkout."""
+        pool = make_pool()
+        
+        with pool.connection() as first:
+            pass
+        first.alive = False
+        with pool.connection() as second:
+            pass
+        
+        assert second is not first
+        assert first.closed
+        assert pool.stats()["reconnects"] == 1
+
+    def test_reconnect_backoff(self, make_pool):
+        """Test failed connects are retried with backoff until they succeed."""
+        pool = make_pool(fail_times=2, backoff_base=0.01)
+        
+        with pool.connection() as conn:
+            assert conn is pool.opened[0]
+        
+        stats = pool.stats()
+        assert stats["connect_failures"] == 2
+        assert stats["reachable"] is True
+        assert stats["open"] == 1
+
+    def test_unreachable_gives_up(self, make_pool):
+        """Test the libvirt error surfaces once backoff passes the deadline."""
+        import libvirt
+        
+        pool = make_pool(fail_times=100, backoff_base=1)
+        
+        with pytest.raises(libvirt.libvirtError):
+            with pool.connection(timeout=0.1):
+                pass
+        
+        stats = pool.stats()
+        assert stats["open"] == 0
+        assert stats["in_use"] == 0
+        assert stats["reachable"] is False
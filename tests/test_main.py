@@ -0,0 +1,62 @@
+"""
+Tests for main module (API routes).
+"""
+import pytest
+
+
+class TestReconcileRoutes:
+    """Test the admin-only reconcile endpoints."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self, monkeypatch):
+        """Setup fresh database, an admin key and a stub reconciler for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        import auth_service
+        import reconciler
+        monkeypatch.setattr(auth_service, "ADMIN_API_KEY", "admin-key")
+        # Reconciling touches the host; just record the calls
+        self.calls = []
+        
+        async def reconcile(dry_run=True, startup=False):
+            self.calls.append(dry_run)
+            return {"dry_run": dry_run, "total": 0, "actions": {}}
+        
+        monkeypatch.setattr(reconciler, "reconcile", reconcile)
+        
+        yield
+
+    @pytest.fixture
+    def client(self):
+        from fastapi.testclient import TestClient
+        from main import app
+        # Without a `with` block the lifespan (libvirt, iptables) doesn't run
+        return TestClient(app)
+
+    def test_tenant_key_rejected(self, client):
+        """Test a tenant's API key gets 403 and nothing is reconciled."""
+        from SQL.USERS_related import add_user
+        
+        add_user(name="testuser", password="password123", plaintext_api_key="tenant-key")
+        
+        assert client.get("/reconcile", headers={"X-API-Key": "tenant-key"}).status_code == 403
+        assert client.post("/reconcile", headers={"X-API-Key": "tenant-key"}).status_code == 403
+        assert self.calls == []
+
+    def test_admin_key_gets_report(self, client):
+        """Test the admin key gets the dry-run report and can apply it."""
+        response = client.get("/reconcile", headers={"X-API-Key": "admin-key"})
+        
+        assert response.status_code == 200
+        assert response.json()["dry_run"] is True
+        
+        assert client.post("/reconcile", headers={"X-API-Key": "admin-key"}).json()["dry_run"] is False
+        assert self.calls == [True, False]
@@ -0,0 +1,84 @@
+"""
+Tests for metadata_server module.
+"""
+import urllib.request
+import urllib.error
+import pytest
+
+
+class TestMetadataServer:
+    """Test the nocloud-net metadata datasource."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        yield
+
+    @pytest.fixture
+    def server(self):
+        from metadata_server import MetadataServer
+        
+        server = MetadataServer("127.0.0.1", 0)
+        server.start()
+        yield server
+        server.stop()
+
+    def _get(self, server, path):
+        return urllib.request.urlopen(f"http://127.0.0.1:{server.port}{path}", timeout=5)
+
+    def test_serves_documents(self, server):
+        """Test stored user-data and meta-data are served under the VM's seed URL."""
+        from SQL.METADATA_related import set_instance_metadata
+        
+        set_instance_metadata("vm-1", "#cloud-config\nhostname: a\n", "instance-id: vm-1\n")
+        
+        assert self._get(server, "/vm-1/user-data").read() == b"#cloud-config\nhostname: a\n"
+        assert self._get(server, "/vm-1/meta-data").read() == b"instance-id: vm-1\n"
+        assert self._get(server, "/vm-1/vendor-data").read() == b""
+
+    def test_unknown_vm_or_document(self, server):
+        """Test unknown VMs and paths return 404."""
+        from SQL.METADATA_related import set_instance_metadata
+        
+        set_instance_metadata("vm-1", "u", "m")
+        
+        for path in ("/vm-2/user-data", "/vm-1/secrets", "/vm-1"):
+            with pytest.raises(urllib.error.HTTPError) as exc:
+                self._get(server, path)
+            assert exc.value.code == 404
+
+    def test_other_clients_refused(self, server):
+        """Test a VM's documents are only served to its reserved address."""
+        from SQL.METADATA_related import set_instance_metadata
+        from SQL.IPS_related import reserve_ip
+        
+        set_instance_metadata("vm-1", "u", "m")
+        reserve_ip("vm-1", "52:54:00:00:00:01", ["192.168.122.2"], set())
+        
+        with pytest.raises(urllib.error.HTTPError) as exc:
+            self._get(server, "/vm-1/user-data")
+        assert exc.value.code == 403
+
+    def test_delete_instance_metadata(self):
+        """Test stored documents can be removed."""
+        from SQL.METADATA_related import (
+            set_instance_metadata,
+            get_instance_metadata,
+            delete_instance_metadata
+        )
+        
+        set_instance_metadata("vm-1", "u", "m")
+        assert get_instance_metadata("vm-1")["user_data"] == "u"
+        
+        assert delete_instance_metadata("vm-1") is True
+        assert get_instance_metadata("vm-1") is None
@@ -99,6 +99,22 @@ class TestNetwork:
         with pytest.raises(RuntimeError, match="No available ports"):
             allocate_port()
 
+    def test_allocate_ports_batch(self, sample_vm_record):
+        """Test allocating several ports at once."""
+        from network import allocate_ports
+        from SQL.VM_related import add_vm_record
+        
+        add_vm_record(sample_vm_record)
+        
+        assert allocate_ports(3) == [2223, 2224, 2225]
+
+    def test_allocate_ports_not_enough(self):
+        """Test error when the range can't fit the whole batch."""
+        from network import allocate_ports
+        
+        with pytest.raises(RuntimeError, match="Not enough available ports"):
+            allocate_ports(102)
+
     def test_port_range(self):
         """Test port range configuration."""
         from config import START_PORT, END_PORT
@@ -0,0 +1,146 @@
+"""
+Tests for OPERATIONS_related module.
+"""
+import pytest
+
+
+class TestOperationsRelated:
+    """Test background operation tracking."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        yield
+
+    @pytest.fixture
+    def sample_operation(self):
+        return {
+            "id": "op-123",
+            "vm_id": "test-vm-123",
+            "owner_id": "test-user-123",
+            "kind": "create",
+            "status": "pending",
+            "stage": "queued",
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00"
+        }
+
+    def test_add_and_get_operation(self, sample_operation):
+        """Test storing and reading back an operation."""
+        from SQL.OPERATIONS_related import add_operation, get_operation
+        
+        add_operation(sample_operation)
+        
+        op = get_operation("op-123", "test-user-123")
+        
+        assert op is not None
+        assert op['vm_id'] == "test-vm-123"
+        assert op['status'] == "pending"
+        assert op['stage'] == "queued"
+        assert op['error'] is None
+        assert op['result'] is None
+
+    def test_add_operations(self, sample_operation):
+        """Test inserting a batch of operations."""
+        from SQL.OPERATIONS_related import add_operations, get_operation
+        
+        add_operations([
+            {**sample_operation, "id": f"op-{i}", "vm_id": f"vm-{i}"}
+            for i in range(3)
+        ])
+        
+        for i in range(3):
+            assert get_operation(f"op-{i}", "test-user-123")['vm_id'] == f"vm-{i}"
+
+    def test_get_operation_wrong_owner(self, sample_operation):
+        """Test operations are scoped to their owner."""
+        from SQL.OPERATIONS_related import add_operation, get_operation
+        
+        add_operation(sample_operation)
+        
+        assert get_operation("op-123", "someone-else") is None
+
+    def test_update_operation_stage(self, sample_operation):
+        """Test stage transitions leave other fields untouched."""
+        from SQL.OPERATIONS_related import add_operation, update_operation, get_operation
+        
+        add_operation(sample_operation)
+        
+        assert update_operation("op-123", status="running") is True
+        assert update_operation("op-123", stage="cloning_disk") is True
+        
+        op = get_operation("op-123", "test-user-123")
+        assert op['status'] == "running"
+        assert op['stage'] == "cloning_disk"
+        assert op['updated_at'] != sample_operation['updated_at']
+
+    def test_update_operation_result(self, sample_operation):
+        """Test the result is stored as JSON and decoded on read."""
+        from SQL.OPERATIONS_related import add_operation, update_operation, get_operation
+        
+        add_operation(sample_operation)
+        update_operation(
+            "op-123",
+            status="succeeded",
+            stage="done",
+            result={"ssh_connection": {"port": 2222}}
+        )
+        
+        op = get_operation("op-123", "test-user-123")
+        assert op['status'] == "succeeded"
+        assert op['result'] == {"ssh_connection": {"port": 2222}}
+
+    def test_update_operation_timings(self, sample_operation):
+        """Test per-stage timings round-trip as a dict."""
+        from SQL.OPERATIONS_related import add_operation, update_operation, get_operation
+        
+        add_operation(sample_operation)
+        timings = {"cloning_disk": {"start": 0.0, "duration": 0.42}}
+        update_operation("op-123", timings=timings)
+        
+        op = get_operation("op-123", "test-user-123")
+        assert op['timings'] == timings
+
+    def test_update_operation_failed(self, sample_operation):
+        """Test recording a failure."""
+        from SQL.OPERATIONS_related import add_operation, update_operation, get_operation
+        
+        add_operation(sample_operation)
+        update_operation("op-123", status="failed", error="boom")
+        
+        op = get_operation("op-123", "test-user-123")
+        assert op['status'] == "failed"
+        assert op['error'] == "boom"
+
+    def test_update_nonexistent_operation(self):
+        """Test updating an unknown operation returns False."""
+        from SQL.OPERATIONS_related import update_operation
+        
+        assert update_operation("missing", status="running") is False
+
+    def test_get_latest_operation_for_vm(self, sample_operation):
+        """Test the most recent operation of a VM is returned."""
+        from SQL.OPERATIONS_related import add_operation, get_latest_operation_for_vm
+        
+        add_operation(sample_operation)
+        add_operation({
+            **sample_operation,
+            "id": "op-456",
+            "kind": "delete",
+            "created_at": "2024-01-02T00:00:00"
+        })
+        
+        op = get_latest_operation_for_vm("test-vm-123")
+        assert op['id'] == "op-456"
+        
+        assert get_latest_operation_for_vm("other-vm") is None
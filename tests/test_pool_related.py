@@ -0,0 +1,90 @@
+"""
+Tests for POOL_related module.
+"""
+import pytest
+
+
+class TestPoolRelated:
+    """Test warm pool bookkeeping."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        yield
+
+    def test_add_pool_vm_is_booting(self):
+        """Test new pool VMs start out booting."""
+        from SQL.POOL_related import add_pool_vm, list_pool_vms
+        
+        add_pool_vm("vm-1", "alpine")
+        
+        vms = list_pool_vms()
+        assert len(vms) == 1
+        assert vms[0]['status'] == "booting"
+        assert vms[0]['ip'] is None
+
+    def test_claim_only_ready_vms(self):
+        """Test booting VMs can't be claimed."""
+        from SQL.POOL_related import add_pool_vm, claim_pool_vm
+        
+        add_pool_vm("vm-1", "alpine")
+        
+        assert claim_pool_vm("alpine") is None
+
+    def test_claim_ready_vm(self):
+        """Test claiming removes the VM from the pool."""
+        from SQL.POOL_related import add_pool_vm, mark_pool_vm_ready, claim_pool_vm, list_pool_vms
+        
+        add_pool_vm("vm-1", "alpine")
+        assert mark_pool_vm_ready("vm-1", "192.168.122.10") is True
+        
+        vm = claim_pool_vm("alpine")
+        
+        assert vm['vm_id'] == "vm-1"
+        assert vm['ip'] == "192.168.122.10"
+        assert list_pool_vms() == []
+        assert claim_pool_vm("alpine") is None
+
+    def test_claim_matches_image_type(self):
+        """Test VMs are only claimed for their own image."""
+        from SQL.POOL_related import add_pool_vm, mark_pool_vm_ready, claim_pool_vm
+        
+        add_pool_vm("vm-1", "alpine")
+        mark_pool_vm_ready("vm-1", "192.168.122.10")
+        
+        assert claim_pool_vm("debian-12") is None
+        assert claim_pool_vm("alpine") is not None
+
+    def test_count_pool_vms(self):
+        """Test counts per image and status."""
+        from SQL.POOL_related import add_pool_vm, mark_pool_vm_ready, count_pool_vms
+        
+        add_pool_vm("vm-1", "alpine")
+        add_pool_vm("vm-2", "alpine")
+        add_pool_vm("vm-3", "debian-12")
+        mark_pool_vm_ready("vm-1", "192.168.122.10")
+        
+        assert count_pool_vms() == {
+            "alpine": {"booting": 1, "ready": 1},
+            "debian-12": {"booting": 1}
+        }
+
+    def test_remove_pool_vm(self):
+        """Test removing a pool VM."""
+        from SQL.POOL_related import add_pool_vm, remove_pool_vm, list_pool_vms
+        
+        add_pool_vm("vm-1", "alpine")
+        
+        assert remove_pool_vm("vm-1") is True
+        assert remove_pool_vm("vm-1") is False
+        assert list_pool_vms() == []
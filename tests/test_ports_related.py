@@ -0,0 +1,131 @@
+"""
+Tests for PORTS_related module.
+"""
+import threading
+import pytest
+
+
+class TestPortsRelated:
+    """Test the host port free list and reservations."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+
+        from SQL.database import init_db
+        init_db()
+
+        yield
+
+    def _vm(self, host_port, vm_id="vm-1"):
+        return {
+            "id": vm_id,
+            "name": vm_id,
+            "owner_id": "test-owner",
+            "status": "running",
+            "host_port": host_port,
+            "disk_path": f"/path/{vm_id}.qcow2",
+            "iso_path": f"/path/{vm_id}.iso",
+            "created_at": "2024-01-01T00:00:00"
+        }
+
+    def test_seeded_with_range(self):
+        """Test init_db puts the whole configured range on the free list."""
+        from SQL.PORTS_related import count_free_ports
+
+        assert count_free_ports() == 101
+
+    def test_reserve_lowest(self):
+        """Test the lowest free ports are taken and stay taken."""
+        from SQL.PORTS_related import reserve_ports
+
+        assert reserve_ports(2) == [2222, 2223]
+        assert reserve_ports(1) == [2224]
+
+    def test_not_enough_takes_nothing(self):
+        """Test a request larger than the free list fails without taking ports."""
+        from SQL.PORTS_related import reserve_ports, count_free_ports
+
+        with pytest.raises(RuntimeError, match="101 free ports left, 102 needed"):
+            reserve_ports(102)
+        assert count_free_ports() == 101
+
+    def test_deleted_vm_port_is_reused(self):
+        """Test deleting a VM record puts its port back on the free list."""
+        from SQL.PORTS_related import reserve_ports
+        from SQL.VM_related import add_vm_record, delete_vm_record
+
+        port, = reserve_ports(1)
+        add_vm_record(self._vm(port))
+        assert reserve_ports(1) == [2223]
+
+        delete_vm_record("vm-1", "test-owner")
+        assert reserve_ports(1) == [2222]
+
+    def test_release_unused_reservation(self):
+        """Test a reservation whose record was never written can be returned."""
+        from SQL.PORTS_related import reserve_ports, release_ports
+
+        ports = reserve_ports(2)
+        release_ports(ports)
+
+        assert reserve_ports(2) == ports
+
+    def test_release_keeps_ports_in_use(self):
+        """Test releasing a port a VM record holds does not free it."""
+        from SQL.PORTS_related import reserve_ports, release_ports
+        from SQL.VM_related import add_vm_record
+
+        port, = reserve_ports(1)
+        add_vm_record(self._vm(port))
+        release_ports([port])
+
+        assert reserve_ports(1) == [2223]
+
+    def test_concurrent_reservations_are_unique(self):
+        """Test concurrent callers never get the same port."""
+        from SQL.PORTS_related import reserve_ports
+
+        results = []
+        start = threading.Barrier(20)
+
+        def reserve():
+            start.wait()
+            results.extend(reserve_ports(3))
+
+        threads = [threading.Thread(target=reserve) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(results) == list(range(2222, 2222 + 60))
+
+    def test_init_db_keeps_fresh_reservations(self):
+        """Test a restart doesn't hand out ports reserved moments ago."""
+        from SQL.PORTS_related import reserve_ports
+        from SQL.database import init_db
+
+        reserve_ports(1)
+        init_db()
+
+        assert reserve_ports(1) == [2223]
+
+    def test_init_db_reclaims_stale_reservations(self):
+        """Test reservations that never got a VM record are freed on startup."""
+        from SQL.PORTS_related import reserve_ports
+        from SQL.database import init_db, get_conn
+
+        reserve_ports(1)
+        with get_conn() as conn:
+            conn.execute("UPDATE port_reservations SET reserved_at = '2000-01-01T00:00:00'")
+            conn.commit()
+        init_db()
+
+        assert reserve_ports(1) == [2222]
@@ -0,0 +1,142 @@
+"""
+Tests for provisioner module.
+"""
+import asyncio
+import pytest
+
+
+class TestStageGraph:
+    """Test the provisioning stage dependency graph."""
+
+    @pytest.fixture(autouse=True)
+    def no_operation_updates(self, monkeypatch):
+        """Stage transitions are recorded in the DB; not needed here."""
+        import provisioner
+        monkeypatch.setattr(provisioner, "update_operation", lambda *args: True)
+
+    @pytest.mark.asyncio
+    async def test_independent_stages_run_concurrently(self):
+        """Test stages without dependencies overlap and dependents wait."""
+        from provisioner import run_stage_graph
+        
+        events = []
+        
+        async def slow(name):
+            events.append(f"{name}-start")
+            await asyncio.sleep(0.1)
+            events.append(f"{name}-end")
+        
+        async def iso():
+            await slow("iso")
+        
+        async def disk():
+            await slow("disk")
+        
+        async def domain():
+            events.append("domain")
+        
+        timings = {}
+        await run_stage_graph("op-1", {
+            "iso": ((), iso),
+            "disk": ((), disk),
+            "domain": (("iso", "disk"), domain),
+        }, timings)
+        
+        assert events.index("disk-start") < events.index("iso-end")
+        assert events[-1] == "domain"
+        assert timings["domain"]["start"] >= timings["iso"]["duration"]
+        assert timings["total"]["duration"] < 0.2 + 0.1
+
+    @pytest.mark.asyncio
+    async def test_failure_skips_dependents_and_settles_siblings(self):
+        """Test a failing stage raises only after running siblings finish."""
+        from provisioner import run_stage_graph
+        
+        finished = []
+        
+        async def ok():
+            await asyncio.sleep(0.1)
+            finished.append("ok")
+        
+        async def bad():
+            raise RuntimeError("boom")
+        
+        async def after():
+            finished.append("after")
+        
+        timings = {}
+        with pytest.raises(RuntimeError, match="boom"):
+            await run_stage_graph("op-1", {
+                "ok": ((), ok),
+                "bad": ((), bad),
+                "after": (("ok", "bad"), after),
+            }, timings)
+        
+        assert finished == ["ok"]
+        assert "bad" in timings
+        assert "after" not in timings
+
+
+class TestDeletePipeline:
+    """Test background VM teardown (host calls recorded, DB real)."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, monkeypatch, sample_vm_record):
+        """Fresh database with one VM marked 'deleting'; host calls recorded."""
+        from config import DB_PATH
+        from pathlib import Path
+
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+
+        from SQL.database import init_db
+        init_db()
+
+        import provisioner
+        from SQL.VM_related import add_vm_records
+
+        self.calls = []
+        self.vms = [
+            {**sample_vm_record, "status": "deleting"},
+            {**sample_vm_record, "id": "vm-2", "host_port": 2223, "ip": "192.168.122.101", "status": "deleting"},
+        ]
+        add_vm_records(self.vms)
+        monkeypatch.setattr(provisioner, "update_operation", lambda *args: True)
+        monkeypatch.setattr(provisioner, "STATIC_DHCP", False)
+        for name in ("remove_port_forward", "remove_port_forwards", "destroy_domain",
+                     "delete_disk_image", "delete_cloud_config"):
+            monkeypatch.setattr(provisioner, name, lambda *args, name=name: self.calls.append((name, *args)))
+
+    @pytest.mark.asyncio
+    async def test_batch_removes_forwards_at_once(self):
+        """Test a batch drops its forwards in one update and every record after teardown."""
+        from provisioner import run_delete_batch
+        from SQL.VM_related import list_vms_by_status
+
+        await run_delete_batch([("op-1", self.vms[0]), ("op-2", self.vms[1])], 2)
+
+        forward_calls = [call for call in self.calls if "forward" in call[0]]
+        assert forward_calls == [
+            ("remove_port_forwards", [(2222, "192.168.122.100"), (2223, "192.168.122.101")])
+        ]
+        assert sum(call[0] == "delete_disk_image" for call in self.calls) == 2
+        assert list_vms_by_status("deleting") == []
+
+    @pytest.mark.asyncio
+    async def test_failed_teardown_marks_error(self, monkeypatch):
+        """Test a VM whose files can't be deleted keeps its record, in 'error'."""
+        import provisioner
+        from provisioner import run_delete_pipeline
+        from SQL.VM_related import get_vm_by_id
+
+        def fail(vm_id):
+            raise OSError("disk busy")
+
+        monkeypatch.setattr(provisioner, "delete_disk_image", fail)
+        await run_delete_pipeline("op-1", self.vms[0])
+
+        vm = get_vm_by_id(self.vms[0]["id"], self.vms[0]["owner_id"])
+        assert vm["status"] == "error"
+        assert vm["ip"] == "192.168.122.100"
+        assert ("remove_port_forward", 2222, "192.168.122.100") in self.calls
@@ -0,0 +1,125 @@
+"""
+Tests for qcow2 module.
+"""
+import json
+import shutil
+import struct
+import subprocess
+import pytest
+
+GIB = 1024 ** 3
+
+requires_qemu_img = pytest.mark.skipif(
+    shutil.which("qemu-img") is None, reason="qemu-img not installed"
+)
+
+
+class TestQcow2:
+    """Test native qcow2 image creation and parsing."""
+
+    @pytest.fixture
+    def base_image(self, temp_dir):
+        from qcow2 import create_image
+        
+        return create_image(temp_dir / "base.qcow2", virtual_size=10 * GIB)
+
+    def test_create_image_header(self, base_image):
+        """Test an empty image has the expected header and layout."""
+        from qcow2 import read_header, CLUSTER_SIZE
+        
+        header = read_header(base_image)
+        
+        assert header["version"] == 3
+        assert header["virtual_size"] == 10 * GIB
+        assert header["cluster_size"] == CLUSTER_SIZE
+        assert header["l1_size"] == 20
+        assert header["backing_file"] is None
+        assert header["dirty"] is False
+        assert base_image.stat().st_size == 4 * CLUSTER_SIZE
+
+    def test_create_overlay_references_backing(self, base_image, temp_dir):
+        """Test an overlay records its backing file and inherits the size."""
+        from qcow2 import create_overlay, read_header
+        
+        overlay = create_overlay(temp_dir / "vm.qcow2", base_image)
+        header = read_header(overlay)
+        
+        assert header["backing_file"] == str(base_image)
+        assert header["backing_format"] == "qcow2"
+        assert header["virtual_size"] == 10 * GIB
+
+    def test_create_overlay_refuses_existing_file(self, base_image, temp_dir):
+        """Test an existing disk is never overwritten."""
+        from qcow2 import create_overlay
+        
+        create_overlay(temp_dir / "vm.qcow2", base_image)
+        with pytest.raises(FileExistsError):
+            create_overlay(temp_dir / "vm.qcow2", base_image)
+
+    def test_invalid_backing_file(self, temp_dir):
+        """Test a backing file that isn't qcow2 raises Qcow2Error."""
+        from qcow2 import create_overlay, Qcow2Error
+        
+        raw = temp_dir / "empty.img"
+        raw.touch()
+        
+        with pytest.raises(Qcow2Error):
+            create_overlay(temp_dir / "vm.qcow2", raw)
+        assert not (temp_dir / "vm.qcow2").exists()
+
+    def test_image_info_counts_allocated_clusters(self, base_image):
+        """Test allocation is read from the L1/L2 tables."""
+        from qcow2 import image_info, CLUSTER_SIZE
+        
+        assert image_info(base_image)["allocated-clusters"] == 0
+        
+        # Hand-allocate an L2 table (cluster 4) mapping two data clusters
+        with open(base_image, "r+b") as f:
+            f.seek(3 * CLUSTER_SIZE)
+            f.write(struct.pack(">Q", (1 << 63) | 4 * CLUSTER_SIZE))
+            f.seek(4 * CLUSTER_SIZE)
+            f.write(struct.pack(">QQ", (1 << 63) | 5 * CLUSTER_SIZE, (1 << 63) | 6 * CLUSTER_SIZE))
+            f.truncate(7 * CLUSTER_SIZE)
+        
+        info = image_info(base_image)
+        assert info["allocated-clusters"] == 2
+        assert info["format"] == "qcow2"
+        assert info["virtual-size"] == 10 * GIB
+
+    @requires_qemu_img
+    def test_overlay_passes_qemu_img_check(self, temp_dir):
+        """Test images written natively are consistent according to qemu-img."""
+        from qcow2 import create_overlay, image_info
+        
+        base = temp_dir / "base.qcow2"
+        subprocess.run(["qemu-img", "create", "-f", "qcow2", str(base), "1G"], check=True)
+        overlay = create_overlay(temp_dir / "vm.qcow2", base)
+        
+        subprocess.run(["qemu-img", "check", str(overlay)], check=True, capture_output=True)
+        qemu_info = json.loads(subprocess.run(
+            ["qemu-img", "info", "--output=json", str(overlay)],
+            check=True, capture_output=True, text=True
+        ).stdout)
+        
+        info = image_info(overlay)
+        assert info["virtual-size"] == qemu_info["virtual-size"]
+        assert info["backing-filename"] == qemu_info["backing-filename"]
+        assert info["backing-filename-format"] == qemu_info["backing-filename-format"]
+        assert info["cluster-size"] == qemu_info["cluster-size"]
+
+    @requires_qemu_img
+    def test_parses_qemu_img_overlay(self, temp_dir):
+        """Test headers written by qemu-img are parsed the same way."""
+        from qcow2 import create_image, read_header
+        
+        base = create_image(temp_dir / "base.qcow2", virtual_size=GIB)
+        overlay = temp_dir / "vm.qcow2"
+        subprocess.run(
+            ["qemu-img", "create", "-f", "qcow2", "-F", "qcow2", "-b", str(base), str(overlay)],
+            check=True, capture_output=True
+        )
+        
+        header = read_header(overlay)
+        assert header["backing_file"] == str(base)
+        assert header["backing_format"] == "qcow2"
+        assert header["virtual_size"] == GIB
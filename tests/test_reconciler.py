@@ -0,0 +1,291 @@
+"""
+Tests for reconciler module.
+"""
+import pytest
+
+NOW = 1_000_000.0
+
+
+class TestReconcilePlan:
+    """Test working out repairs from an inventory (no host access)."""
+
+    def _inventory(self, **overrides):
+        inventory = {
+            "vms": [],
+            "known_ids": set(),
+            "domains": {},
+            "disk_files": [],
+            "iso_files": [],
+            "forwards": [],
+            "ip_allocations": [],
+            "metadata_ids": [],
+        }
+        inventory.update(overrides)
+        return inventory
+
+    def _vm(self, vm_id, status="running", host_port=2222, ip="192.168.122.10"):
+        return {"id": vm_id, "owner_id": "test-owner", "status": status, "host_port": host_port, "ip": ip}
+
+    def _domain(self, name, path):
+        return {"name": name, "active": True, "files": [path], "volumes": []}
+
+    def test_consistent_inventory_needs_nothing(self):
+        """Test a VM with its domain, files and forward produces no actions."""
+        from config import INSTANCE_DIR, CLOUD_INIT_DIR
+        from reconciler import plan
+
+        disk = str(INSTANCE_DIR / "vm-1.qcow2")
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1")],
+            known_ids={"vm-1"},
+            domains={"vm-1": self._domain("web", disk)},
+            disk_files=[(disk, 0.0)],
+            iso_files=[(str(CLOUD_INIT_DIR / "vm-1.iso"), 0.0)],
+            forwards=[(2222, "192.168.122.10")],
+            ip_allocations=[{"vm_id": "vm-1", "ip": "192.168.122.10"}],
+            metadata_ids=["vm-1"],
+        ), now=NOW)
+
+        assert report["total"] == 0
+
+    def test_orphan_domain(self):
+        """Test unknown domains are destroyed only when their disks are ours."""
+        from config import INSTANCE_DIR
+        from reconciler import plan
+
+        report = plan(self._inventory(domains={
+            "lost": self._domain("lost", str(INSTANCE_DIR / "lost.qcow2")),
+            "foreign": self._domain("foreign", "/srv/other/foreign.qcow2"),
+        }), now=NOW)
+
+        assert report["actions"]["destroy_domains"] == [{"uuid": "lost", "name": "lost"}]
+
+    def test_orphan_files_respect_grace(self):
+        """Test unowned disks and ISOs are deleted once older than the grace period."""
+        from config import INSTANCE_DIR, CLOUD_INIT_DIR, RECONCILE_GRACE_SECONDS
+        from reconciler import plan
+
+        old = NOW - RECONCILE_GRACE_SECONDS - 1
+        report = plan(self._inventory(
+            known_ids={"vm-1"},
+            disk_files=[
+                (str(INSTANCE_DIR / "vm-1.qcow2"), old),
+                (str(INSTANCE_DIR / "vm-1@snap-1.raw"), old),
+                (str(INSTANCE_DIR / "gone.qcow2"), old),
+                (str(INSTANCE_DIR / "new.qcow2"), NOW),
+            ],
+            iso_files=[(str(CLOUD_INIT_DIR / "gone.iso"), old)],
+        ), now=NOW)
+
+        assert report["actions"]["delete_disks"] == [str(INSTANCE_DIR / "gone.qcow2")]
+        assert report["actions"]["delete_isos"] == [str(CLOUD_INIT_DIR / "gone.iso")]
+
+    def test_forward_drift(self):
+        """Test orphaned and duplicate forwards go and missing ones come back."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1"), self._vm("vm-2", host_port=2223, ip="192.168.122.11")],
+            known_ids={"vm-1", "vm-2"},
+            domains={"vm-1": self._domain("a", "/x"), "vm-2": self._domain("b", "/y")},
+            forwards=[
+                (2222, "192.168.122.10"),
+                (2222, "192.168.122.10"),
+                (2230, "192.168.122.99"),
+            ],
+        ), now=NOW)
+
+        assert report["actions"]["remove_forwards"] == [
+            {"host_port": 2222, "vm_ip": "192.168.122.10"},
+            {"host_port": 2230, "vm_ip": "192.168.122.99"},
+        ]
+        assert report["actions"]["add_forwards"] == [{"host_port": 2223, "vm_ip": "192.168.122.11"}]
+
+    def test_forwards_outside_port_range_left_alone(self):
+        """Test forwards on host ports outside START_PORT..END_PORT are never touched."""
+        from config import END_PORT
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1", host_port=END_PORT + 1)],
+            known_ids={"vm-1"},
+            domains={"vm-1": self._domain("a", "/x")},
+            forwards=[(22022, "10.0.0.5")],
+        ), now=NOW)
+
+        assert report["total"] == 0
+
+    def test_in_flight_forwards_left_alone(self):
+        """Test forwards of VMs being provisioned are neither removed nor added."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1", status="provisioning")],
+            known_ids={"vm-1"},
+            forwards=[(2222, "192.168.122.10")],
+        ), now=NOW)
+
+        assert report["total"] == 0
+
+    def test_startup_fails_interrupted_provisioning(self):
+        """Test at startup 'provisioning' VMs are marked error and their forwards dropped."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1", status="provisioning")],
+            known_ids={"vm-1"},
+            forwards=[(2222, "192.168.122.10")],
+        ), startup=True, now=NOW)
+
+        assert report["actions"]["mark_error"] == [{"id": "vm-1", "reason": "provisioning interrupted"}]
+        assert report["actions"]["remove_forwards"] == [{"host_port": 2222, "vm_ip": "192.168.122.10"}]
+
+    def test_running_vm_without_domain(self):
+        """Test a running VM whose domain is gone is marked error; its forward is left for now."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1")],
+            known_ids={"vm-1"},
+            forwards=[(2222, "192.168.122.10")],
+        ), now=NOW)
+
+        assert report["actions"]["mark_error"] == [{"id": "vm-1", "reason": "domain missing"}]
+        assert report["actions"]["remove_forwards"] == []
+        assert report["actions"]["add_forwards"] == []
+
+    def test_error_vm_forward_removed(self):
+        """Test the forward of a VM already marked error is removed."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            vms=[self._vm("vm-1", status="error")],
+            known_ids={"vm-1"},
+            forwards=[(2222, "192.168.122.10")],
+        ), now=NOW)
+
+        assert report["actions"]["remove_forwards"] == [{"host_port": 2222, "vm_ip": "192.168.122.10"}]
+
+    def test_orphan_ips_and_metadata(self):
+        """Test IP reservations and metadata of unknown VMs are released."""
+        from reconciler import plan
+
+        report = plan(self._inventory(
+            known_ids={"vm-1"},
+            ip_allocations=[
+                {"vm_id": "vm-1", "ip": "192.168.122.10"},
+                {"vm_id": "gone", "ip": "192.168.122.11"},
+            ],
+            metadata_ids=["vm-1", "gone"],
+        ), now=NOW)
+
+        assert report["actions"]["release_ips"] == [{"vm_id": "gone", "ip": "192.168.122.11"}]
+        assert report["actions"]["delete_metadata"] == ["gone"]
+
+
+class TestMarkVmsError:
+    """Test the status change applied to drifted VMs."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+
+        from SQL.database import init_db
+        init_db()
+
+        yield
+
+    def test_only_expected_statuses_change(self):
+        """Test a VM whose status moved on since the plan is left alone."""
+        from SQL.VM_related import add_vm_record, mark_vms_error, get_vm_by_id
+
+        for vm_id, status, port in (("vm-1", "running", 2222), ("vm-2", "stopped", 2223)):
+            add_vm_record({
+                "id": vm_id,
+                "name": vm_id,
+                "owner_id": "test-owner",
+                "status": status,
+                "host_port": port,
+                "disk_path": f"/path/{vm_id}.qcow2",
+                "iso_path": f"/path/{vm_id}.iso",
+                "created_at": "2024-01-01T00:00:00"
+            })
+
+        assert mark_vms_error(["vm-1", "vm-2"], ("running",)) == 1
+        assert get_vm_by_id("vm-1", "test-owner")["status"] == "error"
+        assert get_vm_by_id("vm-2", "test-owner")["status"] == "stopped"
+
+    def test_interrupted_operations_fail(self):
+        """Test marking a VM error at startup fails its unfinished operation with the reason."""
+        from SQL.VM_related import add_vm_record, get_vm_by_id
+        from SQL.OPERATIONS_related import add_operation, get_operation
+        from reconciler import _mark_error
+
+        add_vm_record({
+            "id": "vm-1",
+            "name": "vm-1",
+            "owner_id": "test-owner",
+            "status": "provisioning",
+            "host_port": 2222,
+            "disk_path": "/path/vm-1.qcow2",
+            "iso_path": "/path/vm-1.iso",
+            "created_at": "2024-01-01T00:00:00"
+        })
+        add_operation({
+            "id": "op-1",
+            "vm_id": "vm-1",
+            "owner_id": "test-owner",
+            "kind": "create",
+            "status": "running",
+            "created_at": "2024-01-01T00:00:00",
+            "updated_at": "2024-01-01T00:00:00"
+        })
+
+        _mark_error([{"id": "vm-1", "reason": "provisioning interrupted"}], startup=True)
+
+        assert get_vm_by_id("vm-1", "test-owner")["status"] == "error"
+        op = get_operation("op-1", "test-owner")
+        assert op["status"] == "failed"
+        assert op["error"] == "provisioning interrupted"
+
+    def test_domain_created_since_scan_spared(self, monkeypatch):
+        """Test a VM whose domain appeared after the scan (pipeline finished meanwhile) stays running."""
+        import reconciler
+        from SQL.VM_related import add_vm_record, get_vm_by_id
+        from reconciler import plan, _mark_error
+
+        # The scan found no domain, then the pipeline defined it and
+        # flipped the VM to 'running' before the records were read
+        add_vm_record({
+            "id": "vm-1",
+            "name": "vm-1",
+            "owner_id": "test-owner",
+            "status": "running",
+            "host_port": 2222,
+            "disk_path": "/path/vm-1.qcow2",
+            "iso_path": "/path/vm-1.iso",
+            "created_at": "2024-01-01T00:00:00"
+        })
+        report = plan({
+            "vms": [{"id": "vm-1", "owner_id": "test-owner", "status": "running",
+                     "host_port": 2222, "ip": "192.168.122.10"}],
+            "known_ids": {"vm-1"},
+            "domains": {},
+            "disk_files": [],
+            "iso_files": [],
+            "forwards": [],
+            "ip_allocations": [],
+            "metadata_ids": [],
+        }, now=NOW)
+        assert report["actions"]["mark_error"] == [{"id": "vm-1", "reason": "domain missing"}]
+
+        monkeypatch.setattr(reconciler, "get_domain_states", lambda: {"vm-1": "running"})
+        _mark_error(report["actions"]["mark_error"], startup=False)
+
+        assert get_vm_by_id("vm-1", "test-owner")["status"] == "running"
@@ -0,0 +1,91 @@
+"""
+Tests for snapshots module.
+"""
+import pytest
+from pathlib import Path
+from unittest.mock import patch
+
+
+class TestSnapshots:
+    """Test external snapshot and revert bookkeeping."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self, sample_vm_record):
+        """Setup fresh database with one VM on a real qcow2 disk."""
+        from config import DB_PATH, INSTANCE_DIR
+        from qcow2 import create_image
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        from SQL.VM_related import add_vm_record
+        init_db()
+        
+        INSTANCE_DIR.mkdir(parents=True, exist_ok=True)
+        disk_path = INSTANCE_DIR / "test-vm-123.qcow2"
+        disk_path.unlink(missing_ok=True)
+        create_image(disk_path, virtual_size=1024 ** 3)
+        add_vm_record({**sample_vm_record, "disk_path": str(disk_path), "image_type": "debian-12"})
+        
+        yield
+        
+        for path in INSTANCE_DIR.glob("test-vm-123*.qcow2"):
+            path.unlink()
+
+    @staticmethod
+    def _fake_snapshot(vm_uuid, name, overlay_path, quiesce=True):
+        from qcow2 import create_image
+        create_image(overlay_path, virtual_size=1024 ** 3)
+        return quiesce
+
+    def test_create_snapshot_moves_disk(self):
+        """Test the VM continues on a new overlay and the old image is frozen."""
+        import snapshots
+        from SQL.VM_related import get_vm_by_id
+        
+        with patch.object(snapshots, "create_external_snapshot", side_effect=self._fake_snapshot) as create:
+            snapshot = snapshots.create_snapshot("test-vm-123", "test-user-123", "base")
+        
+        assert snapshot["disk_path"].endswith("test-vm-123.qcow2")
+        assert snapshot["quiesced"] is True
+        overlay_path = create.call_args.args[2]
+        assert overlay_path.name == f"test-vm-123@{snapshot['id']}.qcow2"
+        assert get_vm_by_id("test-vm-123", "test-user-123")["disk_path"] == str(overlay_path)
+
+    def test_create_snapshot_duplicate_name(self):
+        """Test a snapshot name can't be reused on the same VM."""
+        import snapshots
+        
+        with patch.object(snapshots, "create_external_snapshot", side_effect=self._fake_snapshot) as create:
+            snapshots.create_snapshot("test-vm-123", "test-user-123", "base")
+            with pytest.raises(ValueError, match="already exists"):
+                snapshots.create_snapshot("test-vm-123", "test-user-123", "base")
+        assert create.call_count == 1
+
+    def test_revert_snapshot(self):
+        """Test revert overlays the frozen image and drops the discarded overlay."""
+        import snapshots
+        from qcow2 import read_header
+        from SQL.VM_related import get_vm_by_id
+        
+        with patch.object(snapshots, "create_external_snapshot", side_effect=self._fake_snapshot):
+            snapshot = snapshots.create_snapshot("test-vm-123", "test-user-123", "base")
+        discarded = Path(get_vm_by_id("test-vm-123", "test-user-123")["disk_path"])
+        
+        with patch.object(snapshots, "switch_disk_source") as switch:
+            new_disk = snapshots.revert_snapshot("test-vm-123", "test-user-123", snapshot["id"])
+        
+        switch.assert_called_once_with("test-vm-123", new_disk)
+        assert read_header(new_disk)["backing_file"] == snapshot["disk_path"]
+        assert get_vm_by_id("test-vm-123", "test-user-123")["disk_path"] == str(new_disk)
+        assert not discarded.exists()
+        assert Path(snapshot["disk_path"]).exists()
+
+    def test_supports_snapshots(self):
+        """Test only qcow2-backed images support snapshots."""
+        import snapshots
+        
+        assert snapshots.supports_snapshots("debian-12") is True
+        assert snapshots.supports_snapshots(None) is False
@@ -0,0 +1,80 @@
+"""
+Tests for SNAPSHOTS_related module.
+"""
+import pytest
+
+
+def _snapshot(snapshot_id="snap-1", name="base", disk_path="/tmp/test-vm-123.qcow2"):
+    return {
+        "id": snapshot_id,
+        "vm_id": "test-vm-123",
+        "owner_id": "test-user-123",
+        "name": name,
+        "disk_path": disk_path,
+        "quiesced": True,
+        "created_at": "2024-01-01T00:00:00"
+    }
+
+
+class TestSnapshotsRelated:
+    """Test snapshot records."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self):
+        """Setup fresh database for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        yield
+
+    def test_add_and_list_snapshots(self):
+        """Test snapshots are listed oldest first with quiesced as a bool."""
+        from SQL.SNAPSHOTS_related import add_snapshot, get_snapshot, list_snapshots
+        
+        add_snapshot(_snapshot())
+        add_snapshot({**_snapshot("snap-2", "later"), "created_at": "2024-01-02T00:00:00"})
+        
+        assert [s["name"] for s in list_snapshots("test-vm-123")] == ["base", "later"]
+        assert get_snapshot("snap-1", "test-vm-123")["quiesced"] is True
+        assert get_snapshot("snap-1", "other-vm") is None
+
+    def test_duplicate_name(self):
+        """Test snapshot names are unique per VM."""
+        from SQL.SNAPSHOTS_related import add_snapshot
+        
+        add_snapshot(_snapshot())
+        with pytest.raises(ValueError, match="already exists"):
+            add_snapshot(_snapshot("snap-2"))
+
+    def test_is_snapshot_disk(self):
+        """Test frozen images are recognised."""
+        from SQL.SNAPSHOTS_related import add_snapshot, is_snapshot_disk
+        
+        add_snapshot(_snapshot())
+        assert is_snapshot_disk("/tmp/test-vm-123.qcow2") is True
+        assert is_snapshot_disk("/tmp/test-vm-123@other.qcow2") is False
+
+    def test_count_clones(self, sample_vm_record):
+        """Test clones are counted through their source snapshot."""
+        from SQL.VM_related import add_vm_record
+        from SQL.SNAPSHOTS_related import add_snapshot, count_clones, delete_snapshots
+        
+        add_vm_record(sample_vm_record)
+        add_snapshot(_snapshot())
+        assert count_clones("test-vm-123") == 0
+        
+        add_vm_record({
+            **sample_vm_record,
+            "id": "clone-vm",
+            "host_port": 2223,
+            "source_snapshot_id": "snap-1"
+        })
+        assert count_clones("test-vm-123") == 1
+        assert delete_snapshots("test-vm-123") == 1
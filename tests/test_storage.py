@@ -1,6 +1,7 @@
 """
 Tests for storage module.
 """
+import os
 import pytest
 from pathlib import Path
 from unittest.mock import patch, MagicMock
@@ -97,3 +98,215 @@ class TestStorage:
             assert '20G' in call_args
         finally:
             storage.subprocess.run = original_run
+
+    def test_clone_base_image_native(self):
+        """Test a qcow2 template is cloned without running qemu-img."""
+        from qcow2 import create_image, read_header
+        
+        template_path = Path('/tmp/vm-provisioner-test/images/alpine-template.qcow2')
+        template_path.parent.mkdir(parents=True, exist_ok=True)
+        template_path.unlink(missing_ok=True)
+        create_image(template_path, virtual_size=2 * 1024 ** 3)
+        
+        import storage
+        importlib.reload(storage)
+        storage.delete_disk_image("test-vm-native")
+        mock_run = MagicMock()
+        original_run = storage.subprocess.run
+        storage.subprocess.run = mock_run
+        
+        try:
+            disk_path = storage.clone_base_image("test-vm-native", "alpine")
+            info = storage.get_disk_info("test-vm-native")
+        finally:
+            storage.subprocess.run = original_run
+            template_path.unlink()
+        
+        mock_run.assert_not_called()
+        assert read_header(disk_path)["backing_file"] == str(template_path)
+        assert info["virtual-size"] == 2 * 1024 ** 3
+        assert info["backing-filename-format"] == "qcow2"
+        storage.delete_disk_image("test-vm-native")
+
+
+class TestOverlayPool:
+    """Test the pre-created overlay pool."""
+
+    @pytest.fixture
+    def template(self):
+        from qcow2 import create_image
+        
+        template_path = Path('/tmp/vm-provisioner-test/images/alpine-template.qcow2')
+        template_path.parent.mkdir(parents=True, exist_ok=True)
+        template_path.unlink(missing_ok=True)
+        create_image(template_path, virtual_size=1024 ** 3)
+        yield template_path
+        template_path.unlink(missing_ok=True)
+
+    def test_claim_renames_ready_overlay(self, template, tmp_path):
+        """Test a claim moves a pooled overlay to the VM's disk path."""
+        from qcow2 import read_header
+        from storage import OverlayPool
+        
+        pool = OverlayPool(tmp_path / "pool", size=2)
+        pool.refill("alpine")
+        assert pool.stats()["alpine"]["ready"] == 2
+        
+        dest = tmp_path / "vm.qcow2"
+        assert pool.claim("alpine", dest) is True
+        assert read_header(dest)["backing_file"] == str(template)
+        
+        stats = pool.stats()["alpine"]
+        assert stats["ready"] == 1
+        assert stats["hits"] == 1
+        assert stats["hit_ratio"] == 1.0
+
+    def test_claim_empty_pool_misses(self, template, tmp_path):
+        """Test a claim with nothing ready leaves the caller to create the disk."""
+        from storage import OverlayPool
+        
+        pool = OverlayPool(tmp_path / "pool", size=2)
+        dest = tmp_path / "vm.qcow2"
+        assert pool.claim("alpine", dest) is False
+        assert not dest.exists()
+        assert pool.stats()["alpine"]["misses"] == 1
+
+    def test_template_change_invalidates(self, template, tmp_path):
+        """Test overlays of a replaced template are never handed out."""
+        from qcow2 import create_image
+        from storage import OverlayPool
+        
+        pool = OverlayPool(tmp_path / "pool", size=2)
+        pool.refill("alpine")
+        
+        old_mtime = template.stat().st_mtime_ns
+        template.unlink()
+        create_image(template, virtual_size=2 * 1024 ** 3)
+        os.utime(template, ns=(old_mtime + 10 ** 9, old_mtime + 10 ** 9))
+        assert pool.claim("alpine", tmp_path / "vm.qcow2") is False
+        
+        pool.refill("alpine")
+        stats = pool.stats()["alpine"]
+        assert stats["invalidated"] == 2
+        assert stats["ready"] == 2
+        assert len(list((tmp_path / "pool" / "alpine").iterdir())) == 1
+
+    def test_disabled_pool(self, template, tmp_path):
+        """Test a pool of size 0 never claims."""
+        from storage import OverlayPool
+        
+        pool = OverlayPool(tmp_path / "pool", size=0)
+        pool.refill("alpine")
+        assert pool.claim("alpine", tmp_path / "vm.qcow2") is False
+
+
+class TestStorageBackends:
+    """Test the reflink raw and libvirt pool storage backends."""
+
+    @pytest.fixture
+    def raw_template(self):
+        from qcow2 import create_image
+        
+        template_path = Path('/tmp/vm-provisioner-test/images/rocky-9-template.qcow2')
+        template_path.parent.mkdir(parents=True, exist_ok=True)
+        template_path.unlink(missing_ok=True)
+        create_image(template_path, virtual_size=1024 ** 3)
+        
+        raw_path = template_path.with_suffix(".raw")
+        with open(raw_path, "wb") as f:
+            f.write(b"boot")
+            f.seek(8 * 1024 ** 2)
+            f.write(b"data")
+            f.truncate(64 * 1024 ** 2)
+        mtime = template_path.stat().st_mtime_ns + 10 ** 9
+        os.utime(raw_path, ns=(mtime, mtime))
+        yield raw_path
+        template_path.unlink(missing_ok=True)
+        raw_path.unlink(missing_ok=True)
+
+    def test_incomplete_backend_rejected(self):
+        """Test a backend missing part of the interface fails when created, not when called."""
+        from storage import StorageBackend
+        
+        class Partial(StorageBackend):
+            def disk_path(self, vm_id):
+                return Path(vm_id)
+        
+        with pytest.raises(TypeError):
+            Partial()
+
+    def test_reflink_copy_keeps_contents_and_holes(self, raw_template, tmp_path):
+        """Test reflink_copy produces an identical file whichever way it copies."""
+        from storage import reflink_copy
+        
+        dest = tmp_path / "copy.raw"
+        reflink_copy(raw_template, dest)
+        
+        assert dest.read_bytes() == raw_template.read_bytes()
+        assert dest.stat().st_blocks * 512 < dest.stat().st_size
+
+    def test_reflink_backend_lifecycle(self, raw_template):
+        """Test raw clone, info, resize, snapshot and delete."""
+        from storage import ReflinkRawBackend
+        
+        backend = ReflinkRawBackend()
+        backend.delete("test-vm-raw")
+        disk_path = backend.clone("test-vm-raw", "rocky-9")
+        assert disk_path.name == "test-vm-raw.raw"
+        assert disk_path.read_bytes()[:4] == b"boot"
+        
+        info = backend.info("test-vm-raw")
+        assert info["format"] == "raw"
+        assert info["virtual-size"] == 64 * 1024 ** 2
+        
+        backend.resize("test-vm-raw", 1)
+        assert backend.info("test-vm-raw")["virtual-size"] == 1024 ** 3
+        with pytest.raises(ValueError, match="shrink"):
+            backend.resize("test-vm-raw", 0)
+        
+        backend.snapshot("test-vm-raw", "before")
+        snapshot_path = disk_path.with_name("test-vm-raw@before.raw")
+        assert snapshot_path.exists()
+        
+        backend.delete("test-vm-raw")
+        assert not disk_path.exists()
+        assert not snapshot_path.exists()
+
+    def test_libvirt_pool_backend_clone(self):
+        """Test pool clones try a reflink first and fall back to a copy."""
+        import libvirt
+        import storage
+        
+        conn = MagicMock()
+        pool = conn.storagePoolLookupByName.return_value
+        template = pool.storageVolLookupByName.return_value
+        template.info.return_value = [0, 10 * 1024 ** 3, 2 * 1024 ** 3]
+        pool.createXMLFrom.side_effect = [libvirt.libvirtError("no reflink"), MagicMock()]
+        connection = MagicMock()
+        connection.return_value.__enter__.return_value = conn
+        
+        backend = storage.LibvirtPoolBackend("vms")
+        with patch.object(storage.libvirt_client, "connection", connection):
+            disk_path = backend.clone("test-vm-pool", "debian-12")
+        
+        assert disk_path == Path("vms/test-vm-pool.raw")
+        pool.storageVolLookupByName.assert_called_once_with("debian-12-template.qcow2")
+        first, second = pool.createXMLFrom.call_args_list
+        assert "<name>test-vm-pool.raw</name>" in first.args[0]
+        assert f"<capacity unit='bytes'>{10 * 1024 ** 3}</capacity>" in first.args[0]
+        assert first.args[2] == libvirt.VIR_STORAGE_VOL_CREATE_REFLINK
+        assert second.args[2] == 0
+
+    def test_domain_xml_for_pool_volume(self):
+        """Test libvirt pool disks are attached as volumes."""
+        from storage import LibvirtPoolBackend
+        from libvirt_client import build_domain_xml
+        
+        backend = LibvirtPoolBackend("vms")
+        xml = build_domain_xml(
+            "test-vm-pool", "test", backend.disk_path("test-vm-pool"), None,
+            **backend.domain_disk("test-vm-pool")
+        )
+        assert "<disk type='volume' device='disk'>" in xml
+        assert "<source pool='vms' volume='test-vm-pool.raw'/>" in xml
+        assert "type='raw'" in xml
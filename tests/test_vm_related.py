@@ -40,6 +40,52 @@ class TestVMRelated:
         assert vm['id'] == sample_vm_record['id']
         assert vm['name'] == sample_vm_record['name']
 
+    def test_add_vm_record_with_specs(self, sample_vm_record):
+        """Test optional spec columns are stored when given."""
+        from SQL.VM_related import add_vm_record, get_vm_by_id
+        
+        record = {
+            **sample_vm_record,
+            "status": "provisioning",
+            "image_type": "alpine",
+            "memory_mb": 1024,
+            "vcpus": 2
+        }
+        del record["ip"]
+        add_vm_record(record)
+        
+        vm = get_vm_by_id(record['id'], record['owner_id'])
+        assert vm['status'] == "provisioning"
+        assert vm['ip'] is None
+        assert vm['image_type'] == "alpine"
+        assert vm['memory_mb'] == 1024
+        assert vm['vcpus'] == 2
+
+    def test_add_vm_records(self, sample_vm_record):
+        """Test inserting a batch of VM records."""
+        from SQL.VM_related import add_vm_records, list_vms_by_owner
+        
+        add_vm_records([
+            {**sample_vm_record, "id": f"vm-{i}", "host_port": 2222 + i}
+            for i in range(3)
+        ])
+        
+        vms = list_vms_by_owner(sample_vm_record['owner_id'])
+        assert len(vms) == 3
+
+    def test_add_vm_records_all_or_nothing(self, sample_vm_record):
+        """Test a conflicting record rolls back the whole batch."""
+        import sqlite3
+        from SQL.VM_related import add_vm_records, list_vms_by_owner
+        
+        with pytest.raises(sqlite3.IntegrityError):
+            add_vm_records([
+                {**sample_vm_record, "id": "vm-1"},
+                {**sample_vm_record, "id": "vm-2"},
+            ])
+        
+        assert list_vms_by_owner(sample_vm_record['owner_id']) == []
+
     def test_get_vm_by_id_not_found(self):
         """Test getting non-existent VM returns None."""
         from SQL.VM_related import get_vm_by_id
@@ -86,6 +132,105 @@ class TestVMRelated:
         assert vm['status'] == "stopped"
         assert vm['ip'] == "192.168.122.200"
 
+    def test_update_vm_disk_limits(self, sample_vm_record):
+        """Test updating a VM's disk I/O limits."""
+        from SQL.VM_related import add_vm_record, update_vm_disk_limits, get_vm_by_id
+        
+        add_vm_record(sample_vm_record)
+        assert get_vm_by_id(sample_vm_record['id'], sample_vm_record['owner_id'])['disk_iops'] is None
+        
+        assert update_vm_disk_limits(sample_vm_record['id'], sample_vm_record['owner_id'], 300, 1048576) is True
+        
+        vm = get_vm_by_id(sample_vm_record['id'], sample_vm_record['owner_id'])
+        assert vm['disk_iops'] == 300
+        assert vm['disk_bytes_per_sec'] == 1048576
+        assert update_vm_disk_limits(sample_vm_record['id'], "other-owner", 0, 0) is False
+
+    def test_list_port_forwards(self, sample_vm_record):
+        """Test only running VMs with an address have a forward."""
+        from SQL.VM_related import add_vm_record, list_port_forwards
+        
+        add_vm_record(sample_vm_record)
+        add_vm_record({**sample_vm_record, "id": "vm-2", "host_port": 2223, "status": "provisioning", "ip": None})
+        
+        assert list_port_forwards() == {2222: "192.168.122.100"}
+
+    def test_list_vms_page(self, sample_vm_record):
+        """Test pages cover every VM once, newest first, ties broken by id."""
+        from SQL.VM_related import add_vm_records, list_vms_page
+        
+        owner = sample_vm_record['owner_id']
+        # Batch-created VMs share a timestamp
+        add_vm_records([
+            {**sample_vm_record, "id": f"vm-{i}", "host_port": 2222 + i,
+             "created_at": f"2024-01-0{1 + i // 3}T00:00:00"}
+            for i in range(7)
+        ])
+        add_vm_records([{**sample_vm_record, "id": "other", "owner_id": "other-owner", "host_port": 2300}])
+        
+        seen, cursor, pages = [], None, 0
+        while True:
+            vms, cursor = list_vms_page(owner, 3, cursor)
+            seen += [vm["id"] for vm in vms]
+            pages += 1
+            if cursor is None:
+                break
+        
+        assert pages == 3
+        assert seen == ["vm-6", "vm-5", "vm-4", "vm-3", "vm-2", "vm-1", "vm-0"]
+
+    def test_list_vms_page_exact_fit(self, sample_vm_record):
+        """Test a full last page has no next cursor and a bad cursor is rejected."""
+        from SQL.VM_related import add_vm_records, list_vms_page
+        
+        add_vm_records([
+            {**sample_vm_record, "id": f"vm-{i}", "host_port": 2222 + i} for i in range(2)
+        ])
+        
+        vms, cursor = list_vms_page(sample_vm_record['owner_id'], 2)
+        assert len(vms) == 2 and cursor is None
+        with pytest.raises(ValueError, match="Invalid cursor"):
+            list_vms_page(sample_vm_record['owner_id'], 2, "not-a-cursor")
+
+    def test_mark_vms_deleting(self, sample_vm_record):
+        """Test matching VMs are claimed for teardown and the rest reported."""
+        from SQL.VM_related import add_vm_records, mark_vms_deleting, get_vm_by_id
+        from SQL.SNAPSHOTS_related import add_snapshot
+        
+        owner = sample_vm_record['owner_id']
+        add_vm_records([
+            {**sample_vm_record, "id": "ci-1", "name": "ci-1", "host_port": 2222},
+            {**sample_vm_record, "id": "ci-2", "name": "ci-2", "host_port": 2223, "status": "provisioning"},
+            {**sample_vm_record, "id": "ci-3", "name": "ci-3", "host_port": 2224},
+            {**sample_vm_record, "id": "web", "name": "web", "host_port": 2225},
+            {**sample_vm_record, "id": "ci_x", "name": "ci_x", "host_port": 2226},
+        ])
+        add_snapshot({
+            "id": "snap-1", "vm_id": "ci-3", "owner_id": owner, "name": "base",
+            "disk_path": "/path/ci-3@snap-1.qcow2", "quiesced": True,
+            "created_at": "2024-01-01T00:00:00"
+        })
+        add_vm_records([{
+            **sample_vm_record, "id": "clone", "name": "clone", "host_port": 2227,
+            "source_snapshot_id": "snap-1"
+        }])
+        
+        claimed, skipped = mark_vms_deleting(owner, name_prefix="ci-")
+        
+        assert [vm["id"] for vm in claimed] == ["ci-1"]
+        assert claimed[0]["status"] == "running"
+        assert {vm["id"]: vm["reason"] for vm in skipped} == {
+            "ci-2": "still being provisioned",
+            "ci-3": "has linked clones; delete them first",
+        }
+        assert get_vm_by_id("ci-1", owner)["status"] == "deleting"
+        
+        claimed, skipped = mark_vms_deleting(owner, vm_ids=["ci-1", "web"])
+        assert [vm["id"] for vm in claimed] == ["web"]
+        assert skipped == [{"id": "ci-1", "name": "ci-1", "reason": "already being deleted"}]
+        
+        assert mark_vms_deleting("other-owner", vm_ids=["clone"]) == ([], [])
+
     def test_delete_vm_record(self, sample_vm_record):
         """Test deleting VM record."""
         from SQL.VM_related import add_vm_record, delete_vm_record, get_vm_by_id
@@ -0,0 +1,106 @@
+"""
+Tests for warm_pool module.
+"""
+import pytest
+
+
+class TestWarmPool:
+    """Test claiming from the warm pool."""
+
+    @pytest.fixture(autouse=True)
+    def setup_db(self, monkeypatch):
+        """Setup fresh database and an alpine pool for each test."""
+        from config import DB_PATH
+        from pathlib import Path
+        
+        db_path = Path(DB_PATH)
+        if db_path.exists():
+            db_path.unlink()
+        
+        from SQL.database import init_db
+        init_db()
+        
+        import warm_pool
+        monkeypatch.setattr(warm_pool, "WARM_POOL_SIZES", {"alpine": 1})
+        monkeypatch.setattr(warm_pool, "_hits", warm_pool.Counter())
+        monkeypatch.setattr(warm_pool, "_misses", warm_pool.Counter())
+        # Refills boot real VMs; just record that one was requested
+        self.refills = []
+        monkeypatch.setattr(warm_pool, "schedule_refill", self.refills.append)
+        
+        yield
+
+    def _store(self, pool_vm):
+        return pool_vm["vm_id"] if pool_vm else None
+
+    def _ready_vm(self, vm_id="pool-vm-1"):
+        from SQL.POOL_related import add_pool_vm, mark_pool_vm_ready
+        add_pool_vm(vm_id, "alpine")
+        mark_pool_vm_ready(vm_id, "192.168.122.50")
+
+    @pytest.mark.asyncio
+    async def test_claim_hit(self):
+        """Test a matching request takes the ready VM and triggers a refill."""
+        import warm_pool
+        
+        self._ready_vm()
+        
+        vm, _ = await warm_pool.claim("alpine", warm_pool.POOL_MEMORY_MB, warm_pool.POOL_VCPUS, self._store)
+        
+        assert vm['vm_id'] == "pool-vm-1"
+        assert self.refills == ["alpine"]
+        assert warm_pool.stats()["alpine"]["hits"] == 1
+        assert warm_pool.stats()["alpine"]["ready"] == 0
+
+    @pytest.mark.asyncio
+    async def test_claim_miss_when_empty(self):
+        """Test an empty pool counts a miss."""
+        import warm_pool
+        
+        vm, _ = await warm_pool.claim("alpine", warm_pool.POOL_MEMORY_MB, warm_pool.POOL_VCPUS, self._store)
+        
+        assert vm is None
+        assert warm_pool.stats()["alpine"]["misses"] == 1
+
+    @pytest.mark.asyncio
+    async def test_claim_miss_when_spec_differs(self):
+        """Test VMs with a non-default spec never use the pool."""
+        import warm_pool
+        
+        self._ready_vm()
+        
+        vm, _ = await warm_pool.claim("alpine", warm_pool.POOL_MEMORY_MB * 2, warm_pool.POOL_VCPUS, self._store)
+        
+        assert vm is None
+        assert warm_pool.stats()["alpine"] == {
+            "image": "Alpine Linux",
+            "target": 1,
+            "ready": 1,
+            "booting": 0,
+            "hits": 0,
+            "misses": 1
+        }
+
+    @pytest.mark.asyncio
+    async def test_claim_image_without_pool(self):
+        """Test images without a pool are not counted."""
+        import warm_pool
+        
+        assert (await warm_pool.claim("debian-12", warm_pool.POOL_MEMORY_MB, warm_pool.POOL_VCPUS, self._store))[0] is None
+        assert "debian-12" not in warm_pool.stats()
+
+    @pytest.mark.asyncio
+    async def test_claim_rolled_back_when_store_fails(self):
+        """Test a VM stays in the pool when its record can't be stored."""
+        import warm_pool
+        
+        self._ready_vm()
+        
+        def store(pool_vm):
+            raise RuntimeError("disk full")
+        
+        with pytest.raises(RuntimeError):
+            await warm_pool.claim("alpine", warm_pool.POOL_MEMORY_MB, warm_pool.POOL_VCPUS, store)
+        
+        assert warm_pool.stats()["alpine"]["ready"] == 1
+        assert self.refills == []
@@ -0,0 +1,229 @@
+import uuid
+import asyncio
+import logging
+from collections import Counter
+
+from config import (
+    IMAGES,
+    WARM_POOL_SIZES,
+    WARM_POOL_AGENT_TIMEOUT,
+    STATIC_DHCP,
+    DEFAULT_MEMORY_MB,
+    DEFAULT_VCPUS
+)
+from SQL.database import transaction
+from SQL.POOL_related import (
+    add_pool_vm,
+    mark_pool_vm_ready,
+    claim_pool_vm,
+    remove_pool_vm,
+    list_pool_vms,
+    count_pool_vms,
+    PoolVMRecord
+)
+from libvirt_client import create_domain, build_domain_xml, wait_for_guest_agent
+from storage import get_disk_path, clone_base_image, domain_disk_args
+from cloudinit import get_iso_path, get_metadata_url, prepare_cloud_config
+from ipam import reserve_vm_ip
+import provisioner
+import db
+from provisioner import (
+    CONFIG_STAGE,
+    run_blocking,
+    run_stage_graph,
+    wait_for_vm_ip,
+    cleanup_vm_resources
+)
+
+logger = logging.getLogger(__name__)
+
+# Pool VMs boot with the default spec; only matching requests can use them
+POOL_MEMORY_MB = DEFAULT_MEMORY_MB
+POOL_VCPUS = DEFAULT_VCPUS
+
+_hits: Counter = Counter()
+_misses: Counter = Counter()
+_refilling: set[str] = set()
+
+
+def pool_domain_name(image_type: str, vm_id: str) -> str:
+    """Libvirt domain name of a pool VM (domain names must be unique)."""
+    return f"pool-{image_type}-{vm_id[:8]}"
+
+
+async def claim(image_type: str, memory_mb: int, vcpus: int, store):
+    """
+    Take a ready VM out of the pool for a create request, if one fits.
+
+    `store(pool_vm)` (blocking; given the claimed entry or None) runs on
+    the DB executor in the same transaction as the claim, so a claimed VM
+    is never out of the pool without the record that owns it: if storing
+    fails, the claim is rolled back too.
+
+    Counts a hit or a miss for images that have a pool and schedules a
+    refill after every hit.
+
+    Returns:
+        (claimed pool VM or None, what `store` returned)
+    """
+    pooled = bool(WARM_POOL_SIZES.get(image_type))
+    fits = pooled and memory_mb == POOL_MEMORY_MB and vcpus == POOL_VCPUS
+
+    def claim_and_store():
+        with transaction():
+            pool_vm = claim_pool_vm(image_type) if fits else None
+            return pool_vm, store(pool_vm)
+
+    pool_vm, stored = await db.run(claim_and_store)
+    if not pooled:
+        return None, stored
+
+    if pool_vm is None:
+        _misses[image_type] += 1
+        return None, stored
+
+    _hits[image_type] += 1
+    logger.info(f"Claimed warm pool VM {pool_vm['vm_id']} ({image_type})")
+    schedule_refill(image_type)
+    return pool_vm, stored
+
+
+async def fill_one(image_type: str) -> bool:
+    """
+    Boot one pool VM and mark it ready once it has an IP and a guest agent.
+
+    Returns:
+        False if the VM failed (it is cleaned up and dropped from the pool)
+    """
+    vm_id = str(uuid.uuid4())
+    name = pool_domain_name(image_type, vm_id)
+    await run_blocking(add_pool_vm, vm_id, image_type)
+
+    state: dict[str, str | None] = {
+        "iso_path": None,
+        "disk_path": None,
+        "libvirt_uuid": None,
+        "vm_ip": None,
+    }
+
+    async def build_iso():
+        # No SSH key yet: it is injected through the guest agent on claim
+        iso_path = await run_blocking(prepare_cloud_config, vm_id, name, image_type, "")
+        state["iso_path"] = str(iso_path) if iso_path else None
+
+    async def clone_disk():
+        state["disk_path"] = str(await run_blocking(clone_base_image, vm_id, image_type))
+
+    async def start_domain():
+        xml = build_domain_xml(
+            vm_id=vm_id,
+            name=name,
+            disk_path=state["disk_path"],
+            iso_path=state["iso_path"],
+            memory_mb=POOL_MEMORY_MB,
+            vcpus=POOL_VCPUS,
+            metadata_url=get_metadata_url(vm_id),
+            **domain_disk_args(vm_id, image_type)
+        )
+        state["libvirt_uuid"] = await run_blocking(create_domain, xml)
+
+    async def reserve_ip():
+        state["vm_ip"] = await run_blocking(reserve_vm_ip, vm_id)
+
+    async def wait_for_ip():
+        state["vm_ip"] = await wait_for_vm_ip(vm_id)
+
+    async def wait_for_agent():
+        await run_blocking(wait_for_guest_agent, vm_id, WARM_POOL_AGENT_TIMEOUT)
+
+    stages = {
+        CONFIG_STAGE: ((), build_iso),
+        "cloning_disk": ((), clone_disk),
+        "creating_domain": ((CONFIG_STAGE, "cloning_disk"), start_domain),
+        "waiting_for_agent": (("creating_domain",), wait_for_agent),
+    }
+    if STATIC_DHCP:
+        stages = {"reserving_ip": ((), reserve_ip), **stages}
+        stages["creating_domain"] = (("reserving_ip", CONFIG_STAGE, "cloning_disk"), start_domain)
+    else:
+        stages["waiting_for_ip"] = (("creating_domain",), wait_for_ip)
+
+    try:
+        timings: dict[str, dict] = {}
+        await run_stage_graph(None, stages, timings)
+        await run_blocking(mark_pool_vm_ready, vm_id, state["vm_ip"])
+        logger.info(f"Warm pool VM {vm_id} ({image_type}) ready in {timings['total']['duration']}s")
+        return True
+    except BaseException as e:
+        logger.error(f"Warm pool VM {vm_id} ({image_type}) failed: {e!r}")
+        await run_blocking(
+            cleanup_vm_resources,
+            vm_id, None, None, state["disk_path"], state["iso_path"], state["libvirt_uuid"]
+        )
+        await run_blocking(remove_pool_vm, vm_id)
+        if not isinstance(e, Exception):
+            raise
+        return False
+
+
+async def refill(image_type: str) -> None:
+    """Boot pool VMs until the image's pool (ready + booting) is at its target size."""
+    if image_type in _refilling:
+        return
+    _refilling.add(image_type)
+    try:
+        target = WARM_POOL_SIZES.get(image_type, 0)
+        while True:
+            counts = (await run_blocking(count_pool_vms)).get(image_type, {})
+            missing = target - sum(counts.values())
+            if missing <= 0:
+                break
+            results = await asyncio.gather(
+                *(fill_one(image_type) for _ in range(missing))
+            )
+            if not all(results):
+                # Failures are logged and cleaned up; retry on the next claim
+                break
+    finally:
+        _refilling.discard(image_type)
+
+
+def schedule_refill(image_type: str) -> None:
+    """Refill an image's pool in the background."""
+    if image_type not in _refilling:
+        provisioner.submit(refill(image_type))
+
+
+async def start() -> None:
+    """
+    Drop pool VMs that were still booting when the service stopped, then
+    bring every configured pool up to size in the background.
+    """
+    for pool_vm in await run_blocking(list_pool_vms, "booting"):
+        vm_id = pool_vm["vm_id"]
+        logger.info(f"Removing stale warm pool VM {vm_id}")
+        await run_blocking(
+            cleanup_vm_resources,
+            vm_id, None, None, str(get_disk_path(vm_id, pool_vm["image_type"])), str(get_iso_path(vm_id)), vm_id
+        )
+        await run_blocking(remove_pool_vm, vm_id)
+
+    for image_type, size in WARM_POOL_SIZES.items():
+        if size > 0:
+            schedule_refill(image_type)
+
+
+def stats() -> dict:
+    """Per-image pool depth and hit/miss counters."""
+    counts = count_pool_vms()
+    return {
+        image_type: {
+            "image": IMAGES[image_type]["name"],
+            "target": size,
+            "ready": counts.get(image_type, {}).get("ready", 0),
+            "booting": counts.get(image_type, {}).get("booting", 0),
+            "hits": _hits[image_type],
+            "misses": _misses[image_type],
+        }
+        for image_type, size in WARM_POOL_SIZES.items()
+    }